@@ -5,13 +5,17 @@ from typing import Annotated
 from uuid import UUID
 
 from PIL import Image, UnidentifiedImageError
-from fastapi import APIRouter, Depends, HTTPException, params, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, params, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
+from pydantic import TypeAdapter, ValidationError
 
-from app.Models.api_models.admin_api_model import ImageOptUpdateModel, DuplicateValidationModel
+from app.Models.api_models.admin_api_model import ImageOptUpdateModel, DuplicateValidationModel, \
+    BatchUploadItemModel
 from app.Models.api_models.admin_query_params import UploadImageModel
 from app.Models.api_response.admin_api_response import ServerInfoResponse, ImageUploadResponse, \
-    DuplicateValidationResponse
+    DuplicateValidationResponse, InferenceQueueInfo, UploadWorkerInfo, BatchUploadResponse, BatchUploadItemResult, \
+    BatchUploadItemStatus
 from app.Models.api_response.base import NekoProtocol
 from app.Models.errors import PointDuplicateError
 from app.Models.mapped_image import MappedImage
@@ -27,6 +31,19 @@ admin_router = APIRouter(dependencies=[Depends(force_admin_token_verify)], tags=
 services: ServiceProvider | None = None
 
 
+async def _find_local_image_file(point: MappedImage) -> PurePath | None:
+    storage = services.storage_service.active_storage
+    # The file name can be resolved from the format in payload directly
+    if point.format is not None:
+        image_file = PurePath(f"{point.id}.{point.format}")
+        if await storage.is_exist(image_file):
+            return image_file
+    # Fallback for the images without format in payload
+    image_files = [itm[0] async for itm in storage.list_files("", f"{point.id}.*")]
+    assert len(image_files) <= 1
+    return image_files[0] if image_files else None
+
+
 @admin_router.delete("/delete/{image_id}",
                      description="Delete image with the given id from database. "
                                  "If the image is a local image, it will be moved to `/static/_deleted` folder.")
@@ -41,14 +58,12 @@ async def delete_image(
 
     if config.storage.method.enabled:  # local image
         if point.local:
-            image_files = [itm[0] async for itm in
-                           services.storage_service.active_storage.list_files("", f"{point.id}.*")]
-            assert len(image_files) <= 1
-            if not image_files:
+            image_file = await _find_local_image_file(point)
+            if image_file is None:
                 logger.warning("Image {} is a local image but not found in static folder.", point.id)
             else:
-                await services.storage_service.active_storage.move(image_files[0], f"_deleted/{image_files[0].name}")
-                logger.success("Image {} removed.", image_files[0].name)
+                await services.storage_service.active_storage.move(image_file, f"_deleted/{image_file.name}")
+                logger.success("Image {} removed.", image_file.name)
         if point.thumbnail_url is not None and (point.local or point.local_thumbnail):
             thumbnail_file = PurePath(f"thumbnails/{point.id}.webp")
             if await services.storage_service.active_storage.is_exist(thumbnail_file):
@@ -99,19 +114,46 @@ IMAGE_MIMES = {
 }
 
 
+def _get_image_type(image_file: UploadFile) -> str | None:
+    if image_file.content_type and image_file.content_type.lower() in IMAGE_MIMES:
+        return IMAGE_MIMES[image_file.content_type.lower()]
+    if image_file.filename:
+        extension = PurePath(image_file.filename).suffix.lower()
+        if extension in VALID_IMAGE_EXTENSIONS:
+            return extension[1:]
+    return None
+
+
+def _verify_image(img_bytes: bytes) -> bool:
+    try:
+        image = Image.open(BytesIO(img_bytes))
+        image.verify()
+        image.close()
+    # Truncated files raise OSError, and broken PNG chunks raise SyntaxError
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+        return False
+    return True
+
+
+def _create_mapped_image(img_id: UUID, img_type: str, model: UploadImageModel) -> MappedImage:
+    return MappedImage(id=img_id,
+                       url=model.url,
+                       thumbnail_url=model.thumbnail_url,
+                       local=model.local,
+                       categories=model.categories,
+                       starred=model.starred,
+                       comments=model.comments,
+                       format=img_type,
+                       index_date=datetime.now())
+
+
 @admin_router.post("/upload",
                    description="Upload image to server. The image will be indexed and stored in the database. If "
                                "local is set to true, the image will be uploaded to local storage.")
 async def upload_image(image_file: Annotated[UploadFile, File(description="The image to be uploaded.")],
                        model: Annotated[UploadImageModel, Depends()]) -> ImageUploadResponse:
     # generate an ID for the image
-    img_type = None
-    if image_file.content_type.lower() in IMAGE_MIMES:
-        img_type = IMAGE_MIMES[image_file.content_type.lower()]
-    elif image_file.filename:
-        extension = PurePath(image_file.filename).suffix.lower()
-        if extension in VALID_IMAGE_EXTENSIONS:
-            img_type = extension[1:]
+    img_type = _get_image_type(image_file)
     if not img_type:
         logger.warning("Failed to infer image format of the uploaded image. Content Type: {}, Filename: {}",
                        image_file.content_type, image_file.filename)
@@ -123,24 +165,11 @@ async def upload_image(image_file: Annotated[UploadFile, File(description="The i
         raise HTTPException(409,
                             f"The uploaded point is already contained in the database! entity id: {ex.entity_id}") \
             from ex
-    try:
-        image = Image.open(BytesIO(img_bytes))
-        image.verify()
-        image.close()
-    except UnidentifiedImageError as ex:
+    if not _verify_image(img_bytes):
         logger.warning("Invalid image file from upload request. id: {}", img_id)
-        raise HTTPException(422, "Cannot open the image file.") from ex
-
-    mapped_image = MappedImage(id=img_id,
-                               url=model.url,
-                               thumbnail_url=model.thumbnail_url,
-                               local=model.local,
-                               categories=model.categories,
-                               starred=model.starred,
-                               comments=model.comments,
-                               format=img_type,
-                               index_date=datetime.now())
+        raise HTTPException(422, "Cannot open the image file.")
 
+    mapped_image = _create_mapped_image(img_id, img_type, model)
     await services.upload_service.queue_upload_image(mapped_image, img_bytes, model.skip_ocr, model.local_thumbnail)
     return ImageUploadResponse(message="OK. Image added to upload queue.", image_id=img_id)
 
@@ -149,7 +178,29 @@ async def upload_image(image_file: Annotated[UploadFile, File(description="The i
 async def server_info() -> ServerInfoResponse:
     return ServerInfoResponse(message="Successfully get server information!",
                               image_count=await services.db_context.get_counts(exact=True),
-                              index_queue_length=services.upload_service.get_queue_size())
+                              index_queue_length=services.upload_service.get_queue_size(),
+                              upload_workers=[
+                                  UploadWorkerInfo(worker_id=stats.worker_id,
+                                                   processed=stats.processed,
+                                                   failed=stats.failed,
+                                                   busy_seconds=stats.busy_seconds,
+                                                   throughput=stats.throughput)
+                                  for stats in services.upload_service.get_worker_stats()
+                              ],
+                              inference_queues={
+                                  name: InferenceQueueInfo(queue_depth=stats.queue_depth,
+                                                           processed_batches=stats.processed_batches,
+                                                           processed_items=stats.processed_items,
+                                                           average_batch_size=stats.average_batch_size,
+                                                           max_batch_size=stats.max_batch_size)
+                                  for name, stats in services.inference_service.get_stats().items()
+                              },
+                              inference_pending_requests=services.inference_service.pending_requests,
+                              inference_background_pending_requests=(
+                                  services.inference_service.background_pending_requests),
+                              inference_rejected_requests=services.inference_service.rejected_requests,
+                              text_cache_hits=services.inference_service.text_cache_hits,
+                              text_cache_misses=services.inference_service.text_cache_misses)
 
 
 @admin_router.post("/duplication_validate",
@@ -165,3 +216,46 @@ async def duplication_validate(model: DuplicateValidationModel) -> DuplicateVali
         exists=exists_matrix,
         entity_ids=[(str(t) if exists else None) for (t, exists) in zip(ids, exists_matrix)],
         message="Validation completed.")
+
+
+_batch_upload_metadata_adapter = TypeAdapter(list[BatchUploadItemModel])
+
+
+@admin_router.post("/upload_batch",
+                   description="Upload a batch of images to server. The images are checked for duplicates with a "
+                               "single query and added to the upload queue at once. Unlike `/upload`, duplicate or "
+                               "invalid images don't fail the whole request, but are reported in the result of each "
+                               "image.")
+async def upload_image_batch(
+        image_files: Annotated[list[UploadFile], File(description="The images to be uploaded.")],
+        metadata: Annotated[str, Form(description="A JSON array of the metadata of each image, in the same order as "
+                                                  "`image_files`. See `BatchUploadItemModel` for the fields.")]
+) -> BatchUploadResponse:
+    try:
+        models = [t.to_upload_model() for t in _batch_upload_metadata_adapter.validate_json(metadata)]
+    except ValidationError as ex:
+        raise HTTPException(422, f"Invalid metadata: {ex}") from ex
+    if len(models) != len(image_files):
+        raise HTTPException(422, f"The length of metadata ({len(models)}) doesn't match the number of images "
+                                 f"({len(image_files)}).")
+
+    img_types = [_get_image_type(t) for t in image_files]
+    img_bytes = [await t.read() if img_type else None for t, img_type in zip(image_files, img_types)]
+    valid = await run_in_threadpool(lambda: [t is not None and _verify_image(t) for t in img_bytes])
+    valid_indexes = [i for i, t in enumerate(valid) if t]
+    assigned_ids = await services.upload_service.assign_image_ids([img_bytes[i] for i in valid_indexes])
+
+    results = [BatchUploadItemResult(image_id=None, status=BatchUploadItemStatus.UNSUPPORTED_FORMAT
+                                     if img_types[i] is None else BatchUploadItemStatus.INVALID_IMAGE)
+               for i in range(len(image_files))]
+    queue_items = []
+    for i, (img_id, duplicate) in zip(valid_indexes, assigned_ids):
+        results[i] = BatchUploadItemResult(image_id=img_id, status=BatchUploadItemStatus.DUPLICATE
+                                           if duplicate else BatchUploadItemStatus.QUEUED)
+        if duplicate:
+            continue
+        mapped_image = _create_mapped_image(img_id, img_types[i], models[i])
+        queue_items.append((mapped_image, img_bytes[i], models[i].skip_ocr, models[i].local_thumbnail))
+
+    await services.upload_service.queue_upload_images(queue_items)
+    return BatchUploadResponse(message=f"OK. {len(queue_items)} images added to upload queue.", results=results)
@@ -4,7 +4,7 @@ from uuid import UUID
 from fastapi import APIRouter, Depends, Path, HTTPException, Query
 
 from app.Models.api_response.images_api_response import QueryByIdApiResponse, ImageStatus, QueryImagesApiResponse
-from app.Models.query_params import FilterParams
+from app.Models.query_params import FilterParams, ProjectionParams
 from app.Services.authentication import force_access_token_verify
 from app.Services.provider import ServiceProvider
 from app.Services.vector_db_context import PointNotFoundError
@@ -18,10 +18,13 @@ services: ServiceProvider | None = None  # The service provider will be injected
 
 @images_router.get("/id/{image_id}", description="Query the image info with the given image ID. \n"
                                                  "This can also be used to check the status"
-                                                 " of an image in the index queue.")
-async def query_image_by_id(image_id: Annotated[UUID, Path(description="The id of the image you want to query.")]):
+                                                 " of an image in the index queue.",
+                   response_model_exclude_unset=True)
+async def query_image_by_id(image_id: Annotated[UUID, Path(description="The id of the image you want to query.")],
+                            projection: Annotated[ProjectionParams, Depends()]) -> QueryByIdApiResponse:
     try:
-        return QueryByIdApiResponse(img=await services.db_context.retrieve_by_id(str(image_id)),
+        return QueryByIdApiResponse(img=await services.db_context.retrieve_by_id(str(image_id),
+                                                                                 fields=projection.fields),
                                     img_status=ImageStatus.MAPPED,
                                     message="Success query the image with the given ID.")
     except PointNotFoundError as ex:
@@ -32,12 +35,16 @@ async def query_image_by_id(image_id: Annotated[UUID, Path(description="The id o
         raise HTTPException(404, "Cannot find the image with the given ID.") from ex
 
 
-@images_router.get("/", description="Query images in order of ID.")
+@images_router.get("/", description="Query images in order of ID.",
+                   response_model_exclude_unset=True)
 async def scroll_images(filter_param: Annotated[FilterParams, Depends()],
+                        projection: Annotated[ProjectionParams, Depends()],
                         prev_offset_id: Annotated[UUID, Query(description="The previous offset image ID.")] = None,
-                        count: Annotated[int, Query(ge=1, le=100, description="The number of images to query.")] = 15):
+                        count: Annotated[int, Query(ge=1, le=100, description="The number of images to query.")] = 15
+                        ) -> QueryImagesApiResponse:
     # validate the offset ID
     if prev_offset_id is not None and len(await services.db_context.validate_ids([str(prev_offset_id)])) == 0:
         raise HTTPException(404, "The previous offset ID is invalid.")
-    images, offset = await services.db_context.scroll_points(str(prev_offset_id), count, filter_param=filter_param)
+    images, offset = await services.db_context.scroll_points(str(prev_offset_id), count, filter_param=filter_param,
+                                                             fields=projection.fields)
     return QueryImagesApiResponse(images=images, next_page_offset=offset, message="Success query images.")
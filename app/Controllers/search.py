@@ -1,9 +1,9 @@
-from io import BytesIO
+import asyncio
 from typing import Annotated
 from uuid import uuid4, UUID
 
-from PIL import Image
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.params import File, Query, Path, Depends
 from loguru import logger
 
@@ -11,10 +11,11 @@ from app.Models.api_models.search_api_model import AdvancedSearchModel, Combined
     HybridSearchModel
 from app.Models.api_response.search_api_response import SearchApiResponse
 from app.Models.db_queries import DbQuery, DbQueryBasis, DbQueryCriteriaVector, DbQueryCriteriaId
-from app.Models.query_params import SearchPagingParams, FilterParams
+from app.Models.query_params import SearchPagingParams, FilterParams, ProjectionParams
 from app.Services.authentication import force_access_token_verify
 from app.Services.provider import ServiceProvider
 from app.config import config
+from app.util.image_decode import decode_image, MIN_INFER_SIZE
 
 search_router = APIRouter(dependencies=([Depends(force_access_token_verify)] if config.access_protected else None),
                           tags=["Search"])
@@ -31,46 +32,63 @@ class SearchBasisParams:
         self.basis = basis
 
 
-async def query_and_postprocess(query: DbQuery, paging: SearchPagingParams,
-                                filter_param: FilterParams) -> SearchApiResponse:
-    results = await services.db_context.query_search(
-        query=query,
-        top_k=paging.count,
-        skip=paging.skip,
-        filter_param=filter_param,
-    )
+async def query_and_postprocess(query: DbQuery, paging: SearchPagingParams, filter_param: FilterParams,
+                                projection: ProjectionParams) -> SearchApiResponse:
+    query_id = uuid4()
+    if services.search_session_service.enabled:
+        results = await services.search_session_service.search(query_id, query, filter_param, paging.skip,
+                                                               paging.count, projection.fields)
+    else:
+        results = await services.db_context.query_search(
+            query=query,
+            top_k=paging.count,
+            skip=paging.skip,
+            filter_param=filter_param,
+            fields=projection.fields,
+        )
     return await result_postprocessing(
-        SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=uuid4()))
+        SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=query_id))
 
 async def result_postprocessing(resp: SearchApiResponse) -> SearchApiResponse:
     if not config.storage.method.enabled:
         return resp
+    # Collect all the files to presign, so that the whole page is presigned in one batch
+    remote_files = []
+    targets = []
     for item in resp.result:
-        if item.img.local:
+        # The URLs not requested by the projection are left out, so they stay excluded from the response
+        fields_set = item.img.model_fields_set
+        if item.img.local and 'url' in fields_set:
             img_extension = item.img.format or item.img.url.split('.')[-1]
-            img_remote_filename = f"{item.img.id}.{img_extension}"
-            item.img.url = await services.storage_service.active_storage.presign_url(img_remote_filename)
-        if item.img.thumbnail_url is not None and (item.img.local or item.img.local_thumbnail):
-            thumbnail_remote_filename = f"thumbnails/{item.img.id}.webp"
-            item.img.thumbnail_url = await services.storage_service.active_storage.presign_url(
-                thumbnail_remote_filename)
+            remote_files.append(f"{item.img.id}.{img_extension}")
+            targets.append((item.img, 'url'))
+        if item.img.thumbnail_url is not None and 'thumbnail_url' in fields_set and \
+                (item.img.local or item.img.local_thumbnail):
+            remote_files.append(f"thumbnails/{item.img.id}.webp")
+            targets.append((item.img, 'thumbnail_url'))
+    if remote_files:
+        urls = await services.storage_service.active_storage.presign_urls(remote_files)
+        for (img, field), url in zip(targets, urls):
+            setattr(img, field, url)
     return resp
 
 
-@search_router.get("/text/{prompt}", description="Search images by text prompt")
+@search_router.get("/text/{prompt}", description="Search images by text prompt",
+                   response_model_exclude_unset=True)
 async def textSearch(
         prompt: Annotated[
             str, Path(max_length=100, description="The image prompt text you want to search.")],
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
         paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[ProjectionParams, Depends(ProjectionParams)],
         exact: Annotated[bool, Query(
             description="If using OCR search, this option will require the ocr text contains **exactly** the "
                         "criteria you have given. This won't take any effect in vision search.")] = False
 ) -> SearchApiResponse:
     logger.info("Text search request received, prompt: {}", prompt)
-    text_vector = services.transformers_service.get_text_vector(prompt) if basis.basis == SearchBasisEnum.vision \
-        else services.transformers_service.get_bert_vector(prompt)
+    text_vector = await services.inference_service.get_text_vector(prompt) if basis.basis == SearchBasisEnum.vision \
+        else await services.inference_service.get_bert_vector(prompt)
     if basis.basis == SearchBasisEnum.ocr and exact:
         filter_param.ocr_text = prompt
     return await query_and_postprocess(
@@ -79,37 +97,42 @@ async def textSearch(
         }),
         paging=paging,
         filter_param=filter_param,
+        projection=projection,
     )
 
 
-@search_router.post("/image", description="Search images by image")
+@search_router.post("/image", description="Search images by image",
+                    response_model_exclude_unset=True)
 async def imageSearch(
         image: Annotated[bytes, File(max_length=10 * 1024 * 1024, media_type="image/*",
                                      description="The image you want to search.")],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[ProjectionParams, Depends(ProjectionParams)]
 ) -> SearchApiResponse:
-    fakefile = BytesIO(image)
-    img = Image.open(fakefile)
+    img, _ = await run_in_threadpool(decode_image, image, MIN_INFER_SIZE)
     logger.info("Image search request received")
-    image_vector = services.transformers_service.get_image_vector(img)
+    image_vector = await services.inference_service.get_image_vector(img)
     return await query_and_postprocess(
         query=DbQuery(criteria={
             SearchBasisEnum.vision: DbQueryBasis(positive=[DbQueryCriteriaVector(vector=image_vector)])
         }),
         paging=paging,
         filter_param=filter_param,
+        projection=projection,
     )
 
 
 @search_router.get("/similar/{image_id}",
                    description="Search images similar to the image with given id. "
-                               "Won't include the given image itself in the result.")
+                               "Won't include the given image itself in the result.",
+                   response_model_exclude_unset=True)
 async def similarWith(
         image_id: Annotated[UUID, Path(description="The id of the image you want to search.")],
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[ProjectionParams, Depends(ProjectionParams)]
 ) -> SearchApiResponse:
     logger.info("Similar search request received, id: {}", image_id)
     return await query_and_postprocess(
@@ -118,45 +141,51 @@ async def similarWith(
         }),
         paging=paging,
         filter_param=filter_param,
+        projection=projection,
     )
 
 
-@search_router.post("/advanced", description="Search with multiple criteria")
+@search_router.post("/advanced", description="Search with multiple criteria",
+                    response_model_exclude_unset=True)
 async def advancedSearch(
         model: AdvancedSearchModel,
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]) -> SearchApiResponse:
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[ProjectionParams, Depends(ProjectionParams)]) -> SearchApiResponse:
     logger.info("Advanced search request received: {}", model)
-    criteria = process_advanced_search_vectors(model, basis)
+    criteria = await process_advanced_search_vectors(model, basis)
     return await query_and_postprocess(
         query=DbQuery(criteria={
             basis.basis: criteria
         }),
         paging=paging,
         filter_param=filter_param,
+        projection=projection,
     )
 
 
 @search_router.post("/combined", description="Search with combined criteria. Deprecated, please use /hybrid instead.",
-                    deprecated=True)
+                    deprecated=True,
+                    response_model_exclude_unset=True)
 async def combinedSearch(
         model: CombinedSearchModel,
         basis: Annotated[SearchBasisParams, Depends(SearchBasisParams)],
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]) -> SearchApiResponse:
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[ProjectionParams, Depends(ProjectionParams)]) -> SearchApiResponse:
     if not config.ocr_search.enable:
         raise HTTPException(400, "You used combined search, but it needs OCR search which is not "
                                  "enabled.")
     logger.info("Combined search request received: {}", model)
-    criteria = process_advanced_search_vectors(model, basis)
+    criteria = await process_advanced_search_vectors(model, basis)
     match basis.basis:
         case SearchBasisEnum.ocr:
             second_basis = SearchBasisEnum.vision
-            second_vector = services.transformers_service.get_text_vector(model.extra_prompt)
+            second_vector = await services.inference_service.get_text_vector(model.extra_prompt)
         case SearchBasisEnum.vision:
             second_basis = SearchBasisEnum.ocr
-            second_vector = services.transformers_service.get_bert_vector(model.extra_prompt)
+            second_vector = await services.inference_service.get_bert_vector(model.extra_prompt)
         case _:
             raise HTTPException(400, "Combined search only supports OCR and Vision basis.")
 
@@ -167,68 +196,85 @@ async def combinedSearch(
         }),
         paging=paging,
         filter_param=filter_param,
+        projection=projection,
     )
 
 
 @search_router.post("/hybrid",
                     description="Search with hybrid criteria (vision and ocr). Will use RRF algorithm to combine the "
-                                "hybrid results from both search results.")
+                                "hybrid results from both search results.",
+                    response_model_exclude_unset=True)
 async def hybrid_search(
         model: HybridSearchModel,
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
-        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)]
-):
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[ProjectionParams, Depends(ProjectionParams)]
+) -> SearchApiResponse:
     logger.info("Hybrid search request received: {}", model)
     if not config.ocr_search.enable:
         raise HTTPException(400, "You used hybrid search, but it needs OCR search which is not "
                                  "enabled.")
 
+    vision_criteria, ocr_criteria = await asyncio.gather(
+        process_advanced_search_vectors(model.vision, SearchBasisParams(SearchBasisEnum.vision)),
+        process_advanced_search_vectors(model.ocr, SearchBasisParams(SearchBasisEnum.ocr)))
     return await query_and_postprocess(
         query=DbQuery(criteria={
-            SearchBasisEnum.vision: process_advanced_search_vectors(model.vision,
-                                                                    SearchBasisParams(SearchBasisEnum.vision)),
-            SearchBasisEnum.ocr: process_advanced_search_vectors(model.ocr, SearchBasisParams(SearchBasisEnum.ocr))
+            SearchBasisEnum.vision: vision_criteria,
+            SearchBasisEnum.ocr: ocr_criteria
         }),
         paging=paging,
         filter_param=filter_param,
+        projection=projection,
     )
 
-@search_router.get("/random", description="Get random images")
+@search_router.get("/random", description="Get random images",
+                   response_model_exclude_unset=True)
 async def randomPick(
         filter_param: Annotated[FilterParams, Depends(FilterParams)],
         paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[ProjectionParams, Depends(ProjectionParams)],
         seed: Annotated[int | None, Query(
             description="The seed for random pick. This is helpful for generating a reproducible random pick.")] = None,
 ) -> SearchApiResponse:
     logger.info("Random pick request received")
-    random_vector = services.transformers_service.get_random_vector(seed)
-    return await query_and_postprocess(
-        query=DbQuery(criteria={
-            SearchBasisEnum.vision: DbQueryBasis(positive=[DbQueryCriteriaVector(vector=random_vector)])
-        }),
-        paging=paging,
-        filter_param=filter_param,
-    )
+    results = await services.db_context.random_pick(paging.count, paging.skip, filter_param, seed, projection.fields)
+    return await result_postprocessing(
+        SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=uuid4()))
+
 
+@search_router.get("/recall/{query_id}",
+                   description="Get another page of the results of a previous search with its query id. "
+                               "The results are served from the search session, so they are consistent with the "
+                               "previous pages, and no inference is needed. Search sessions expire after a while.",
+                   response_model_exclude_unset=True)
+async def recallQuery(
+        query_id: Annotated[UUID, Path(description="The query id returned by the previous search.")],
+        paging: Annotated[SearchPagingParams, Depends(SearchPagingParams)],
+        projection: Annotated[ProjectionParams, Depends(ProjectionParams)]
+) -> SearchApiResponse:
+    logger.info("Recall request received, query id: {}", query_id)
+    if not services.search_session_service.enabled:
+        raise HTTPException(400, "Search session is not enabled.")
+    results = await services.search_session_service.recall(query_id, paging.skip, paging.count, projection.fields)
+    if results is None:
+        raise HTTPException(404, "The query is not found or has expired.")
+    return await result_postprocessing(
+        SearchApiResponse(result=results, message=f"Successfully get {len(results)} results.", query_id=query_id))
 
-# @search_router.get("/recall/{query_id}", description="Recall the query with given queryId")
-# async def recallQuery(query_id: str):
-#     raise NotImplementedError()
 
-def process_advanced_search_vectors(model: AdvancedSearchModel, basis: SearchBasisParams) -> DbQueryBasis:
+async def process_advanced_search_vectors(model: AdvancedSearchModel, basis: SearchBasisParams) -> DbQueryBasis:
     match basis.basis:
         case SearchBasisEnum.ocr:
-            positive_vectors = [DbQueryCriteriaVector(vector=services.transformers_service.get_bert_vector(t)) for t in
-                                model.criteria]
-            negative_vectors = [DbQueryCriteriaVector(vector=services.transformers_service.get_bert_vector(t)) for t in
-                                model.negative_criteria]
+            infer = services.inference_service.get_bert_vector
         case SearchBasisEnum.vision:
-            positive_vectors = [DbQueryCriteriaVector(vector=services.transformers_service.get_text_vector(t)) for t in
-                                model.criteria]
-            negative_vectors = [DbQueryCriteriaVector(vector=services.transformers_service.get_text_vector(t)) for t in
-                                model.negative_criteria]
+            infer = services.inference_service.get_text_vector
         case _:  # pragma: no cover
             raise NotImplementedError()
+    # All the criteria are submitted at once, so they can be inferred within the same batch
+    vectors = await asyncio.gather(*[infer(t) for t in model.criteria + model.negative_criteria])
+    positive_vectors = [DbQueryCriteriaVector(vector=t) for t in vectors[:len(model.criteria)]]
+    negative_vectors = [DbQueryCriteriaVector(vector=t) for t in vectors[len(model.criteria):]]
     return DbQueryBasis(
         positive=positive_vectors,
         negative=negative_vectors,
@@ -2,6 +2,8 @@ from typing import Optional, Annotated
 
 from pydantic import BaseModel, Field, StringConstraints
 
+from app.Models.api_models.admin_query_params import UploadImageThumbnailMode, UploadImageModel
+
 
 class ImageOptUpdateModel(BaseModel):
     starred: Optional[bool] = Field(None,
@@ -31,3 +33,33 @@ Sha1HashString = Annotated[
 
 class DuplicateValidationModel(BaseModel):
     hashes: list[Sha1HashString] = Field(description="The SHA1 hash of the image.", min_length=1)
+
+
+class BatchUploadItemModel(BaseModel):
+    url: Optional[str] = Field(None,
+                               description="The image's url. If the image is local, this field will be ignored. "
+                                           "Otherwise it is required.")
+    thumbnail_url: Optional[str] = Field(None,
+                                         description="The image's thumbnail url. If the image is local or "
+                                                     "local_thumbnail's value is always, this field will be ignored.")
+    categories: Optional[list[str]] = Field(None, description="The categories of the image.")
+    starred: bool = Field(False, description="If the image is starred.")
+    local: bool = Field(False,
+                        description="When set to true, the image will be uploaded to local storage. Otherwise, it will "
+                                    "only be indexed in the database.")
+    local_thumbnail: Optional[UploadImageThumbnailMode] = Field(
+        None,
+        description="Whether to generate thumbnail locally. Defaults to `if_necessary` if `local=True`, otherwise "
+                    "`never`.")
+    skip_ocr: bool = Field(False, description="Whether to skip the OCR process.")
+    comments: Optional[str] = Field(None, description="Any custom comments or text payload for the image.")
+
+    def to_upload_model(self) -> UploadImageModel:
+        """
+        Convert to the model of the single image upload, which validates the fields and fills in the defaults.
+        """
+        model = UploadImageModel(url=self.url, thumbnail_url=self.thumbnail_url, categories=None,
+                                 starred=self.starred, local=self.local, local_thumbnail=self.local_thumbnail,
+                                 skip_ocr=self.skip_ocr, comments=self.comments)
+        model.categories = self.categories
+        return model
@@ -1,13 +1,41 @@
+from enum import Enum
 from uuid import UUID
 
-from pydantic import Field
+from pydantic import BaseModel, Field
 
 from .base import NekoProtocol
 
 
+class InferenceQueueInfo(BaseModel):
+    queue_depth: int = Field(description="The number of requests waiting to be batched.")
+    processed_batches: int = Field(description="The number of batches processed since the server started.")
+    processed_items: int = Field(description="The number of requests processed since the server started.")
+    average_batch_size: float
+    max_batch_size: int
+
+
+class UploadWorkerInfo(BaseModel):
+    worker_id: int
+    processed: int = Field(description="The number of images indexed by the worker since the server started.")
+    failed: int = Field(description="The number of images failed to be indexed by the worker.")
+    busy_seconds: float = Field(description="The total time the worker spent on processing images.")
+    throughput: float = Field(description="The number of images indexed per busy second.")
+
+
 class ServerInfoResponse(NekoProtocol):
     image_count: int
     index_queue_length: int
+    upload_workers: list[UploadWorkerInfo] = Field([], description="Statistics of the upload workers.")
+    inference_queues: dict[str, InferenceQueueInfo] = Field(
+        {}, description="Statistics of the inference batching queues. Empty if inference batching is disabled.")
+    inference_pending_requests: int = Field(
+        0, description="The number of inference requests of searches being processed.")
+    inference_background_pending_requests: int = Field(
+        0, description="The number of inference requests of indexing being processed.")
+    inference_rejected_requests: int = Field(
+        0, description="The number of inference requests rejected due to overload since the server started.")
+    text_cache_hits: int = Field(0, description="The number of text embeddings served from the cache.")
+    text_cache_misses: int = Field(0, description="The number of text embeddings missing in the cache.")
 
 
 class DuplicateValidationResponse(NekoProtocol):
@@ -19,3 +47,19 @@ class DuplicateValidationResponse(NekoProtocol):
 
 class ImageUploadResponse(NekoProtocol):
     image_id: UUID
+
+
+class BatchUploadItemStatus(str, Enum):
+    QUEUED = "queued"
+    DUPLICATE = "duplicate"
+    UNSUPPORTED_FORMAT = "unsupported_format"
+    INVALID_IMAGE = "invalid_image"
+
+
+class BatchUploadItemResult(BaseModel):
+    image_id: UUID | None = Field(description="The image id. Null if the image is not a valid image file.")
+    status: BatchUploadItemStatus
+
+
+class BatchUploadResponse(NekoProtocol):
+    results: list[BatchUploadItemResult] = Field(description="The upload result of each image, in the request order.")
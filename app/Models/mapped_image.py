@@ -1,3 +1,4 @@
+import random
 from datetime import datetime
 from typing import Optional, Annotated
 from uuid import UUID
@@ -33,6 +34,9 @@ class MappedImage(BaseModel):
         description="Whether the thumbnail image is stored in local storage.")] = False
     format: Optional[str] = None  # required for s3 local storage
     comments: Annotated[Optional[str], Field(description="Any custom comments or text payload for the image.")] = None
+    # Uniformly distributed random key, used for random sampling with a range index.
+    # Generated for new images only; None for the images stored before it was introduced until they are backfilled.
+    random_key: Annotated[Optional[float], Field(default_factory=random.random, exclude=True)]
 
     @property
     def ocr_text_lower(self) -> str | None:
@@ -47,16 +51,30 @@ class MappedImage(BaseModel):
         result['index_date'] = self.index_date.isoformat()
         # Qdrant doesn't support case-insensitive search, so we need to store a lowercase version of the text
         result['ocr_text_lower'] = self.ocr_text_lower
+        if self.random_key is not None:
+            # Omitted if missing, so that updating a payload never clears the key stored in the database
+            result['random_key'] = self.random_key
         return result
 
     @classmethod
     def from_payload(cls, img_id: str, payload: dict,
-                     image_vector: Optional[ndarray] = None, text_contain_vector: Optional[ndarray] = None):
-        # Convert the datetime string back to datetime object
-        index_date = datetime.fromisoformat(payload['index_date'])
-        del payload['index_date']
-        return cls(id=UUID(img_id),
-                   index_date=index_date,
-                   **payload,
-                   image_vector=image_vector if image_vector is not None else None,
-                   text_contain_vector=text_contain_vector if text_contain_vector is not None else None)
+                     image_vector: Optional[ndarray] = None, text_contain_vector: Optional[ndarray] = None,
+                     fields: set[str] | None = None):
+        """
+        Construct from a payload stored in the database.
+        :param fields: The fields projected by the client. The other fields are marked as unset, so they can be
+         excluded from the response. All the fields if None.
+        """
+        # The ID and the datetime string are converted by the validator, which is much faster than doing it in Python
+        result = cls.model_validate({**payload,
+                                     'id': img_id,
+                                     # Never generate a new key for a stored image, which would be unstable
+                                     'random_key': payload.get('random_key'),
+                                     'image_vector': image_vector,
+                                     'text_contain_vector': text_contain_vector})
+        if fields is None:
+            # Fields missing in the payloads of older versions are still included in the response
+            result.model_fields_set.update(cls.model_fields)
+        else:
+            result.model_fields_set.intersection_update(fields | {'id'})
+        return result
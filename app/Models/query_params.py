@@ -1,7 +1,10 @@
 from typing import Annotated
 
+from fastapi import HTTPException
 from fastapi.params import Query
 
+from app.Models.mapped_image import MappedImage
+
 
 class SearchPagingParams:
     def __init__(
@@ -54,3 +57,18 @@ class FilterParams:
         if self.preferred_ratio is None:
             return None
         return self.preferred_ratio * (1 + self.ratio_tolerance)
+
+
+class ProjectionParams:
+    AVAILABLE_FIELDS = frozenset(k for k, v in MappedImage.model_fields.items() if not v.exclude)
+
+    def __init__(
+            self,
+            fields: Annotated[str | None, Query(
+                description="The fields of the image you want to get. The entries should be seperated by comma. "
+                            "The ID of the image is always included. All the fields are included if not specified.",
+                examples=["url, thumbnail_url, width, height"])] = None,
+    ):
+        self.fields = {t.strip() for t in fields.split(',') if t.strip()} if fields else None
+        if self.fields is not None and (unknown := self.fields - self.AVAILABLE_FIELDS):
+            raise HTTPException(400, f"Unknown fields: {', '.join(sorted(unknown))}.")
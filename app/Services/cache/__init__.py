@@ -0,0 +1,33 @@
+from app.Services.cache.base import CacheServiceBase
+from app.Services.cache.local import LocalCache
+from app.Services.lifespan_service import LifespanService
+from app.config import config, CacheMode
+
+
+class CacheService(LifespanService):
+    def __init__(self):
+        self.active_cache: CacheServiceBase | None = None
+        match config.cache.method:
+            case CacheMode.LOCAL:
+                self.active_cache = LocalCache(config.cache.local.max_size)
+            case CacheMode.REDIS:
+                from app.Services.cache.redis import RedisCache  # pylint: disable=import-outside-toplevel
+
+                self.active_cache = RedisCache(config.cache.redis.url, config.cache.redis.key_prefix)
+            case CacheMode.DISABLED:
+                self.active_cache = None
+            case _:
+                raise NotImplementedError(f"Cache method {config.cache.method} not implemented. "
+                                          f"Available methods: local, redis, disabled")
+
+    @property
+    def enabled(self) -> bool:
+        return self.active_cache is not None
+
+    async def on_load(self):
+        if self.active_cache is not None:
+            await self.active_cache.on_load()
+
+    async def on_exit(self):
+        if self.active_cache is not None:
+            await self.active_cache.on_exit()
@@ -1,9 +1,11 @@
-from abc import ABC, abstractmethod
+from abc import ABC
 
+from app.Services.lifespan_service import LifespanService
 
-class CacheServiceBase(ABC):
 
-    def get_by_id(self, entity_id: str):
+class CacheServiceBase(LifespanService, ABC):
+
+    async def get_by_id(self, entity_id: str):
         """
         Get an entity by its ID from the cache.
 
@@ -12,11 +14,20 @@ class CacheServiceBase(ABC):
         """
         raise NotImplementedError
 
-    def set_by_id(self, entity_id: str, entity: object):
+    async def set_by_id(self, entity_id: str, entity: object, ttl: float | None = None):
         """
         Set an entity in the cache by its ID.
 
         :param entity_id: The ID of the entity to set.
         :param entity: The entity to cache.
+        :param ttl: Time to live of the entity in seconds. None means using the default TTL of the cache.
+        """
+        raise NotImplementedError
+
+    async def delete_by_id(self, entity_id: str):
         """
-        raise NotImplementedError
\ No newline at end of file
+        Remove an entity from the cache by its ID. Nothing happens if the entity is not cached.
+
+        :param entity_id: The ID of the entity to remove.
+        """
+        raise NotImplementedError
@@ -0,0 +1,49 @@
+from collections import OrderedDict
+from time import monotonic
+
+from app.Services.cache.base import CacheServiceBase
+
+
+class LocalCache(CacheServiceBase):
+    """
+    In-process LRU cache, bounded by the number of entities and their time to live.
+    """
+
+    def __init__(self, max_size: int, default_ttl: float | None = None):
+        if max_size < 1:
+            raise ValueError("max_size must be a positive integer.")
+        self._max_size = max_size
+        self._default_ttl = default_ttl
+        self._entities: OrderedDict[str, tuple[object, float | None]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entities)
+
+    def get(self, entity_id: str):
+        if (item := self._entities.get(entity_id)) is None:
+            return None
+        entity, expire_at = item
+        if expire_at is not None and expire_at <= monotonic():
+            del self._entities[entity_id]
+            return None
+        self._entities.move_to_end(entity_id)
+        return entity
+
+    def set(self, entity_id: str, entity: object, ttl: float | None = None):
+        ttl = self._default_ttl if ttl is None else ttl
+        self._entities[entity_id] = (entity, monotonic() + ttl if ttl is not None else None)
+        self._entities.move_to_end(entity_id)
+        while len(self._entities) > self._max_size:
+            self._entities.popitem(last=False)
+
+    def delete(self, entity_id: str):
+        self._entities.pop(entity_id, None)
+
+    async def get_by_id(self, entity_id: str):
+        return self.get(entity_id)
+
+    async def set_by_id(self, entity_id: str, entity: object, ttl: float | None = None):
+        self.set(entity_id, entity, ttl)
+
+    async def delete_by_id(self, entity_id: str):
+        self.delete(entity_id)
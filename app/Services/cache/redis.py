@@ -0,0 +1,41 @@
+import pickle
+
+from loguru import logger
+
+from app.Services.cache.base import CacheServiceBase
+
+
+class RedisCache(CacheServiceBase):
+    """
+    Cache backed by a redis server, which can be shared between multiple server instances.
+    Entities are serialized with pickle, so the redis server should be trusted.
+    """
+
+    def __init__(self, url: str, key_prefix: str = '', default_ttl: float | None = None):
+        # noinspection PyPackageRequirements
+        from redis.asyncio import Redis  # pylint: disable=import-error,import-outside-toplevel
+
+        self._client = Redis.from_url(url)
+        self._key_prefix = key_prefix
+        self._default_ttl = default_ttl
+
+    async def on_load(self):
+        await self._client.ping()
+        logger.success("Redis cache connected.")
+
+    async def on_exit(self):
+        await self._client.aclose()
+
+    async def get_by_id(self, entity_id: str):
+        value = await self._client.get(self._key_prefix + entity_id)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    async def set_by_id(self, entity_id: str, entity: object, ttl: float | None = None):
+        ttl = self._default_ttl if ttl is None else ttl
+        await self._client.set(self._key_prefix + entity_id, pickle.dumps(entity),
+                               px=int(ttl * 1000) if ttl is not None else None)
+
+    async def delete_by_id(self, entity_id: str):
+        await self._client.delete(self._key_prefix + entity_id)
@@ -1,2 +0,0 @@
-class CacheService:
-    pass
@@ -1,30 +1,59 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+
 from PIL import Image
 from fastapi.concurrency import run_in_threadpool
 
 from app.Models.errors import PointDuplicateError
 from app.Models.mapped_image import MappedImage
+from app.Services.inference_service import InferenceService
 from app.Services.lifespan_service import LifespanService
 from app.Services.ocr_services import OCRService
 from app.Services.transformers_service import TransformersService
 from app.Services.vector_db_context import VectorDbContext
 from app.config import config
+from app.util.image_decode import MIN_INFER_SIZE
 
 
 class IndexService(LifespanService):
-    def __init__(self, ocr_service: OCRService, transformers_service: TransformersService, db_context: VectorDbContext):
+    def __init__(self, ocr_service: OCRService, transformers_service: TransformersService, db_context: VectorDbContext,
+                 inference_service: InferenceService | None = None):
         self._ocr_service = ocr_service
         self._transformers_service = transformers_service
         self._db_context = db_context
+        self._inference_service = inference_service
+
+    @staticmethod
+    def decode_size(skip_ocr=False) -> int | None:
+        """
+        Get the min size of the shorter side images should be decoded at for indexing (see `decode_image`).
+        :return: The min size, or None if images should be decoded at the full resolution.
+        """
+        if not config.indexing.fast_decode:
+            return None
+        if not skip_ocr and config.ocr_search.enable:
+            return config.indexing.ocr_decode_size or None
+        return MIN_INFER_SIZE
 
-    def _prepare_image(self, image: Image.Image, image_data: MappedImage, skip_ocr=False):
-        image_data.width = image.width
-        image_data.height = image.height
-        image_data.aspect_ratio = float(image.width) / image.height
+    @staticmethod
+    def load_image(image: Image.Image, image_data: MappedImage,
+                   original_size: tuple[int, int] | None = None) -> Image.Image:
+        """
+        Fill the size fields of the mapped image, and get the RGB image used for inferring.
+        :param original_size: The size of the original image, if the image is decoded at a reduced resolution.
+        """
+        width, height = original_size or image.size
+        image_data.width = width
+        image_data.height = height
+        image_data.aspect_ratio = float(width) / height
 
         if image.mode != 'RGB':
-            image = image.convert('RGB')  # to reduce convert in next steps
-        else:
-            image = image.copy()
+            return image.convert('RGB')  # to reduce convert in next steps
+        return image.copy()
+
+    def _prepare_image(self, image: Image.Image, image_data: MappedImage, skip_ocr=False,
+                       original_size: tuple[int, int] | None = None):
+        image = self.load_image(image, image_data, original_size)
         image_data.image_vector = self._transformers_service.get_image_vector(image)
         if not skip_ocr and config.ocr_search.enable:
             image_data.ocr_text = self._ocr_service.ocr_interface(image)
@@ -33,6 +62,58 @@ class IndexService(LifespanService):
             else:
                 image_data.ocr_text = None
 
+    async def _prepare_image_async(self, image: Image.Image, image_data: MappedImage, skip_ocr=False,
+                                   executor: Executor | None = None, original_size: tuple[int, int] | None = None):
+        """
+        Same as `_prepare_image`, but the CPU bound steps run in the given executor, and the model inference is
+        submitted to the inference service, so that the images indexed concurrently can be inferred in batches.
+        """
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(executor, self.load_image, image, image_data, original_size)
+        image_data.image_vector = await self._inference_service.get_image_vector(image, background=True)
+        if not skip_ocr and config.ocr_search.enable:
+            image_data.ocr_text = await loop.run_in_executor(executor, self._ocr_service.ocr_interface, image) or None
+            if image_data.ocr_text is not None:
+                image_data.text_contain_vector = await self._inference_service.get_bert_vector(image_data.ocr_text,
+                                                                                               background=True)
+
+    def embed_image_batch(self, images: list[Image.Image], image_data: list[MappedImage]):
+        """
+        Infer the image vectors of RGB images in batches of `config.indexing.batch_size`.
+        """
+        batch_size = config.indexing.batch_size
+        for i in range(0, len(images), batch_size):
+            vectors = self._transformers_service.get_image_vector_batch(images[i:i + batch_size])
+            for img_data, vector in zip(image_data[i:i + batch_size], vectors):
+                img_data.image_vector = vector
+
+    def ocr_image_batch(self, images: list[Image.Image], image_data: list[MappedImage]):
+        """
+        Recognize the text of RGB images, and infer the text vectors of the recognized text in batches.
+        Nothing will be done if OCR search is disabled.
+        """
+        if not config.ocr_search.enable:
+            return
+        batch_size = config.indexing.batch_size
+        for img, img_data in zip(images, image_data):
+            img_data.ocr_text = self._ocr_service.ocr_interface(img) or None
+        ocr_items = [t for t in image_data if t.ocr_text is not None]
+        for i in range(0, len(ocr_items), batch_size):
+            chunk = ocr_items[i:i + batch_size]
+            vectors = self._transformers_service.get_bert_vector_batch([t.ocr_text for t in chunk])
+            for img_data, vector in zip(chunk, vectors):
+                img_data.text_contain_vector = vector
+
+    def _prepare_image_batch(self, images: list[Image.Image], image_data: list[MappedImage], skip_ocr=False,
+                             original_sizes: list[tuple[int, int] | None] | None = None):
+        # Decoding and converting are mostly done in native code of PIL, so they can be parallelized with threads
+        with ThreadPoolExecutor(max_workers=config.indexing.preprocess_workers,
+                                thread_name_prefix="index_preprocess") as executor:
+            images = list(executor.map(self.load_image, images, image_data, original_sizes or [None] * len(images)))
+        self.embed_image_batch(images, image_data)
+        if not skip_ocr:
+            self.ocr_image_batch(images, image_data)
+
     # currently, here only need just a simple check
     async def _is_point_duplicate(self, image_data: list[MappedImage]) -> bool:
         image_id_list = [str(item.id) for item in image_data]
@@ -40,21 +121,41 @@ class IndexService(LifespanService):
         return len(result) != 0
 
     async def index_image(self, image: Image.Image, image_data: MappedImage, skip_ocr=False, skip_duplicate_check=False,
-                          background=False):
+                          background=False, executor: Executor | None = None,
+                          original_size: tuple[int, int] | None = None):
         if not skip_duplicate_check and (await self._is_point_duplicate([image_data])):
             raise PointDuplicateError("The uploaded points are contained in the database!", image_data.id)
 
         if background:
-            await run_in_threadpool(self._prepare_image, image, image_data, skip_ocr)
+            await self.prepare_image(image, image_data, skip_ocr, executor, original_size)
         else:
-            self._prepare_image(image, image_data, skip_ocr)
+            self._prepare_image(image, image_data, skip_ocr, original_size)
 
         await self._db_context.insert_items([image_data])
 
+    async def prepare_image(self, image: Image.Image, image_data: MappedImage, skip_ocr=False,
+                            executor: Executor | None = None, original_size: tuple[int, int] | None = None):
+        """
+        Fill the size fields and vectors of the mapped image without blocking the event loop.
+        The mapped image should be inserted into the database afterward.
+        :param original_size: The size of the original image, if the image is decoded at a reduced resolution.
+        """
+        if self._inference_service is not None:
+            await self._prepare_image_async(image, image_data, skip_ocr, executor, original_size)
+        else:
+            await run_in_threadpool(self._prepare_image, image, image_data, skip_ocr, original_size)
+
     async def index_image_batch(self, image: list[Image.Image], image_data: list[MappedImage],
-                                skip_ocr=False, allow_overwrite=False):
+                                skip_ocr=False, allow_overwrite=False, background=False,
+                                original_sizes: list[tuple[int, int] | None] | None = None):
+        """
+        Index a batch of images. The images are inferred in batches of `config.indexing.batch_size`, and inserted into
+        the database with a single upsert.
+        """
         if not allow_overwrite and (await self._is_point_duplicate(image_data)):
             raise PointDuplicateError("The uploaded points are contained in the database!")
-        for img, img_data in zip(image, image_data):
-            self._prepare_image(img, img_data, skip_ocr)
+        if background:
+            await run_in_threadpool(self._prepare_image_batch, image, image_data, skip_ocr, original_sizes)
+        else:
+            self._prepare_image_batch(image, image_data, skip_ocr, original_sizes)
         await self._db_context.insert_items(image_data)
@@ -0,0 +1,138 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from loguru import logger
+from numpy import ndarray
+
+from app.Services.cache import CacheService
+from app.Services.lifespan_service import LifespanService
+from app.Services.transformers_service import TransformersService
+from app.config import config
+from app.util.batch_scheduler import BatchScheduler, BatchSchedulerStats
+
+
+class InferenceOverloadedError(RuntimeError):
+    def __init__(self, pending_requests: int):
+        self.pending_requests = pending_requests
+        super().__init__(f"Inference service is overloaded. {pending_requests} requests are pending.")
+
+
+class InferenceService(LifespanService):
+    """
+    Asynchronous entry of the model inference used by the request handlers.
+    All the inference runs in a dedicated bounded executor, so the event loop is never blocked. Concurrent requests
+    are coalesced by micro-batching schedulers if batching is enabled. Text embeddings are cached by the cache service.
+    """
+
+    def __init__(self, transformers_service: TransformersService, cache_service: CacheService | None = None):
+        self._transformers_service = transformers_service
+        self._cache_service = cache_service
+        self._text_cache = config.inference.text_cache_enable and cache_service is not None and cache_service.enabled
+        self.text_cache_hits = 0
+        self.text_cache_misses = 0
+        self._executor = ThreadPoolExecutor(max_workers=config.inference.executor_workers,
+                                            thread_name_prefix="inference")
+        self._max_pending = config.inference.max_pending_requests
+        self._pending = 0
+        self._background_pending = 0
+        self._rejected = 0
+        self._batching = config.inference.batching_enable
+        self._schedulers: dict[str, BatchScheduler] = {}
+        if self._batching:
+            self._schedulers = {
+                'clip_text': self._create_scheduler('clip_text', transformers_service.get_text_vector_batch),
+                'clip_image': self._create_scheduler('clip_image', transformers_service.get_image_vector_batch),
+            }
+            if config.ocr_search.enable:
+                self._schedulers['bert'] = self._create_scheduler('bert', transformers_service.get_bert_vector_batch)
+            logger.info("Inference batching enabled. Max batch size: {}, max wait: {}ms",
+                        config.inference.max_batch_size, config.inference.max_wait_ms)
+
+    def _create_scheduler(self, name: str, batch_fn) -> BatchScheduler:
+        return BatchScheduler(name, batch_fn,
+                              max_batch_size=config.inference.max_batch_size,
+                              max_wait_ms=config.inference.max_wait_ms,
+                              executor=self._executor)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        return self._executor
+
+    @property
+    def pending_requests(self) -> int:
+        return self._pending
+
+    @property
+    def background_pending_requests(self) -> int:
+        return self._background_pending
+
+    @property
+    def rejected_requests(self) -> int:
+        return self._rejected
+
+    async def _infer(self, scheduler_name: str, single_fn, item, background=False):
+        # Background requests (e.g. indexing) are queued by their own services, so they are never rejected, and they
+        # are counted separately to not reject the search requests during indexing
+        if background:
+            self._background_pending += 1
+        else:
+            if 0 < self._max_pending <= self._pending:
+                self._rejected += 1
+                logger.warning("Inference request rejected. Pending requests: {}", self._pending)
+                raise InferenceOverloadedError(self._pending)
+            self._pending += 1
+        try:
+            if self._batching:
+                return await self._schedulers[scheduler_name].submit(item)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, single_fn, item)
+        finally:
+            if background:
+                self._background_pending -= 1
+            else:
+                self._pending -= 1
+
+    @staticmethod
+    def _normalize_prompt(text: str) -> str:
+        # Both CLIP and BERT tokenizers are case-insensitive and ignore redundant whitespaces
+        return ' '.join(text.lower().split())
+
+    async def _infer_text_cached(self, scheduler_name: str, model_name: str, single_fn, text: str,
+                                 background=False) -> ndarray:
+        if not self._text_cache or background:
+            return await self._infer(scheduler_name, single_fn, text, background)
+        cache = self._cache_service.active_cache
+        key = f"text_embedding:{scheduler_name}:{model_name}:{self._normalize_prompt(text)}"
+        try:
+            vector = await cache.get_by_id(key)
+        except Exception as ex:
+            logger.warning("Failed to read text embedding from cache: {}", ex)
+            vector = None
+        if vector is not None:
+            self.text_cache_hits += 1
+            return vector
+        self.text_cache_misses += 1
+        vector = await self._infer(scheduler_name, single_fn, text)
+        try:
+            await cache.set_by_id(key, vector, config.inference.text_cache_ttl)
+        except Exception as ex:
+            logger.warning("Failed to write text embedding to cache: {}", ex)
+        return vector
+
+    async def get_text_vector(self, text: str) -> ndarray:
+        return await self._infer_text_cached('clip_text', config.model.clip,
+                                             self._transformers_service.get_text_vector, text)
+
+    async def get_image_vector(self, image: Image.Image, background=False) -> ndarray:
+        return await self._infer('clip_image', self._transformers_service.get_image_vector, image, background)
+
+    async def get_bert_vector(self, text: str, background=False) -> ndarray:
+        return await self._infer_text_cached('bert', config.model.bert,
+                                             self._transformers_service.get_bert_vector, text, background)
+
+    def get_stats(self) -> dict[str, BatchSchedulerStats]:
+        return {name: scheduler.stats for name, scheduler in self._schedulers.items()}
+
+    async def on_exit(self):
+        await asyncio.gather(*[t.stop() for t in self._schedulers.values()])
+        self._executor.shutdown(wait=False, cancel_futures=True)
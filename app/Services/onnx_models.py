@@ -0,0 +1,200 @@
+import json
+import os
+import re
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import torch
+import transformers
+from loguru import logger
+from torch import nn
+from transformers import CLIPModel, BertModel, CLIPConfig, BertConfig, PretrainedConfig
+
+ONNX_OPSET_VERSION = 17
+EXPORT_METADATA_FILE = 'onnx_export.json'
+
+
+class _ClipImageEncoder(nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class _ClipTextEncoder(nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class _BertEncoder(nn.Module):
+    def __init__(self, model: BertModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)
+        # Mean pooling over the non-padding tokens, the same as TransformersService.get_bert_vector_batch
+        mask = attention_mask.unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+        return (outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
+
+
+class OnnxModel:
+    """
+    An encoder exported to ONNX, running with ONNX Runtime on CPU.
+    Requires the `onnx` extra to be installed.
+    """
+
+    def __init__(self, path: Path, threads: int = 0):
+        import onnxruntime as ort  # pylint: disable=import-error,import-outside-toplevel
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+        self._input_names = {t.name for t in self._session.get_inputs()}
+
+    def __call__(self, **inputs: np.ndarray) -> np.ndarray:
+        # Tokenizers may return inputs that are not used by the graph, e.g. token_type_ids
+        return self._session.run(None, {k: v for k, v in inputs.items() if k in self._input_names})[0]
+
+
+def model_cache_dir(model_name: str, cache_dir: str | Path) -> Path:
+    """
+    Get the directory of the exported or quantized files of a model, which can be either a model id or a local path.
+    """
+    return Path(cache_dir) / re.sub(r'[^\w.-]+', '--', model_name.strip('/\\'))
+
+
+def _export(module: nn.Module, inputs: dict[str, torch.Tensor], output_path: Path):
+    logger.info("Exporting {} to ONNX...", output_path.name)
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} if tensor.dim() == 2 else {0: 'batch'}
+                    for name, tensor in inputs.items()}
+    dynamic_axes['output'] = {0: 'batch'}
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Export to a temporary file first, so an interrupted export is never picked up as the cached graph
+    temp_path = output_path.with_name(output_path.name + '.part')
+    try:
+        with torch.no_grad():
+            torch.onnx.export(module.eval(), tuple(inputs.values()), str(temp_path), input_names=list(inputs.keys()),
+                              output_names=['output'], dynamic_axes=dynamic_axes,
+                              opset_version=ONNX_OPSET_VERSION, dynamo=False)
+        os.replace(temp_path, output_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def _sample_text_inputs(vocab_size: int) -> dict[str, torch.Tensor]:
+    # Only the shapes and types matter for tracing, the second text is padded to trace the attention mask
+    attention_mask = torch.ones(2, 8, dtype=torch.long)
+    attention_mask[1, 5:] = 0
+    return {'input_ids': torch.randint(0, vocab_size, (2, 8)), 'attention_mask': attention_mask,
+            'token_type_ids': torch.zeros(2, 8, dtype=torch.long)}
+
+
+def export_clip(model_name: str, output_dir: Path):
+    """
+    Export the image and text towers of a CLIP model to `image.onnx` and `text.onnx` in `output_dir`.
+    """
+    model = CLIPModel.from_pretrained(model_name)
+    image_size = model.config.vision_config.image_size
+    _export(_ClipImageEncoder(model), {'pixel_values': torch.randn(2, 3, image_size, image_size)},
+            output_dir / 'image.onnx')
+    text_inputs = _sample_text_inputs(model.config.text_config.vocab_size)
+    _export(_ClipTextEncoder(model), {k: text_inputs[k] for k in ('input_ids', 'attention_mask')},
+            output_dir / 'text.onnx')
+
+
+def export_bert(model_name: str, output_dir: Path):
+    """
+    Export a BERT model, including the mean pooling, to `bert.onnx` in `output_dir`.
+    """
+    model = BertModel.from_pretrained(model_name)
+    _export(_BertEncoder(model), _sample_text_inputs(model.config.vocab_size), output_dir / 'bert.onnx')
+
+
+def quantize_onnx(model_path: Path) -> Path:
+    """
+    Apply dynamic int8 quantization to the MatMul and Gemm (linear layers) nodes of an ONNX graph.
+    The quantized graph is saved next to the original one, and reused if it already exists.
+    Requires the `onnx` extra to be installed.
+    :return: The path of the quantized graph.
+    """
+    # pylint: disable=import-error,import-outside-toplevel
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    output_path = model_path.with_suffix('.int8.onnx')
+    if output_path.exists():
+        return output_path
+    logger.info("Quantizing {}...", model_path.name)
+    temp_path = output_path.with_name(output_path.name + '.part')
+    try:
+        quantize_dynamic(model_path, temp_path, op_types_to_quantize=['MatMul', 'Gemm'], weight_type=QuantType.QInt8)
+        os.replace(temp_path, output_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return output_path
+
+
+def _export_key(model_config: PretrainedConfig) -> dict[str, str]:
+    # The exported graphs are only valid for the same model revision, exporter versions and opset
+    return {'revision': model_config._commit_hash or '',  # pylint: disable=protected-access
+            'torch': str(torch.__version__), 'transformers': transformers.__version__,
+            'opset': str(ONNX_OPSET_VERSION)}
+
+
+def _ensure_exported(model_name: str, model_dir: Path, model_config: PretrainedConfig, paths: list[Path],
+                     export_fn: Callable[[str, Path], None]):
+    """
+    Export the model with `export_fn` if any of its graphs is missing, or the cached graphs are outdated.
+    The quantized graphs of an outdated export are removed, so they are quantized again from the new export.
+    """
+    key = _export_key(model_config)
+    metadata_path = model_dir / EXPORT_METADATA_FILE
+    try:
+        cached_key = json.loads(metadata_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        cached_key = None
+    if cached_key == key and all(t.exists() for t in paths):
+        return
+    if cached_key is not None:
+        logger.info("Exported ONNX model in {} is outdated.", model_dir)
+    # Removed first, so an interrupted export is never taken as up to date
+    metadata_path.unlink(missing_ok=True)
+    export_fn(model_name, model_dir)
+    for path in paths:
+        path.with_suffix('.int8.onnx').unlink(missing_ok=True)
+    metadata_path.write_text(json.dumps(key), encoding='utf-8')
+
+
+def load_clip_onnx(model_name: str, cache_dir: str | Path, threads: int = 0, quantize: bool = False) \
+        -> tuple[OnnxModel, OnnxModel]:
+    """
+    Load the image and text towers of a CLIP model with ONNX Runtime. The model is exported on the first load, and
+    exported again if the model revision, torch, transformers or the opset changes.
+    :param quantize: Whether to apply dynamic int8 quantization to the model. The quantized graphs are cached as well.
+    :return: The image and text encoders.
+    """
+    model_dir = model_cache_dir(model_name, cache_dir)
+    paths = [model_dir / 'image.onnx', model_dir / 'text.onnx']
+    _ensure_exported(model_name, model_dir, CLIPConfig.from_pretrained(model_name), paths, export_clip)
+    if quantize:
+        paths = [quantize_onnx(t) for t in paths]
+    return OnnxModel(paths[0], threads), OnnxModel(paths[1], threads)
+
+
+def load_bert_onnx(model_name: str, cache_dir: str | Path, threads: int = 0, quantize: bool = False) -> OnnxModel:
+    """
+    Load a BERT model with ONNX Runtime. The model is exported on the first load, and exported again if the model
+    revision, torch, transformers or the opset changes.
+    :param quantize: Whether to apply dynamic int8 quantization to the model. The quantized graph is cached as well.
+    """
+    model_dir = model_cache_dir(model_name, cache_dir)
+    path = model_dir / 'bert.onnx'
+    _ensure_exported(model_name, model_dir, BertConfig.from_pretrained(model_name), [path], export_bert)
+    return OnnxModel(quantize_onnx(path) if quantize else path, threads)
@@ -1,8 +1,11 @@
 import asyncio
 from loguru import logger
 
+from .cache import CacheService
 from .index_service import IndexService
+from .inference_service import InferenceService
 from .lifespan_service import LifespanService
+from .search_session_service import SearchSessionService
 from .storage import StorageService
 from .transformers_service import TransformersService
 from .upload_service import UploadService
@@ -11,9 +14,22 @@ from ..config import config, environment
 
 
 class ServiceProvider:
+    # Services are stopped after all the services using them, so pending uploads are indexed and stored before the
+    # model, database and storage are released. Services in the same group are stopped concurrently.
+    EXIT_ORDER = (
+        ('upload_service',),
+        ('index_service', 'search_session_service'),
+        ('inference_service', 'ocr_service'),
+        ('transformers_service', 'db_context', 'storage_service'),
+        ('cache_service',),
+    )
+
     def __init__(self):
         self.transformers_service = TransformersService()
+        self.cache_service = CacheService()
+        self.inference_service = InferenceService(self.transformers_service, self.cache_service)
         self.db_context = VectorDbContext()
+        self.search_session_service = SearchSessionService(self.db_context, self.cache_service)
         self.ocr_service = None
 
         if config.ocr_search.enable and (environment.local_indexing or config.admin_api_enable):
@@ -38,8 +54,9 @@ class ServiceProvider:
             self.ocr_service = DisabledOCRService()
         logger.info(f"OCR service '{type(self.ocr_service).__name__}' initialized.")
 
-        self.index_service = IndexService(self.ocr_service, self.transformers_service, self.db_context)
-        self.storage_service = StorageService()
+        self.index_service = IndexService(self.ocr_service, self.transformers_service, self.db_context,
+                                          self.inference_service)
+        self.storage_service = StorageService(self.cache_service)
         logger.info(f"Storage service '{type(self.storage_service.active_storage).__name__}' initialized.")
 
         self.upload_service = UploadService(self.storage_service, self.db_context, self.index_service)
@@ -51,6 +68,9 @@ class ServiceProvider:
         await asyncio.gather(*tasks)
 
     async def onexit(self):
-        tasks = [service.on_exit() for service_name in dir(self)
-                 if isinstance((service := getattr(self, service_name)), LifespanService)]
-        await asyncio.gather(*tasks)
+        services = {service_name: service for service_name in dir(self)
+                    if isinstance((service := getattr(self, service_name)), LifespanService)}
+        for service_names in self.EXIT_ORDER:
+            await asyncio.gather(*[services.pop(t).on_exit() for t in service_names if t in services])
+        # Services not listed above have no dependents
+        await asyncio.gather(*[t.on_exit() for t in services.values()])
@@ -0,0 +1,76 @@
+import os
+import warnings
+from contextlib import contextmanager
+from pathlib import Path
+
+import torch
+import transformers
+from loguru import logger
+from torch import nn
+from transformers import PreTrainedModel, PretrainedConfig
+from transformers.modeling_utils import no_init_weights
+
+from app.Services.onnx_models import model_cache_dir
+
+
+@contextmanager
+def _ignore_quantization_deprecations():
+    # torch.ao.quantization and the quantized tensors are deprecated in favor of torchao, but they are still the only
+    # dynamic quantization shipped with torch itself. The warnings are silenced instead of emitted on every model load.
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='torch.ao.quantization is deprecated', category=DeprecationWarning)
+        warnings.filterwarnings('ignore', message='torch.quantize_per_tensor', category=UserWarning)
+        warnings.filterwarnings('ignore', message='TypedStorage is deprecated', category=UserWarning)
+        yield
+
+
+def quantize_model(model: nn.Module) -> nn.Module:
+    """
+    Apply dynamic int8 quantization to the linear layers of a model. The quantized model only runs on CPU.
+    """
+    with _ignore_quantization_deprecations():
+        return torch.ao.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def _cache_key(model_config: PretrainedConfig) -> dict[str, str]:
+    # The quantized weights are only valid for the same model revision, library versions and quantization engine
+    return {'revision': model_config._commit_hash or '',  # pylint: disable=protected-access
+            'torch': str(torch.__version__), 'transformers': transformers.__version__,
+            'engine': torch.backends.quantized.engine}
+
+
+def load_quantized_model(model_cls: type[PreTrainedModel], model_name: str, cache_dir: str | Path | None) \
+        -> PreTrainedModel:
+    """
+    Load a pretrained model with dynamic int8 quantization applied.
+    :param cache_dir: Directory to cache the quantized weights in, so the full precision weights don't need to be
+     loaded and quantized again on the next load. None or empty to disable caching.
+    """
+    cache_path = model_cache_dir(model_name, cache_dir) / f'{model_cls.__name__}.int8.pt' if cache_dir else None
+    if cache_path is not None and cache_path.exists():
+        try:
+            model_config = model_cls.config_class.from_pretrained(model_name)
+            with _ignore_quantization_deprecations():
+                cached = torch.load(cache_path, weights_only=True)
+            if cached['key'] == _cache_key(model_config):
+                # Build the quantized modules without initializing the weights, which are loaded from the cache
+                with no_init_weights():
+                    model = quantize_model(model_cls(model_config))
+                model.load_state_dict(cached['state_dict'])
+                logger.info("Loaded quantized model from {}", cache_path)
+                return model.eval()
+            logger.info("Quantized model cache {} is outdated.", cache_path)
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            logger.warning("Failed to load quantized model from {}: {}", cache_path, ex)
+
+    logger.info("Quantizing {}...", model_name)
+    model = quantize_model(model_cls.from_pretrained(model_name))
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_name(cache_path.name + '.part')
+        try:
+            torch.save({'key': _cache_key(model.config), 'state_dict': model.state_dict()}, temp_path)
+            os.replace(temp_path, cache_path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+    return model
@@ -0,0 +1,106 @@
+from dataclasses import dataclass, field
+from uuid import UUID
+
+from loguru import logger
+
+from app.Models.db_queries import DbQuery
+from app.Models.query_params import FilterParams
+from app.Models.search_result import SearchResult
+from app.Services.cache import CacheService
+from app.Services.cache.base import CacheServiceBase
+from app.Services.cache.local import LocalCache
+from app.Services.lifespan_service import LifespanService
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config, CacheMode
+
+
+@dataclass
+class SearchSession:
+    query: DbQuery
+    filter_param: FilterParams | None
+    ranked_ids: list[tuple[str, float]] = field(default_factory=list)
+    exhausted: bool = False  # Whether all the matched results are in ranked_ids
+
+
+class SearchSessionService(LifespanService):
+    """
+    Stores the ranked result IDs of searches by their query ID, so the following pages of a search are served from
+    the session, without inferring and searching again. The ranked IDs are fetched in windows when a following page
+    is requested, so deep pages don't need to skip over the previous results in every request.
+    The sessions are stored in the redis cache if enabled, to be shared between server instances. Otherwise, they are
+    kept in a dedicated local store, so they never evict the entities of the cache service.
+    """
+
+    def __init__(self, db_context: VectorDbContext, cache_service: CacheService | None = None):
+        self._db_context = db_context
+        self._store: CacheServiceBase | None = None
+        if not config.search.session_enable:
+            return
+        if config.cache.method == CacheMode.REDIS and cache_service is not None and cache_service.enabled:
+            self._store = cache_service.active_cache
+        else:
+            self._store = LocalCache(config.search.session_max_count, config.search.session_ttl)
+
+    @property
+    def enabled(self) -> bool:
+        return self._store is not None
+
+    @staticmethod
+    def _key(query_id: UUID) -> str:
+        return f"search_session:{query_id}"
+
+    async def search(self, query_id: UUID, query: DbQuery, filter_param: FilterParams | None, skip: int,
+                     count: int, fields: set[str] | None = None) -> list[SearchResult]:
+        """
+        Start a search session. The requested page is searched with a single query, the following pages are fetched
+        into the session when recalled.
+        :param fields: The fields of the items to retrieve. All the fields if None.
+        :return: The requested page of the results.
+        """
+        results = await self._db_context.query_search(query, count, skip, filter_param, fields)
+        session = SearchSession(query, filter_param)
+        if skip == 0:
+            # The first page is kept as is, so recalling it never changes the results
+            session.ranked_ids = [(str(t.img.id), t.score) for t in results]
+            session.exhausted = len(results) < count
+        await self._save(query_id, session)
+        return results
+
+    async def recall(self, query_id: UUID, skip: int, count: int,
+                     fields: set[str] | None = None) -> list[SearchResult] | None:
+        """
+        Get a page of the results of an existing search session.
+        :param fields: The fields of the items to retrieve. All the fields if None.
+        :return: The requested page of the results. None if the session doesn't exist or has expired.
+        """
+        try:
+            session = await self._store.get_by_id(self._key(query_id))
+        except Exception as ex:
+            logger.warning("Failed to read search session from cache: {}", ex)
+            session = None
+        if session is None:
+            return None
+        return await self._get_page(query_id, session, skip, count, fields)
+
+    async def _get_page(self, query_id: UUID, session: SearchSession, skip: int, count: int,
+                        fields: set[str] | None) -> list[SearchResult]:
+        end = skip + count
+        max_size = config.search.session_max_size
+        if end > max_size:
+            # Too deep to be kept in the session, fall back to searching with offset
+            return await self._db_context.query_search(session.query, count, skip, session.filter_param, fields)
+        if end > len(session.ranked_ids) and not session.exhausted:
+            limit = min(max(end, len(session.ranked_ids) * 2, config.search.session_window), max_size)
+            ranked_ids = await self._db_context.query_search_ids(session.query, limit, session.filter_param)
+            # Only new results are appended, so the pages already served never change (e.g. with RRF fusion)
+            seen = {t[0] for t in session.ranked_ids}
+            session.ranked_ids += [t for t in ranked_ids if t[0] not in seen]
+            session.exhausted = len(ranked_ids) < limit
+            await self._save(query_id, session)
+        return await self._db_context.retrieve_search_results(session.ranked_ids[skip:end], fields)
+
+    async def _save(self, query_id: UUID, session: SearchSession):
+        try:
+            await self._store.set_by_id(self._key(query_id), session, config.search.session_ttl)
+        except Exception as ex:
+            logger.warning("Failed to write search session to cache: {}", ex)
@@ -1,3 +1,4 @@
+from app.Services.cache import CacheService
 from app.Services.lifespan_service import LifespanService
 from app.Services.storage.base import BaseStorage
 from app.Services.storage.disabled_storage import DisabledStorage
@@ -7,13 +8,13 @@ from app.config import config, StorageMode
 
 
 class StorageService(LifespanService):
-    def __init__(self):
+    def __init__(self, cache_service: CacheService | None = None):
         self.active_storage = None
         match config.storage.method:
             case StorageMode.LOCAL:
                 self.active_storage = LocalStorage()
             case StorageMode.S3:
-                self.active_storage = S3Storage()
+                self.active_storage = S3Storage(cache_service)
             case StorageMode.DISABLED:
                 self.active_storage = DisabledStorage()
             case _:
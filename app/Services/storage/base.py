@@ -1,6 +1,7 @@
 import abc
+import asyncio
 import os
-from typing import TypeVar, Generic, TypeAlias, Optional, AsyncGenerator
+from typing import TypeVar, Generic, TypeAlias, Optional, AsyncGenerator, AsyncIterator, AsyncIterable
 
 from app.Services.lifespan_service import LifespanService
 
@@ -12,6 +13,8 @@ RemoteFilePathType: TypeAlias = PathLikeType
 LocalFileMetaDataType: TypeAlias = FileMetaDataT
 RemoteFileMetaDataType: TypeAlias = FileMetaDataT
 
+DEFAULT_STREAM_CHUNK_SIZE = 1024 * 1024
+
 
 class BaseStorage(LifespanService, abc.ABC, Generic[FileMetaDataT]):
     def __init__(self):
@@ -63,6 +66,27 @@ class BaseStorage(LifespanService, abc.ABC, Generic[FileMetaDataT]):
         """
         raise NotImplementedError
 
+    async def presign_urls(self,
+                           remote_files: list[RemoteFilePathType],
+                           expire_second: int = 3600,
+                           max_concurrency: int = 32) -> list[str]:
+        """
+        Get the presign URLs of a batch of files in static_dir.
+        By default, `presign_url` is called concurrently for each file, with at most `max_concurrency` calls in flight.
+        Backends may override this method to presign the files more efficiently.
+        :param remote_files: The file paths relative to static_dir
+        :param expire_second: Valid time for presign urls
+        :param max_concurrency: Max number of presign operations running concurrently
+        :return: files' "presign URL", in the same order as remote_files
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def presign(remote_file: RemoteFilePathType) -> str:
+            async with semaphore:
+                return await self.presign_url(remote_file, expire_second)
+
+        return list(await asyncio.gather(*[presign(t) for t in remote_files]))
+
     @abc.abstractmethod
     async def fetch(self,
                     remote_file: RemoteFilePathType) -> bytes:
@@ -84,6 +108,33 @@ class BaseStorage(LifespanService, abc.ABC, Generic[FileMetaDataT]):
         """
         raise NotImplementedError
 
+    async def fetch_stream(self,
+                           remote_file: RemoteFilePathType,
+                           chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """
+        Fetch a file from static_dir in chunks, so the whole file is never held in memory.
+        By default, the whole file is fetched with `fetch` and yielded in chunks. Backends should override this method
+        to read the file incrementally.
+        :param remote_file: The file path relative to static_dir
+        :param chunk_size: Max size of each chunk in bytes
+        :return: An asynchronous iterator yielding file's content
+        """
+        content = await self.fetch(remote_file)
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i + chunk_size]
+
+    async def upload_stream(self,
+                            chunks: AsyncIterable[bytes],
+                            remote_file: RemoteFilePathType) -> None:
+        """
+        Write the chunks into a file in static_dir, so the whole file is never held in memory.
+        By default, the chunks are joined and uploaded with `upload`. Backends should override this method to write the
+        file incrementally.
+        :param chunks: An asynchronous iterable yielding the content of the file
+        :param remote_file: The file path relative to static_dir
+        """
+        await self.upload(b''.join([t async for t in chunks]), remote_file)
+
     @abc.abstractmethod
     async def copy(self,
                    old_remote_file: RemoteFilePathType,
@@ -2,16 +2,17 @@ import os
 from asyncio import to_thread
 from pathlib import Path as syncPath
 from shutil import copy2, move
-from typing import Optional, AsyncGenerator
+from typing import Optional, AsyncGenerator, AsyncIterator, AsyncIterable
 
 import aiofiles
 from loguru import logger
 
-from app.Services.storage.base import BaseStorage, FileMetaDataT, RemoteFilePathType, LocalFilePathType
+from app.Services.storage.base import BaseStorage, FileMetaDataT, RemoteFilePathType, LocalFilePathType, \
+    DEFAULT_STREAM_CHUNK_SIZE
 from app.Services.storage.exception import RemoteFileNotFoundError, LocalFileNotFoundError, RemoteFilePermissionError, \
     LocalFilePermissionError, LocalFileExistsError, RemoteFileExistsError
 from app.config import config
-from app.util.local_file_utility import glob_local_files
+from app.util.local_file_utility import glob_local_files, iter_local_file
 
 
 def transform_exception(param: str):
@@ -78,6 +79,12 @@ class LocalStorage(BaseStorage[FileMetaDataT: None]):
                           expire_second: int = 3600) -> str:
         return f"/static/{str(remote_file)}"
 
+    async def presign_urls(self,
+                           remote_files: list["RemoteFilePathType"],
+                           expire_second: int = 3600,
+                           max_concurrency: int = 32) -> list[str]:
+        return [f"/static/{str(t)}" for t in remote_files]
+
     @transform_exception("remote")
     async def fetch(self,
                     remote_file: "RemoteFilePathType") -> bytes:
@@ -98,6 +105,36 @@ class LocalStorage(BaseStorage[FileMetaDataT: None]):
         local_file = f"{len(local_file)} bytes" if isinstance(local_file, bytes) else local_file
         logger.success(f"Successfully uploaded file {str(local_file)} to {str(remote_file)} via local_storage.")
 
+    async def fetch_stream(self,
+                           remote_file: "RemoteFilePathType",
+                           chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in iter_local_file(self.file_path_warp(remote_file), chunk_size):
+                yield chunk
+        except FileNotFoundError as ex:
+            raise RemoteFileNotFoundError from ex
+        except PermissionError as ex:
+            raise RemoteFilePermissionError from ex
+
+    @transform_exception("remote")
+    async def upload_stream(self,
+                            chunks: AsyncIterable[bytes],
+                            remote_file: "RemoteFilePathType") -> None:
+        remote_file = self.file_path_warp(remote_file)
+        # Write into a temporary file first, so an interrupted stream never leaves a truncated file behind
+        tmp_file = remote_file.with_name(f"{remote_file.name}.part")
+        size = 0
+        try:
+            async with aiofiles.open(str(tmp_file), 'wb') as file:
+                async for chunk in chunks:
+                    await file.write(chunk)
+                    size += len(chunk)
+            await to_thread(os.replace, str(tmp_file), str(remote_file))
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+        logger.success(f"Successfully uploaded {size} bytes to {str(remote_file)} via local_storage.")
+
     @transform_exception("remote")
     async def copy(self,
                    old_remote_file: "RemoteFilePathType",
@@ -2,24 +2,30 @@
 # Related issue: https://github.com/pylint-dev/pylint/issues/9185
 # Remove below `# pylint` once the issue is resolved
 # pylint: disable=import-error,no-name-in-module
+import asyncio
 import os
 import urllib.parse
 from pathlib import PurePosixPath
-from typing import Optional, AsyncGenerator
+from typing import Optional, AsyncGenerator, AsyncIterator, AsyncIterable
 
-import aiofiles
 from loguru import logger
 from opendal import AsyncOperator
 from opendal.layers import MimeGuessLayer, RetryLayer
 from opendal.exceptions import NotFound, PermissionDenied, AlreadyExists
 from wcmatch import glob
 
+from app.Services.cache import CacheService, CacheServiceBase, LocalCache
 from app.Services.storage.base import BaseStorage, FileMetaDataT, RemoteFilePathType, LocalFilePathType, \
-    LocalFileMetaDataType, RemoteFileMetaDataType
+    LocalFileMetaDataType, RemoteFileMetaDataType, DEFAULT_STREAM_CHUNK_SIZE
 from app.Services.storage.exception import LocalFileNotFoundError, RemoteFileNotFoundError, RemoteFilePermissionError, \
     RemoteFileExistsError
 from app.config import config
-from app.util.local_file_utility import VALID_IMAGE_EXTENSIONS
+from app.util.local_file_utility import VALID_IMAGE_EXTENSIONS, iter_local_file
+from app.util.s3_presign import S3Presigner
+
+
+# Every part of a multipart upload except the last one must be at least 5MiB in S3
+S3_UPLOAD_PART_SIZE = 8 * 1024 * 1024
 
 
 def transform_exception(func):
@@ -39,7 +45,7 @@ def transform_exception(func):
 
 
 class S3Storage(BaseStorage[FileMetaDataT: None]):
-    def __init__(self):
+    def __init__(self, cache_service: CacheService | None = None):
         super().__init__()
 
         # Paths
@@ -53,18 +59,39 @@ class S3Storage(BaseStorage[FileMetaDataT: None]):
         self.endpoint = config.storage.s3.endpoint_url
         self.user_endpoint = config.storage.s3.user_endpoint_url
 
+        # The region and the endpoint are read from the environment (e.g. AWS_REGION) by opendal if not configured
+        optional_options = {k: v for k, v in (('region', self.region), ('endpoint', self.endpoint)) if v}
         self.op = (AsyncOperator("s3",
                                  root=str(self.static_dir),
                                  bucket=self.bucket,
-                                 region=self.region,
-                                 endpoint=self.endpoint,
                                  access_key_id=config.storage.s3.access_key_id,
-                                 secret_access_key=config.storage.s3.secret_access_key)
+                                 secret_access_key=config.storage.s3.secret_access_key,
+                                 **optional_options)
                    .layer(RetryLayer(max_times=3, factor=1.5, jitter=False, min_delay=0.05, max_delay=0.2))
                    .layer(MimeGuessLayer()))
 
         self._file_path_str_warp = lambda x: str(PurePosixPath(x))
 
+        # Cache of presigned URLs, reused until a safety margin before they expire
+        self._presign_cache_margin = config.storage.s3.presign_cache_margin
+        self._presign_cache: CacheServiceBase | None = None
+        if config.storage.s3.presign_cache_shared and cache_service is not None and cache_service.enabled:
+            self._presign_cache = cache_service.active_cache
+        elif config.storage.s3.presign_cache_size > 0:
+            self._presign_cache = LocalCache(config.storage.s3.presign_cache_size)
+
+        # Sign the URLs locally instead of via opendal. The URLs are the same as opendal's (path-style requests)
+        self._presigner: S3Presigner | None = None
+        if config.storage.s3.local_presign:
+            if self.region and self.endpoint:
+                self._presigner = S3Presigner(f"{self.endpoint.rstrip('/')}/{self.bucket}", self.region,
+                                              config.storage.s3.access_key_id, config.storage.s3.secret_access_key,
+                                              config.storage.s3.session_token)
+            else:
+                # The region and the endpoint detected by opendal are not exposed, so they can't be used here
+                logger.warning("Local presigning requires both the region and the endpoint url of S3. "
+                               "Falling back to presigning via opendal.")
+
     @staticmethod
     def _file_path_str_wrap(p: RemoteFilePathType):
         return str(PurePosixPath(p))
@@ -89,12 +116,47 @@ class S3Storage(BaseStorage[FileMetaDataT: None]):
                   remote_file: "RemoteFilePathType") -> str:
         return f"{self._res_endpoint}/{str(self.static_dir)}/{str(remote_file)}"
 
-    @transform_exception
     async def presign_url(self,
                           remote_file: "RemoteFilePathType",
                           expire_second: int = 3600) -> str:
-        _presign = await self.op.presign_read(self._file_path_str_warp(remote_file), expire_second)
-        return self.rewrite_s3_presign_url(_presign.url)
+        return (await self.presign_urls([remote_file], expire_second))[0]
+
+    @transform_exception
+    async def presign_urls(self,
+                           remote_files: list["RemoteFilePathType"],
+                           expire_second: int = 3600,
+                           max_concurrency: int = 32) -> list[str]:
+        remote_paths = [self._file_path_str_warp(t) for t in remote_files]
+        cache_ttl = expire_second - self._presign_cache_margin
+        use_cache = self._presign_cache is not None and cache_ttl > 0
+        cache_keys = [f"s3_presign:{self.bucket}:{self.static_dir}:{t}:{expire_second}" for t in remote_paths]
+        urls = list(await asyncio.gather(*[self._presign_cache.get_by_id(t) for t in cache_keys])) \
+            if use_cache else [None] * len(remote_paths)
+
+        missing = [i for i, url in enumerate(urls) if url is None]
+        if not missing:
+            return urls
+        if self._presigner is not None:
+            signed_urls = self._presigner.presign_get([self._object_key(remote_paths[i]) for i in missing],
+                                                      expire_second)
+        else:
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def presign(remote_path: str) -> str:
+                async with semaphore:
+                    return (await self.op.presign_read(remote_path, expire_second)).url
+
+            signed_urls = await asyncio.gather(*[presign(remote_paths[i]) for i in missing])
+        for i, url in zip(missing, signed_urls):
+            urls[i] = self.rewrite_s3_presign_url(url)
+        if use_cache:
+            await asyncio.gather(*[self._presign_cache.set_by_id(cache_keys[i], urls[i], cache_ttl) for i in missing])
+        return urls
+
+    def _object_key(self, remote_path: str) -> str:
+        # The same as how opendal maps a path into the object key under its root
+        root = str(self.static_dir).strip('/')
+        return f"{root}/{remote_path}" if root and root != '.' else remote_path
 
     @transform_exception
     async def fetch(self,
@@ -107,14 +169,57 @@ class S3Storage(BaseStorage[FileMetaDataT: None]):
                      local_file: "LocalFilePathType",
                      remote_file: "RemoteFilePathType") -> None:
         if isinstance(local_file, bytes):
-            b = local_file
+            await self.op.write(self._file_path_str_warp(remote_file), local_file)
         else:
-            async with aiofiles.open(local_file, "rb") as f:
-                b = await f.read()
-        await self.op.write(self._file_path_str_warp(remote_file), b)
+            # Stream the local file, so it's never fully loaded into memory
+            await self._write_stream(iter_local_file(local_file, S3_UPLOAD_PART_SIZE), remote_file)
         local_file = f"{len(local_file)} bytes" if isinstance(local_file, bytes) else local_file
         logger.success(f"Successfully uploaded file {str(local_file)} to {str(remote_file)} via s3_storage.")
 
+    async def fetch_stream(self,
+                           remote_file: "RemoteFilePathType",
+                           chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        path = self._file_path_str_warp(remote_file)
+        try:
+            # Errors of the reader are not typed, so check the existence of the file beforehand
+            await self.op.stat(path)
+            file = await self.op.open(path, "rb")
+            async with file:
+                while chunk := await file.read(chunk_size):
+                    yield chunk
+        except NotFound as ex:
+            raise RemoteFileNotFoundError from ex
+        except PermissionDenied as ex:
+            raise RemoteFilePermissionError from ex
+
+    @transform_exception
+    async def upload_stream(self,
+                            chunks: AsyncIterable[bytes],
+                            remote_file: "RemoteFilePathType") -> None:
+        size = await self._write_stream(chunks, remote_file)
+        logger.success(f"Successfully uploaded {size} bytes to {str(remote_file)} via s3_storage.")
+
+    async def _write_stream(self, chunks: AsyncIterable[bytes], remote_file: "RemoteFilePathType") -> int:
+        """
+        Write the chunks into a remote file, coalesced into parts of at least S3_UPLOAD_PART_SIZE bytes.
+        :return: The size of the file.
+        """
+        file = await self.op.open(self._file_path_str_warp(remote_file), "wb")
+        buffer = bytearray()
+        size = 0
+        async for chunk in chunks:
+            buffer += chunk
+            size += len(chunk)
+            if len(buffer) >= S3_UPLOAD_PART_SIZE:
+                await file.write(bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await file.write(bytes(buffer))
+        # Only close (complete the upload) after all the chunks are written. If the stream is interrupted, the file is
+        # dropped without closing, so no truncated object is created.
+        await file.close()
+        return size
+
     @transform_exception
     async def copy(self,
                    old_remote_file: "RemoteFilePathType",
@@ -147,7 +252,13 @@ class S3Storage(BaseStorage[FileMetaDataT: None]):
         files = []
         # In opendal, current path should be "" instead of "."
         _path = "" if self._file_path_str_warp(path) == "." else self._file_path_str_warp(path)
-        async for itm in await self.op.scan(_path):
+        # Push the literal prefix of the pattern down to the listing, so only the minimal key range is listed. If the
+        # rest of the pattern can't match across directories, the sub-directories aren't listed either.
+        prefix, rest = self._split_glob_prefix(pattern)
+        if prefix.startswith(_path):
+            _path = prefix
+        lister = self.op.list(_path) if "/" not in rest and "**" not in rest else self.op.scan(_path)
+        async for itm in await lister:
             if self._list_files_check(itm.path, pattern, valid_extensions):
                 files.append(PurePosixPath(itm.path))
                 if batch_max_files is not None and len(files) == batch_max_files:
@@ -161,6 +272,16 @@ class S3Storage(BaseStorage[FileMetaDataT: None]):
                               remote_file_metadata: "RemoteFileMetaDataType") -> None:
         raise NotImplementedError
 
+    @staticmethod
+    def _split_glob_prefix(pattern: str) -> tuple[str, str]:
+        """
+        Split a glob pattern into its literal prefix and the rest.
+        """
+        for i, c in enumerate(pattern):
+            if c in "*?[\\":
+                return pattern[:i], pattern[i:]
+        return pattern, ""
+
     @staticmethod
     def _list_files_check(x: str, pattern: str, valid_extensions: Optional[set[str]] = None) -> bool:
         matches_pattern = glob.globmatch(x, pattern, flags=glob.GLOBSTAR)
@@ -1,29 +1,57 @@
 from time import time
 
-import numpy as np
 import torch
 from PIL import Image
 from loguru import logger
 from numpy import ndarray
 from torch import FloatTensor, no_grad
-from transformers import CLIPProcessor, CLIPModel, BertTokenizer, BertModel
+from transformers import CLIPProcessor, CLIPModel, BertTokenizer, BertModel, CLIPImageProcessor
 
 from app.Services.lifespan_service import LifespanService
-from app.config import config
+from app.Services.onnx_models import load_clip_onnx, load_bert_onnx
+from app.Services.quantization import load_quantized_model
+from app.config import config, InferenceBackend
+from app.util.clip_preprocess import ClipImagePreprocessor
 
 
 class TransformersService(LifespanService):
     def __init__(self):
         self.device = config.device
-        if self.device == "auto":
+        self.backend = config.model.backend
+        if self.backend == InferenceBackend.ONNX:
+            if self.device not in ("auto", "cpu"):
+                logger.warning("ONNX backend only supports CPU inference. Device {} is ignored.", self.device)
+            self.device = "cpu"
+        elif self.device == "auto":
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        logger.info("Using device: {}; CLIP Model: {}, BERT Model: {}",
-                    self.device, config.model.clip, config.model.bert)
-        self._clip_model = CLIPModel.from_pretrained(config.model.clip).to(self.device)
+        self.quantize = config.model.quantize
+        if self.quantize and self.device != "cpu":
+            logger.warning("Dynamic quantization only supports CPU inference. Quantization is disabled.")
+            self.quantize = False
+        logger.info("Using device: {}, backend: {}, quantize: {}; CLIP Model: {}, BERT Model: {}",
+                    self.device, self.backend.value, self.quantize, config.model.clip, config.model.bert)
+        if self.backend == InferenceBackend.ONNX:
+            self._clip_image_onnx, self._clip_text_onnx = load_clip_onnx(config.model.clip, config.model.onnx_path,
+                                                                         config.model.onnx_threads, self.quantize)
+        elif self.quantize:
+            self._clip_model = load_quantized_model(CLIPModel, config.model.clip, config.model.quantized_path)
+        else:
+            self._clip_model = CLIPModel.from_pretrained(config.model.clip).to(self.device)
         self._clip_processor = CLIPProcessor.from_pretrained(config.model.clip)
+        try:
+            self._image_preprocessor = ClipImagePreprocessor(CLIPImageProcessor.from_pretrained(config.model.clip))
+        except ValueError as ex:
+            logger.warning("Fast image preprocessing is not supported by the CLIP model: {}", ex)
+            self._image_preprocessor = None
         logger.success("CLIP Model loaded successfully")
         if config.ocr_search.enable:
-            self._bert_model = BertModel.from_pretrained(config.model.bert).to(self.device)
+            if self.backend == InferenceBackend.ONNX:
+                self._bert_onnx = load_bert_onnx(config.model.bert, config.model.onnx_path, config.model.onnx_threads,
+                                                 self.quantize)
+            elif self.quantize:
+                self._bert_model = load_quantized_model(BertModel, config.model.bert, config.model.quantized_path)
+            else:
+                self._bert_model = BertModel.from_pretrained(config.model.bert).to(self.device)
             self._bert_tokenizer = BertTokenizer.from_pretrained(config.model.bert)
             logger.success("BERT Model loaded successfully")
         else:
@@ -31,40 +59,61 @@ class TransformersService(LifespanService):
 
     @no_grad()
     def get_image_vector(self, image: Image.Image) -> ndarray:
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-        logger.info("Processing image...")
+        return self.get_image_vector_batch([image])[0]
+
+    @no_grad()
+    def get_image_vector_batch(self, images: list[Image.Image]) -> ndarray:
+        images = [image if image.mode == "RGB" else image.convert("RGB") for image in images]
+        logger.info("Processing {} image(s)...", len(images))
         start_time = time()
-        inputs = self._clip_processor(images=image, return_tensors="pt").to(self.device)
+        if self._image_preprocessor is not None:
+            inputs = {'pixel_values': self._image_preprocessor(images, self.device)}
+        else:
+            inputs = self._clip_processor(images=images, return_tensors="pt").to(self.device)
         logger.success("Image processed, now Inferring with CLIP model...")
-        outputs: FloatTensor = self._clip_model.get_image_features(**inputs)
+        if self.backend == InferenceBackend.ONNX:
+            outputs = torch.from_numpy(self._clip_image_onnx(pixel_values=inputs['pixel_values'].numpy()))
+        else:
+            outputs: FloatTensor = self._clip_model.get_image_features(**inputs)
         logger.success("Inference done. Time elapsed: {:.2f}s", time() - start_time)
         outputs /= outputs.norm(dim=-1, keepdim=True)
-        return outputs.numpy(force=True).reshape(-1)
+        return outputs.numpy(force=True)
 
     @no_grad()
     def get_text_vector(self, text: str) -> ndarray:
-        logger.info("Processing text...")
+        return self.get_text_vector_batch([text])[0]
+
+    @no_grad()
+    def get_text_vector_batch(self, texts: list[str]) -> ndarray:
+        logger.info("Processing {} text(s)...", len(texts))
         start_time = time()
-        inputs = self._clip_processor(text=text, return_tensors="pt").to(self.device)
+        inputs = self._clip_processor(text=texts, return_tensors="pt", padding=True, truncation=True).to(self.device)
         logger.success("Text processed, now Inferring with CLIP model...")
-        outputs: FloatTensor = self._clip_model.get_text_features(**inputs)
+        if self.backend == InferenceBackend.ONNX:
+            outputs = torch.from_numpy(self._clip_text_onnx(**{k: v.numpy() for k, v in inputs.items()}))
+        else:
+            outputs: FloatTensor = self._clip_model.get_text_features(**inputs)
         logger.success("Inference done. Time elapsed: {:.2f}s", time() - start_time)
         outputs /= outputs.norm(dim=-1, keepdim=True)
-        return outputs.numpy(force=True).reshape(-1)
+        return outputs.numpy(force=True)
 
     @no_grad()
     def get_bert_vector(self, text: str) -> ndarray:
+        return self.get_bert_vector_batch([text])[0]
+
+    @no_grad()
+    def get_bert_vector_batch(self, texts: list[str]) -> ndarray:
         start_time = time()
-        logger.info("Inferring with BERT model...")
-        inputs = self._bert_tokenizer(text.strip().lower(), return_tensors="pt", truncation=True).to(self.device)
-        outputs = self._bert_model(**inputs)
-        vector = outputs.last_hidden_state.mean(dim=1).squeeze()
+        logger.info("Inferring {} text(s) with BERT model...", len(texts))
+        inputs = self._bert_tokenizer([t.strip().lower() for t in texts], return_tensors="pt", truncation=True,
+                                      padding=True).to(self.device)
+        if self.backend == InferenceBackend.ONNX:
+            # Mean pooling is included in the exported graph
+            vectors = torch.from_numpy(self._bert_onnx(**{k: v.numpy() for k, v in inputs.items()}))
+        else:
+            outputs = self._bert_model(**inputs)
+            # Mean pooling over the non-padding tokens, so the result is independent of other texts in the batch
+            mask = inputs['attention_mask'].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+            vectors = (outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
         logger.success("BERT inference done. Time elapsed: {:.2f}s", time() - start_time)
-        return vector.cpu().numpy()
-
-    @staticmethod
-    def get_random_vector(seed: int | None = None) -> ndarray:
-        generator = np.random.default_rng(seed)
-        vec = generator.uniform(-1, 1, 768)
-        return vec
+        return vectors.cpu().numpy()
@@ -2,7 +2,10 @@ import asyncio
 import gc
 import io
 import pathlib
-from io import BytesIO
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from uuid import UUID
 
 from PIL import Image
 from loguru import logger
@@ -13,9 +16,29 @@ from app.Models.mapped_image import MappedImage
 from app.Services.index_service import IndexService
 from app.Services.lifespan_service import LifespanService
 from app.Services.storage import StorageService
+from app.Services.upload_spool import UploadSpool, UploadSpoolEntry
 from app.Services.vector_db_context import VectorDbContext
 from app.config import config
 from app.util.generate_uuid import generate_uuid
+from app.util.image_decode import decode_image
+from app.util.thumbnail import generate_thumbnail
+
+UPSERT_RETRY_MAX_DELAY = 60
+
+
+@dataclass
+class UploadWorkerStats:
+    worker_id: int
+    processed: int = 0
+    failed: int = 0
+    busy_seconds: float = 0
+
+    @property
+    def throughput(self) -> float:
+        """
+        Images processed per busy second.
+        """
+        return self.processed / self.busy_seconds if self.busy_seconds else 0
 
 
 class UploadService(LifespanService):
@@ -24,67 +47,202 @@ class UploadService(LifespanService):
         self._db_context = db_context
         self._index_service = index_service
 
-        self._queue = asyncio.Queue(config.admin_index_queue_max_length)
-        self._upload_worker_task = asyncio.create_task(self._upload_worker())
+        # Only the metadata of spooled images is kept in memory, so the queue can be much deeper
+        self._queue = asyncio.Queue(config.admin_index_spool_queue_max_length if config.admin_index_spool_dir
+                                    else config.admin_index_queue_max_length)
+        # Shared by all the workers for CPU bound preparation, e.g. decoding and thumbnail generation
+        self._executor = ThreadPoolExecutor(max_workers=config.indexing.preprocess_workers,
+                                            thread_name_prefix="upload_preprocess")
+        self._worker_stats = [UploadWorkerStats(i) for i in range(max(config.admin_index_workers, 1))]
+
+        # Write-behind buffer of the indexed images, which are inserted into database in batches
+        self._upsert_buffer: list[MappedImage] = []
+        self._upsert_lock = asyncio.Lock()
+        self._upsert_failures = 0  # Consecutive failed flushes, for the backoff of retrying
+        self._upsert_retry_at = 0.0
+
+        # Spool the queued images to disk if enabled, so only their metadata is kept in memory
+        self._spool = UploadSpool(config.admin_index_spool_dir) if config.admin_index_spool_dir else None
+        self._replay_task: asyncio.Task | None = None
 
         self.uploading_ids = set()
         self._processed_count = 0
 
-    async def _upload_worker(self):
+        # Start the background tasks only after all the states above are initialized
+        self._upload_worker_tasks = [asyncio.create_task(self._upload_worker(t)) for t in self._worker_stats]
+        self._flush_task = asyncio.create_task(self._flush_worker())
+
+    async def on_load(self):
+        if self._spool is None:
+            return
+        entries = await asyncio.to_thread(self._spool.load_pending)
+        if entries:
+            logger.warning("Found {} pending images in the upload spool. Adding them to the upload queue.",
+                           len(entries))
+            self.uploading_ids.update(t.mapped_image.id for t in entries)
+            self._replay_task = asyncio.create_task(self._replay_spool(entries))
+
+    async def _replay_spool(self, entries: list[UploadSpoolEntry]):
+        for entry in entries:
+            await self._queue.put((entry.mapped_image, None, entry.skip_ocr, entry.thumbnail_mode))
+        logger.success("{} images replayed from the upload spool.", len(entries))
+
+    async def _upload_worker(self, stats: UploadWorkerStats):
         while True:
-            img_data, *args = await self._queue.get()
+            img_data, img_bytes, *args = await self._queue.get()
+            start_time = time.perf_counter()
             try:
-                await self._upload_task(img_data, *args)
-                logger.success("Image {} uploaded and indexed. Queue Length: {} [-1]", img_data.id, self._queue.qsize())
+                # Spooled images are read from the spool file directly, so they are never fully loaded into memory
+                img_file = self._spool.content_path(img_data.id) if img_bytes is None else img_bytes
+                await self._upload_task(img_data, img_file, *args)
             except Exception as ex:
+                stats.failed += 1
                 logger.error("Error occurred while uploading image {}", img_data.id)
                 logger.exception(ex)
+                self.uploading_ids.discard(img_data.id)
+                if self._spool is not None:
+                    await self._spool.remove([img_data.id])
+            else:
+                stats.processed += 1
+                logger.success("Image {} uploaded and indexed by worker {}. Queue Length: {} [-1]",
+                               img_data.id, stats.worker_id, self._queue.qsize())
+                # The ID is kept in uploading_ids until the point is inserted into database. Errors after this point
+                # are not upload failures: the image stays in the buffer (and in the spool) to be retried.
+                try:
+                    await self._buffer_upsert(img_data)
+                except Exception as ex:
+                    logger.error("Error occurred while buffering image {} for database insertion", img_data.id)
+                    logger.exception(ex)
             finally:
+                stats.busy_seconds += time.perf_counter() - start_time
                 self._queue.task_done()
-                self.uploading_ids.remove(img_data.id)
                 self._processed_count += 1
                 if self._processed_count % 50 == 0:
                     gc.collect()
 
-    async def _upload_task(self, mapped_img: MappedImage, img_bytes: bytes, skip_ocr: bool,
-                           thumbnail_mode: UploadImageThumbnailMode):
-        img = Image.open(BytesIO(img_bytes))
-        logger.info('Start indexing image {}. Local: {}. Size: {}', mapped_img.id, mapped_img.local, len(img_bytes))
-        file_name = f"{mapped_img.id}.{mapped_img.format}"
-        thumb_path = f"thumbnails/{mapped_img.id}.webp"
+    async def _buffer_upsert(self, mapped_img: MappedImage):
+        self._upsert_buffer.append(mapped_img)
+        # Flush immediately if there is nothing more to wait for, so that the latency is not increased when idle
+        if len(self._upsert_buffer) >= config.indexing.upsert_batch_size or self._queue.empty():
+            await self.flush_upserts()
+
+    async def _flush_worker(self):
+        while True:
+            await asyncio.sleep(config.indexing.upsert_flush_interval)
+            await self.flush_upserts()
+
+    async def flush_upserts(self, force=False) -> bool:
+        """
+        Insert all the buffered images into database. If the insertion fails, the images are kept in the buffer (and
+        in the spool) with their uploading status, and retried with exponential backoff.
+        :param force: Whether to flush even if waiting for the backoff of retrying.
+        :return: Whether the buffer is empty after flushing.
+        """
+        async with self._upsert_lock:
+            if not self._upsert_buffer:
+                return True
+            if not force and time.monotonic() < self._upsert_retry_at:
+                return False
+            items, self._upsert_buffer = self._upsert_buffer, []
+            try:
+                # Without upsert_wait, this returns once the write is acknowledged by the database
+                await self._db_context.insert_items(items, wait=config.indexing.upsert_wait)
+            except asyncio.CancelledError:
+                # Keep the images for the final flush on exit
+                self._upsert_buffer = items + self._upsert_buffer
+                raise
+            except Exception as ex:
+                self._upsert_buffer = items + self._upsert_buffer
+                self._upsert_failures += 1
+                delay = min(config.indexing.upsert_flush_interval * 2 ** self._upsert_failures,
+                            UPSERT_RETRY_MAX_DELAY)
+                self._upsert_retry_at = time.monotonic() + delay
+                logger.error("Error occurred while inserting {} images into database. Retrying in {:.1f}s.",
+                             len(items), delay)
+                logger.exception(ex)
+                return False
+            logger.success("{} images inserted into database.", len(items))
+            self._upsert_failures = 0
+            self._upsert_retry_at = 0.0
+            # Not in finally block: if cancelled on exit, the spooled images will be replayed after restart
+            for item in items:
+                self.uploading_ids.discard(item.id)
+            if self._spool is not None:
+                try:
+                    await self._spool.remove([t.id for t in items])
+                except OSError as ex:
+                    # The points are already inserted, the leftover entries are only indexed again after restart
+                    logger.warning("Failed to remove {} inserted images from the upload spool: {}", len(items), ex)
+            return not self._upsert_buffer
+
+    async def _prepare_upload(self, mapped_img: MappedImage, img_size: int,
+                              thumbnail_mode: UploadImageThumbnailMode) -> bool:
+        """
+        Fill the storage related fields of the mapped image.
+        :return: Whether a thumbnail should be generated for the image.
+        """
         gen_thumb = thumbnail_mode == UploadImageThumbnailMode.ALWAYS or (
-                thumbnail_mode == UploadImageThumbnailMode.IF_NECESSARY and len(img_bytes) > 1024 * 500)
+                thumbnail_mode == UploadImageThumbnailMode.IF_NECESSARY and img_size > 1024 * 500)
 
         if mapped_img.local:
-            mapped_img.url = await self._storage_service.active_storage.url(file_name)
+            mapped_img.url = await self._storage_service.active_storage.url(f"{mapped_img.id}.{mapped_img.format}")
         if gen_thumb:
             mapped_img.thumbnail_url = await self._storage_service.active_storage.url(
                 f"thumbnails/{mapped_img.id}.webp")
             mapped_img.local_thumbnail = True
+        return gen_thumb
 
-        await self._index_service.index_image(img, mapped_img, skip_ocr=skip_ocr, background=True)
-        logger.success("Image {} indexed.", mapped_img.id)
-
+    async def _store_files(self, mapped_img: MappedImage, img: Image.Image, img_file: bytes | pathlib.Path,
+                           gen_thumb: bool):
+        file_name = f"{mapped_img.id}.{mapped_img.format}"
+        thumb_path = f"thumbnails/{mapped_img.id}.webp"
         if mapped_img.local:
             logger.info("Start uploading image {} to local storage.", mapped_img.id)
-            await self._storage_service.active_storage.upload(img_bytes, file_name)
+            await self._storage_service.active_storage.upload(img_file, file_name)
             logger.success("Image {} uploaded to local storage.", mapped_img.id)
         if gen_thumb:
             logger.info("Start generate and upload thumbnail for {}.", mapped_img.id)
-            img.thumbnail((256, 256), resample=Image.Resampling.LANCZOS)
-            img_byte_arr = BytesIO()
-            img.save(img_byte_arr, 'WebP', save_all=True)
-            await self._storage_service.active_storage.upload(img_byte_arr.getvalue(), thumb_path)
+            thumb_bytes = await asyncio.get_running_loop().run_in_executor(self._executor, generate_thumbnail, img)
+            await self._storage_service.active_storage.upload(thumb_bytes, thumb_path)
             logger.success("Thumbnail for {} generated and uploaded!", mapped_img.id)
 
-        img.close()
+    async def _upload_task(self, mapped_img: MappedImage, img_file: bytes | pathlib.Path, skip_ocr: bool,
+                           thumbnail_mode: UploadImageThumbnailMode):
+        """
+        Index and store an image.
+        :param img_file: The content of the image, or the path to a local file containing it. A local file is decoded
+         and uploaded without being fully loaded into memory.
+        """
+        img_size = len(img_file) if isinstance(img_file, bytes) else img_file.stat().st_size
+        # The image is decoded only once, at the minimal resolution required by inferring, OCR and thumbnail
+        img, original_size = await asyncio.get_running_loop().run_in_executor(
+            self._executor, decode_image, img_file, self._index_service.decode_size(skip_ocr))
+        try:
+            logger.info('Start indexing image {}. Local: {}. Size: {}', mapped_img.id, mapped_img.local, img_size)
+            gen_thumb = await self._prepare_upload(mapped_img, img_size, thumbnail_mode)
+
+            await self._index_service.prepare_image(img, mapped_img, skip_ocr=skip_ocr, executor=self._executor,
+                                                    original_size=original_size)
+            logger.success("Image {} indexed.", mapped_img.id)
+
+            await self._store_files(mapped_img, img, img_file, gen_thumb)
+        finally:
+            img.close()
 
     async def queue_upload_image(self, mapped_img: MappedImage, img_bytes: bytes, skip_ocr: bool,
                                  thumbnail_mode: UploadImageThumbnailMode):
         self.uploading_ids.add(mapped_img.id)
-        await self._queue.put((mapped_img, img_bytes, skip_ocr, thumbnail_mode))
+        await self._queue.put(await self._spool_item((mapped_img, img_bytes, skip_ocr, thumbnail_mode)))
         logger.success("Image {} added to upload queue. Queue Length: {} [+1]", mapped_img.id, self._queue.qsize())
 
+    async def _spool_item(self, item: tuple[MappedImage, bytes, bool, UploadImageThumbnailMode]):
+        if self._spool is None:
+            return item
+        mapped_img, img_bytes, skip_ocr, thumbnail_mode = item
+        await self._spool.put(UploadSpoolEntry(mapped_image=mapped_img, skip_ocr=skip_ocr,
+                                               thumbnail_mode=thumbnail_mode), img_bytes)
+        return mapped_img, None, skip_ocr, thumbnail_mode
+
     async def assign_image_id(self, img_file: pathlib.Path | io.BytesIO | bytes):
         img_id = generate_uuid(img_file)
         # check for duplicate points
@@ -94,15 +252,99 @@ class UploadService(LifespanService):
                                       img_id)
         return img_id
 
+    async def queue_upload_images(self, items: list[tuple[MappedImage, bytes, bool, UploadImageThumbnailMode]]):
+        """
+        Add a batch of images to the upload queue. All the IDs are marked as uploading before any of them is queued.
+        """
+        self.uploading_ids.update(t[0].id for t in items)
+        for item in items:
+            await self._queue.put(await self._spool_item(item))
+        logger.success("{} images added to upload queue. Queue Length: {} [+{}]", len(items), self._queue.qsize(),
+                       len(items))
+
+    async def assign_image_ids(self, img_files: list[pathlib.Path | io.BytesIO | bytes]) -> list[tuple[UUID, bool]]:
+        """
+        Generate IDs for a batch of images, and check for duplicate points with a single database query.
+        :return: The ID of each image, and whether it's a duplicate of an existing image, an image being uploaded or
+         a previous image in the same batch.
+        """
+        img_ids = [generate_uuid(t) for t in img_files]
+        existing_ids = set(await self._db_context.validate_ids(list({str(t) for t in img_ids})))
+        result = []
+        seen_ids = set()
+        for img_id in img_ids:
+            duplicate = img_id in seen_ids or img_id in self.uploading_ids or str(img_id) in existing_ids
+            if duplicate:
+                logger.warning("Duplicate upload request for image id: {}", img_id)
+            seen_ids.add(img_id)
+            result.append((img_id, duplicate))
+        return result
+
     async def sync_upload_image(self, mapped_img: MappedImage, img_bytes: bytes, skip_ocr: bool,
                                 thumbnail_mode: UploadImageThumbnailMode):
         await self._upload_task(mapped_img, img_bytes, skip_ocr, thumbnail_mode)
+        await self._db_context.insert_items([mapped_img])
+
+    async def store_image(self, mapped_img: MappedImage, img: Image.Image, img_bytes: bytes,
+                          thumbnail_mode: UploadImageThumbnailMode):
+        """
+        Store the image file and its thumbnail (if necessary) to the storage, and fill the related fields of the mapped
+        image. The mapped image should be inserted into the database afterward.
+        """
+        gen_thumb = await self._prepare_upload(mapped_img, len(img_bytes), thumbnail_mode)
+        await self._store_files(mapped_img, img, img_bytes, gen_thumb)
+
+    async def sync_upload_image_batch(self, mapped_imgs: list[MappedImage], img_bytes: list[bytes], skip_ocr: bool,
+                                      thumbnail_mode: UploadImageThumbnailMode):
+        """
+        Index and store a batch of images. The images are inferred in batches and inserted with a single upsert.
+        """
+        decode_size = self._index_service.decode_size(skip_ocr)
+        decoded = await asyncio.gather(*[asyncio.get_running_loop().run_in_executor(
+            self._executor, decode_image, t, decode_size) for t in img_bytes])
+        imgs = [t[0] for t in decoded]
+        try:
+            logger.info('Start indexing {} images.', len(imgs))
+            gen_thumbs = [await self._prepare_upload(mapped_img, len(img_byte), thumbnail_mode)
+                          for mapped_img, img_byte in zip(mapped_imgs, img_bytes)]
+            await self._index_service.index_image_batch(imgs, mapped_imgs, skip_ocr=skip_ocr, background=True,
+                                                        original_sizes=[t[1] for t in decoded])
+            logger.success("{} images indexed.", len(imgs))
+
+            for mapped_img, img, img_byte, gen_thumb in zip(mapped_imgs, imgs, img_bytes, gen_thumbs):
+                await self._store_files(mapped_img, img, img_byte, gen_thumb)
+        finally:
+            for img in imgs:
+                img.close()
 
     def get_queue_size(self):
         return self._queue.qsize()
 
+    def get_worker_stats(self) -> list[UploadWorkerStats]:
+        return self._worker_stats
+
     async def on_exit(self):  # pragma: no cover  Hard to test in UT.
-        if self.get_queue_size() != 0:
-            logger.warning("There are still {} images in the upload queue. Waiting for upload process to be completed.",
-                           self.get_queue_size())
-        await self._queue.join()
+        if self._spool is not None:
+            # The pending images are kept in the spool and will be processed after restart
+            if self.get_queue_size() != 0:
+                logger.warning("There are still {} images in the upload queue. They will be processed after restart.",
+                               self.get_queue_size())
+            if self._replay_task is not None:
+                self._replay_task.cancel()
+        else:
+            if self.get_queue_size() != 0:
+                logger.warning("There are still {} images in the upload queue. Waiting for upload process to be "
+                               "completed.", self.get_queue_size())
+            await self._queue.join()
+        # A cancelled insertion puts its images back into the buffer, so they are flushed below
+        for task in [*self._upload_worker_tasks, self._flush_task]:
+            task.cancel()
+        await asyncio.gather(*self._upload_worker_tasks, self._flush_task, return_exceptions=True)
+        if not await self.flush_upserts(force=True):
+            if self._spool is not None:
+                logger.warning("{} indexed images are not inserted into database. They will be processed after "
+                               "restart.", len(self._upsert_buffer))
+            else:
+                logger.error("{} indexed images are lost since they can't be inserted into database.",
+                             len(self._upsert_buffer))
+        self._executor.shutdown(wait=False)
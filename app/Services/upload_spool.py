@@ -0,0 +1,81 @@
+import asyncio
+import os
+from pathlib import Path
+from uuid import UUID
+
+from loguru import logger
+from pydantic import BaseModel
+
+from app.Models.api_models.admin_query_params import UploadImageThumbnailMode
+from app.Models.mapped_image import MappedImage
+
+
+class UploadSpoolEntry(BaseModel):
+    mapped_image: MappedImage
+    skip_ocr: bool
+    thumbnail_mode: UploadImageThumbnailMode
+
+
+class UploadSpool:
+    """
+    Spool of the upload queue in a local directory, so only the metadata of the queued images is kept in memory, and
+    the pending images can be replayed after a restart.
+    Each image is stored as `{id}.bin` (the file content) and `{id}.json` (the metadata). The metadata file is
+    written atomically after the content file, so an entry is valid only if its metadata file exists.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self._path = Path(path)
+        self._path.mkdir(parents=True, exist_ok=True)
+
+    def content_path(self, img_id: UUID) -> Path:
+        """
+        Path of the spooled file content, which is valid until the entry is removed.
+        """
+        return self._path / f"{img_id}.bin"
+
+    def _metadata_path(self, img_id: UUID) -> Path:
+        return self._path / f"{img_id}.json"
+
+    def _write(self, entry: UploadSpoolEntry, img_bytes: bytes):
+        img_id = entry.mapped_image.id
+        self.content_path(img_id).write_bytes(img_bytes)
+        tmp_path = self._path / f"{img_id}.json.tmp"
+        tmp_path.write_text(entry.model_dump_json(), encoding='utf-8')
+        os.replace(tmp_path, self._metadata_path(img_id))
+
+    def _remove(self, img_ids: list[UUID]):
+        for img_id in img_ids:
+            # Remove the metadata first, so a partially removed entry is never replayed
+            self._metadata_path(img_id).unlink(missing_ok=True)
+            self.content_path(img_id).unlink(missing_ok=True)
+
+    async def put(self, entry: UploadSpoolEntry, img_bytes: bytes):
+        await asyncio.to_thread(self._write, entry, img_bytes)
+
+    async def remove(self, img_ids: list[UUID]):
+        await asyncio.to_thread(self._remove, img_ids)
+
+    def load_pending(self) -> list[UploadSpoolEntry]:
+        """
+        Load all the valid entries in the spool, ordered by their index date. Incomplete entries are removed.
+        """
+        entries = []
+        for metadata_path in self._path.glob('*.json'):
+            try:
+                entry = UploadSpoolEntry.model_validate_json(metadata_path.read_text(encoding='utf-8'))
+                if not self.content_path(entry.mapped_image.id).exists():
+                    raise FileNotFoundError(f"Content of spooled image {entry.mapped_image.id} not found.")
+            except (ValueError, OSError) as ex:
+                logger.warning("Invalid upload spool entry {} removed: {}", metadata_path.name, ex)
+                metadata_path.unlink(missing_ok=True)
+                continue
+            entries.append(entry)
+        valid_ids = {str(t.mapped_image.id) for t in entries}
+        for path in self._path.glob('*.bin'):
+            if path.stem not in valid_ids:
+                path.unlink(missing_ok=True)
+        for path in self._path.glob('*.tmp'):
+            path.unlink(missing_ok=True)
+        entries.sort(key=lambda t: t.mapped_image.index_date)
+        return entries
@@ -1,3 +1,6 @@
+import asyncio
+import random
+
 import numpy
 from grpc.aio import AioRpcError
 from httpx import HTTPError
@@ -13,7 +16,7 @@ from app.Models.mapped_image import MappedImage
 from app.Models.query_params import FilterParams
 from app.Models.search_result import SearchResult
 from app.Services.lifespan_service import LifespanService
-from app.config import config, QdrantMode
+from app.config import config, QdrantMode, QdrantQuantization
 from app.util.retry_deco_async import wrap_object, retry_async
 
 
@@ -27,6 +30,8 @@ class VectorDbContext(LifespanService):
     IMG_VECTOR = "image_vector"
     TEXT_VECTOR = "text_contain_vector"
     AVAILABLE_POINT_TYPES = models.Record | models.ScoredPoint | models.PointStruct
+    # The fields required to construct the image and to build its URLs, which are retrieved even if not projected
+    BASE_PAYLOAD_FIELDS = frozenset({'index_date', 'url', 'thumbnail_url', 'local', 'local_thumbnail', 'format'})
 
     def __init__(self):
         match config.qdrant.mode:
@@ -44,28 +49,37 @@ class VectorDbContext(LifespanService):
             case _:
                 raise ValueError("Invalid Qdrant mode.")
         self.collection_name = config.qdrant.coll
+        self._backfill_task: asyncio.Task | None = None
 
     async def on_load(self):
         if not await self.check_collection():
             logger.warning("Collection not found. Initializing...")
             await self.initialize_collection()
+        await self.ensure_payload_indexes()
+        # Backfilling a large database takes a while, so it runs in background without blocking the startup
+        self._backfill_task = asyncio.create_task(self._backfill_random_keys_in_background())
+
+    async def on_exit(self):
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
 
-    async def retrieve_by_id(self, image_id: str, with_vectors=False) -> MappedImage:
+    async def retrieve_by_id(self, image_id: str, with_vectors=False, fields: set[str] | None = None) -> MappedImage:
         """
         Retrieve an item from database by id. Will raise PointNotFoundError if the given ID doesn't exist.
         :param image_id: The ID to retrieve.
         :param with_vectors: Whether to retrieve vectors.
+        :param fields: The fields of the item to retrieve. All the fields if None.
         :return: The retrieved item.
         """
         logger.info("Retrieving item {} from database...", image_id)
         result = await self._client.retrieve(collection_name=self.collection_name,
                                              ids=[image_id],
-                                             with_payload=True,
+                                             with_payload=self._get_payload_selector(fields),
                                              with_vectors=with_vectors)
         if len(result) != 1:
             logger.error("Point not exist.")
             raise PointNotFoundError(image_id)
-        return self._get_mapped_image_from_point(result[0])
+        return self._get_mapped_image_from_point(result[0], fields)
 
     async def retrieve_by_ids(self, image_id: list[str], with_vectors=False) -> list[MappedImage]:
         """
@@ -125,19 +139,39 @@ class VectorDbContext(LifespanService):
                 nearest=map_criteria(basis.positive[0]),
             )
 
-    async def query_search(self, query: DbQuery, top_k=10, skip=0, filter_param: FilterParams | None = None) -> list[
-        SearchResult]:
+    async def query_search(self, query: DbQuery, top_k=10, skip=0, filter_param: FilterParams | None = None,
+                           fields: set[str] | None = None) -> list[SearchResult]:
         """
         Query the database with a unified query object.
         :param query: The query object containing the query vector and basis.
         :param top_k: The number of results to return.
         :param skip: The number of results to skip.
         :param filter_param: Optional filter parameters to apply to the query.
+        :param fields: The fields of the items to retrieve. All the fields if None.
         :return: A list of SearchResult objects.
         """
+        points = await self._query_points(query, top_k, skip, filter_param,
+                                          with_payload=self._get_payload_selector(fields))
+        return [self._get_search_result_from_scored_point(t, fields) for t in points]
+
+    async def query_search_ids(self, query: DbQuery, top_k=10, filter_param: FilterParams | None = None) \
+            -> list[tuple[str, float]]:
+        """
+        Query the database with a unified query object, without retrieving the payloads.
+        :param query: The query object containing the query vector and basis.
+        :param top_k: The number of results to return.
+        :param filter_param: Optional filter parameters to apply to the query.
+        :return: The IDs and scores of the results, in ranked order.
+        """
+        points = await self._query_points(query, top_k, 0, filter_param, with_payload=False)
+        return [(str(t.id), t.score) for t in points]
+
+    async def _query_points(self, query: DbQuery, top_k: int, skip: int, filter_param: FilterParams | None,
+                            with_payload: bool | list[str]) -> list[models.ScoredPoint]:
         logger.info("Starting unified search with {} criteria basis, top_k={}, skip={}",
                     len(query.criteria), top_k, skip)
         filters = self._get_filters_by_filter_param(filter_param)
+        search_params = self._get_search_params()
         if len(query.criteria) > 1:
             # Hybrid search with RRF
             logger.info("Performing hybrid search with RRF fusion across {} criteria", len(query.criteria))
@@ -145,6 +179,7 @@ class VectorDbContext(LifespanService):
                 query=self._convert_basis_to_qdrant_query(v),
                 using=self.vector_name_for_basis(k),
                 filter=filters,
+                params=search_params,
                 limit=(top_k + skip) * 2  # Increase limit to improve RRF fusion results
             ) for (k, v) in query.criteria.items()]
 
@@ -154,7 +189,7 @@ class VectorDbContext(LifespanService):
                 query=FusionQuery(fusion=models.Fusion.RRF),
                 limit=top_k,
                 offset=skip,
-                with_payload=True
+                with_payload=with_payload
             )
         else:
             # Normal search
@@ -165,20 +200,116 @@ class VectorDbContext(LifespanService):
                 query=self._convert_basis_to_qdrant_query(criteria),
                 using=self.vector_name_for_basis(basis),
                 query_filter=filters,
+                search_params=search_params,
                 limit=top_k,
                 offset=skip,
-                with_payload=True
+                with_payload=with_payload
             )
         logger.success("Search completed! Found {} points.", len(result.points))
-        return [self._get_search_result_from_scored_point(t) for t in result.points]
+        return result.points
 
-    async def insert_items(self, items: list[MappedImage]):
+    async def retrieve_search_results(self, ranked_ids: list[tuple[str, float]],
+                                      fields: set[str] | None = None) -> list[SearchResult]:
+        """
+        Retrieve the items of ranked search results by IDs. Items deleted after the search are skipped.
+        :param ranked_ids: The IDs and scores of the results, in ranked order.
+        :param fields: The fields of the items to retrieve. All the fields if None.
+        :return: The list of SearchResult objects, in the same order as the given IDs.
+        """
+        if not ranked_ids:
+            return []
+        result = await self._client.retrieve(collection_name=self.collection_name,
+                                             ids=[t[0] for t in ranked_ids],
+                                             with_payload=self._get_payload_selector(fields),
+                                             with_vectors=False)
+        images = {str(t.id): self._get_mapped_image_from_point(t, fields) for t in result}
+        return [SearchResult(img=images[image_id], score=score) for image_id, score in ranked_ids
+                if image_id in images]
+
+    async def random_pick(self, count=10, skip=0, filter_param: FilterParams | None = None,
+                          seed: int | None = None, fields: set[str] | None = None) -> list[SearchResult]:
+        """
+        Uniformly sample items from the database, by scrolling the range index of the random key of the items from a
+        random starting point, and wrapping around to the beginning of the key space if needed.
+        :param count: The number of items to sample.
+        :param skip: The number of items to skip, to get the following pages of the same seed.
+        :param filter_param: Optional filter parameters to apply to the sampling.
+        :param seed: The seed of the starting point. The same seed yields the same items, unless the database changes.
+        :param fields: The fields of the items to retrieve. All the fields if None.
+        :return: A list of SearchResult objects, the score of which is the random key of the item.
+        """
+        start = random.Random(seed).random()
+        logger.info("Random picking {} items from random key {}, skip={}", count, start, skip)
+        filters = self._get_filters_by_filter_param(filter_param)
+        with_payload = self._get_payload_selector(fields, 'random_key')
+        limit = skip + count
+        points = await self._scroll_by_random_key(filters, models.Range(gte=start), limit, with_payload)
+        if len(points) < limit:
+            points += await self._scroll_by_random_key(filters, models.Range(lt=start), limit - len(points),
+                                                       with_payload)
+        return [SearchResult(img=self._get_mapped_image_from_point(t, fields), score=t.payload['random_key'])
+                for t in points[skip:]]
+
+    async def _scroll_by_random_key(self, filters: models.Filter | None, key_range: models.Range, limit: int,
+                                    with_payload: bool | list[str]) -> list[models.Record]:
+        key_condition = models.FieldCondition(key='random_key', range=key_range)
+        resp, _ = await self._client.scroll(collection_name=self.collection_name,
+                                            scroll_filter=models.Filter(
+                                                must=[key_condition, *(filters.must if filters else [])],
+                                                must_not=filters.must_not if filters else None),
+                                            order_by=models.OrderBy(key='random_key',
+                                                                    direction=models.Direction.ASC),
+                                            limit=limit,
+                                            with_payload=with_payload,
+                                            with_vectors=False)
+        return resp
+
+    async def backfill_random_keys(self, batch_size=256) -> int:
+        """
+        Assign random keys to the items stored by older versions without them, which are never returned by random_pick.
+        :param batch_size: The number of items to update with a single request.
+        :return: The number of the updated items.
+        """
+        key_filter = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key='random_key'))])
+        count = 0
+        while True:
+            # The updated items no longer match the filter, so scrolling from the beginning finds the remaining ones
+            points, _ = await self._client.scroll(collection_name=self.collection_name,
+                                                  scroll_filter=key_filter,
+                                                  limit=batch_size,
+                                                  with_payload=False,
+                                                  with_vectors=False)
+            if not points:
+                return count
+            await self._client.batch_update_points(
+                collection_name=self.collection_name,
+                update_operations=[models.SetPayloadOperation(set_payload=models.SetPayload(
+                    payload={'random_key': random.random()}, points=[t.id])) for t in points],
+                wait=True)
+            count += len(points)
+            logger.info("[{}] Assigned random keys to {} items.", count, len(points))
+
+    async def _backfill_random_keys_in_background(self):
+        try:
+            if count := await self.backfill_random_keys():
+                logger.success("Assigned random keys to {} items stored by older versions.", count)
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            logger.warning("Failed to assign random keys to the items stored by older versions, which will not be "
+                           "returned by random picks until the next startup: {}", ex)
+
+    async def insert_items(self, items: list[MappedImage], wait=True):
+        """
+        Insert (or overwrite) items into database.
+        :param items: The items to insert.
+        :param wait: Whether to wait until the changes have been applied. If False, the items may not be searchable
+         immediately after this method returns.
+        """
         logger.info("Inserting {} items into Qdrant...", len(items))
 
         points = [self._get_point_from_mapped_image(t) for t in items]
 
         response = await self._client.upsert(collection_name=self.collection_name,
-                                             wait=True,
+                                             wait=wait,
                                              points=points)
         logger.success("Insert completed! Status: {}", response.status)
 
@@ -203,6 +334,21 @@ class VectorDbContext(LifespanService):
                                                   wait=True)
         logger.success("Update completed! Status: {}", response.status)
 
+    async def update_payloads(self, new_data: list[MappedImage]):
+        """
+        Update the payloads of a batch of existing items in the database with a single request.
+        Warning: This method will not update the vectors of the items.
+        :param new_data: The new data to update.
+        """
+        logger.info("Updating payloads of {} items...", len(new_data))
+        response = await self._client.batch_update_points(
+            collection_name=self.collection_name,
+            update_operations=[models.SetPayloadOperation(set_payload=models.SetPayload(payload=t.payload,
+                                                                                        points=[str(t.id)]))
+                               for t in new_data],
+            wait=True)
+        logger.success("Update completed! Status: {}", response[-1].status if response else None)
+
     async def update_vectors(self, new_points: list[MappedImage]):
         resp = await self._client.update_vectors(collection_name=self.collection_name,
                                                  points=[self._get_vector_from_img_data(t) for t in new_points],
@@ -214,15 +360,17 @@ class VectorDbContext(LifespanService):
                             count=50,
                             with_vectors=False,
                             filter_param: FilterParams | None = None,
+                            fields: set[str] | None = None,
                             ) -> tuple[list[MappedImage], str]:
         resp, next_id = await self._client.scroll(collection_name=self.collection_name,
                                                   limit=count,
                                                   offset=from_id,
+                                                  with_payload=self._get_payload_selector(fields),
                                                   with_vectors=with_vectors,
                                                   scroll_filter=self._get_filters_by_filter_param(filter_param)
                                                   )
 
-        return [self._get_mapped_image_from_point(t) for t in resp], next_id
+        return [self._get_mapped_image_from_point(t, fields) for t in resp], next_id
 
     async def get_counts(self, exact: bool) -> int:
         resp = await self._client.count(collection_name=self.collection_name, exact=exact)
@@ -239,13 +387,112 @@ class VectorDbContext(LifespanService):
             return
         logger.info("Initializing database, collection name: {}", self.collection_name)
         vectors_config = {
-            self.IMG_VECTOR: models.VectorParams(size=768, distance=models.Distance.COSINE),
-            self.TEXT_VECTOR: models.VectorParams(size=768, distance=models.Distance.COSINE)
+            name: models.VectorParams(size=768, distance=models.Distance.COSINE, on_disk=config.qdrant.on_disk,
+                                      hnsw_config=self._get_hnsw_config(),
+                                      quantization_config=self.get_quantization_config(config.qdrant.quantization))
+            for name in (self.IMG_VECTOR, self.TEXT_VECTOR)
         }
         await self._client.create_collection(collection_name=self.collection_name,
                                              vectors_config=vectors_config)
         logger.success("Collection created!")
 
+    @staticmethod
+    def get_payload_indexes() -> dict[str, models.PayloadSchemaType | models.TextIndexParams]:
+        """
+        Get the payload indexes for the fields used in filters.
+        """
+        indexes = {
+            'width': models.PayloadSchemaType.INTEGER,
+            'height': models.PayloadSchemaType.INTEGER,
+            'aspect_ratio': models.PayloadSchemaType.FLOAT,
+            'starred': models.PayloadSchemaType.BOOL,
+            'categories': models.PayloadSchemaType.KEYWORD,
+            # Required by ordering the random sampling with the random key
+            'random_key': models.PayloadSchemaType.FLOAT,
+        }
+        if config.qdrant.ocr_text_index_tokenizer:
+            # Without the full-text index, MatchText falls back to substring matching with a full scan
+            indexes['ocr_text_lower'] = models.TextIndexParams(
+                type=models.TextIndexType.TEXT, tokenizer=models.TokenizerType(config.qdrant.ocr_text_index_tokenizer),
+                lowercase=True)
+        return indexes
+
+    async def ensure_payload_indexes(self):
+        """
+        Create the missing payload indexes, and recreate the ones with outdated schema, so filtered searches don't need
+        to scan the whole collection. Existing collections are migrated by this as well.
+        """
+        if config.qdrant.mode != QdrantMode.SERVER:
+            logger.info("Payload indexes only take effect with Qdrant server. Skip creating payload indexes.")
+            return
+        existing = (await self.get_collection_info()).payload_schema
+        for field, schema in self.get_payload_indexes().items():
+            if field in existing:
+                if not self._is_payload_index_outdated(existing[field], schema):
+                    continue
+                logger.warning("Payload index of {} is outdated. Recreating...", field)
+                await self._client.delete_payload_index(collection_name=self.collection_name, field_name=field,
+                                                        wait=True)
+            logger.info("Creating payload index for {}...", field)
+            await self._client.create_payload_index(collection_name=self.collection_name, field_name=field,
+                                                    field_schema=schema, wait=True)
+        logger.success("Payload indexes are ready.")
+
+    @staticmethod
+    def _is_payload_index_outdated(index: models.PayloadIndexInfo,
+                                   schema: models.PayloadSchemaType | models.TextIndexParams) -> bool:
+        if not isinstance(schema, models.TextIndexParams):
+            return index.data_type != schema
+        # Qdrant fills the default values into the returned params, so only the tokenizer is compared
+        return (index.data_type != models.PayloadSchemaType.TEXT or
+                getattr(index.params, 'tokenizer', None) != schema.tokenizer)
+
+    async def update_collection_config(self):
+        """
+        Apply the quantization, on-disk and HNSW settings in configuration to the existing collection.
+        Qdrant rebuilds the indexes and the quantized vectors in background after the update.
+        """
+        logger.info("Updating config of collection {}...", self.collection_name)
+        quantization_config = self.get_quantization_config(config.qdrant.quantization)
+        vectors_config = {
+            name: models.VectorParamsDiff(on_disk=config.qdrant.on_disk, hnsw_config=self._get_hnsw_config(),
+                                          quantization_config=quantization_config or models.Disabled.DISABLED)
+            for name in (self.IMG_VECTOR, self.TEXT_VECTOR)
+        }
+        await self._client.update_collection(collection_name=self.collection_name, vectors_config=vectors_config)
+        logger.success("Collection config updated!")
+
+    async def get_collection_info(self) -> models.CollectionInfo:
+        return await self._client.get_collection(collection_name=self.collection_name)
+
+    @staticmethod
+    def get_quantization_config(quantization: QdrantQuantization) -> models.QuantizationConfig | None:
+        match quantization:
+            case QdrantQuantization.SCALAR:
+                return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8, quantile=0.99, always_ram=config.qdrant.quantization_always_ram))
+            case QdrantQuantization.BINARY:
+                return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(
+                    always_ram=config.qdrant.quantization_always_ram))
+            case _:
+                return None
+
+    @staticmethod
+    def _get_hnsw_config() -> models.HnswConfigDiff | None:
+        if config.qdrant.hnsw_m is None and config.qdrant.hnsw_ef_construct is None:
+            return None
+        return models.HnswConfigDiff(m=config.qdrant.hnsw_m, ef_construct=config.qdrant.hnsw_ef_construct)
+
+    @staticmethod
+    def _get_search_params() -> models.SearchParams | None:
+        quantization = None
+        if config.qdrant.search_oversampling is not None or config.qdrant.search_rescore is not None:
+            quantization = models.QuantizationSearchParams(oversampling=config.qdrant.search_oversampling,
+                                                           rescore=config.qdrant.search_rescore)
+        if quantization is None and config.qdrant.search_hnsw_ef is None:
+            return None
+        return models.SearchParams(hnsw_ef=config.qdrant.search_hnsw_ef, quantization=quantization)
+
     @classmethod
     def _get_vector_from_img_data(cls, img_data: MappedImage) -> models.PointVectors:
         vector = {}
@@ -266,21 +513,29 @@ class VectorDbContext(LifespanService):
             vector=cls._get_vector_from_img_data(img_data).vector
         )
 
-    def _get_mapped_image_from_point(self, point: AVAILABLE_POINT_TYPES) -> MappedImage:
+    @classmethod
+    def _get_payload_selector(cls, fields: set[str] | None, *extra_fields: str) -> bool | list[str]:
+        if fields is None:
+            return True
+        return sorted(cls.BASE_PAYLOAD_FIELDS.union(fields, extra_fields) - {'id'})
+
+    def _get_mapped_image_from_point(self, point: AVAILABLE_POINT_TYPES, fields: set[str] | None = None) -> MappedImage:
         return (MappedImage
                 .from_payload(point.id,
                               point.payload,
                               image_vector=numpy.array(point.vector[self.IMG_VECTOR], dtype=numpy.float32)
                               if point.vector and self.IMG_VECTOR in point.vector else None,
                               text_contain_vector=numpy.array(point.vector[self.TEXT_VECTOR], dtype=numpy.float32)
-                              if point.vector and self.TEXT_VECTOR in point.vector else None
+                              if point.vector and self.TEXT_VECTOR in point.vector else None,
+                              fields=fields
                               ))
 
     def _get_mapped_image_from_point_batch(self, points: list[AVAILABLE_POINT_TYPES]) -> list[MappedImage]:
         return [self._get_mapped_image_from_point(t) for t in points]
 
-    def _get_search_result_from_scored_point(self, point: models.ScoredPoint) -> SearchResult:
-        return SearchResult(img=self._get_mapped_image_from_point(point), score=point.score)
+    def _get_search_result_from_scored_point(self, point: models.ScoredPoint,
+                                             fields: set[str] | None = None) -> SearchResult:
+        return SearchResult(img=self._get_mapped_image_from_point(point, fields), score=point.score)
 
     @classmethod
     def vector_name_for_basis(cls, basis: SearchBasisEnum) -> str:
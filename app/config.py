@@ -14,6 +14,12 @@ class QdrantMode(str, Enum):
     MEMORY = 'memory'
 
 
+class QdrantQuantization(str, Enum):
+    NONE = 'none'
+    SCALAR = 'scalar'
+    BINARY = 'binary'
+
+
 class QdrantSettings(BaseModel):
     mode: QdrantMode = QdrantMode.SERVER
 
@@ -26,11 +32,31 @@ class QdrantSettings(BaseModel):
 
     local_path: str = './images_metadata'
 
+    quantization: QdrantQuantization = QdrantQuantization.NONE
+    quantization_always_ram: bool = True
+    on_disk: bool = False
+    hnsw_m: int | None = None
+    hnsw_ef_construct: int | None = None
+    search_hnsw_ef: int | None = None
+    search_oversampling: float | None = None
+    search_rescore: bool | None = None
+    ocr_text_index_tokenizer: str = ''
+
+
+class InferenceBackend(str, Enum):
+    TORCH = 'torch'
+    ONNX = 'onnx'
+
 
 class ModelsSettings(BaseModel):
     clip: str = 'openai/clip-vit-large-patch14'
     bert: str = 'bert-base-chinese'
     easypaddleocr: str | None = None
+    backend: InferenceBackend = InferenceBackend.TORCH
+    onnx_path: str = './onnx_models'
+    onnx_threads: int = 0
+    quantize: bool = False
+    quantized_path: str = './quantized_models'
 
 
 class OCRSearchSettings(BaseModel):
@@ -40,6 +66,37 @@ class OCRSearchSettings(BaseModel):
     ocr_min_confidence: float = 1e-2
 
 
+class InferenceSettings(BaseModel):
+    batching_enable: bool = True
+    max_batch_size: int = 16
+    max_wait_ms: float = 5
+    executor_workers: int = 1
+    max_pending_requests: int = 64
+    text_cache_enable: bool = True
+    text_cache_ttl: int = 86400
+
+
+class SearchSettings(BaseModel):
+    session_enable: bool = True
+    session_ttl: int = 1800
+    session_window: int = 100
+    session_max_size: int = 1000
+    session_max_count: int = 1000
+
+
+class IndexingSettings(BaseModel):
+    batch_size: int = 8
+    preprocess_workers: int = 4
+    io_workers: int = 4
+    ocr_workers: int = 1
+    upsert_batch_size: int = 64
+    upsert_flush_interval: float = 1
+    upsert_wait: bool = True
+    pipeline_queue_size: int = 64
+    fast_decode: bool = True
+    ocr_decode_size: int = 1024
+
+
 class S3StorageSettings(BaseModel):
     path: str = "./static"
     bucket: str | None = None
@@ -49,6 +106,10 @@ class S3StorageSettings(BaseModel):
     secret_access_key: str | None = None
     session_token: str | None = None
     user_endpoint_url: str | None = None
+    presign_cache_size: int = 10000
+    presign_cache_margin: int = 300
+    presign_cache_shared: bool = False
+    local_presign: bool = False
 
 
 class LocalStorageSettings(BaseModel):
@@ -65,6 +126,27 @@ class StorageMode(str, Enum):
         return self != StorageMode.DISABLED
 
 
+class CacheMode(str, Enum):
+    LOCAL = 'local'
+    REDIS = 'redis'
+    DISABLED = 'disabled'
+
+
+class LocalCacheSettings(BaseModel):
+    max_size: int = 10000
+
+
+class RedisCacheSettings(BaseModel):
+    url: str = 'redis://localhost:6379/0'
+    key_prefix: str = 'neko_image_gallery:'
+
+
+class CacheSettings(BaseModel):
+    method: CacheMode = CacheMode.LOCAL
+    local: LocalCacheSettings = LocalCacheSettings()
+    redis: RedisCacheSettings = RedisCacheSettings()
+
+
 class StorageSettings(BaseModel):
     method: StorageMode = StorageMode.LOCAL
     s3: S3StorageSettings = S3StorageSettings()
@@ -81,14 +163,21 @@ class Config(BaseSettings):
     qdrant: QdrantSettings = QdrantSettings()
     model: ModelsSettings = ModelsSettings()
     ocr_search: OCRSearchSettings = OCRSearchSettings()
+    inference: InferenceSettings = InferenceSettings()
+    search: SearchSettings = SearchSettings()
+    indexing: IndexingSettings = IndexingSettings()
     static_file: StaticFileSettings = StaticFileSettings()  # [Deprecated]
     storage: StorageSettings = StorageSettings()
+    cache: CacheSettings = CacheSettings()
 
     device: str = 'auto'
     cors_origins: set[str] = {'*'}
     admin_api_enable: bool = False
     admin_token: str = ''
     admin_index_queue_max_length: int = 200
+    admin_index_workers: int = 2
+    admin_index_spool_dir: str | None = None
+    admin_index_spool_queue_max_length: int = 10000
 
     with_frontend: bool = False  # Whether to run the frontend app with the backend, default to False for backward
     # compatibility
@@ -0,0 +1,125 @@
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterable, Awaitable, Callable, Iterable
+
+from loguru import logger
+
+_SENTINEL = object()
+
+
+@dataclass
+class _Stage:
+    name: str
+    func: Callable[[object], Awaitable[object | None]] | Callable[[list], Awaitable[list]]
+    workers: int
+    batch_size: int | None
+    batch_timeout: float
+
+
+class AsyncPipeline:
+    """
+    A streaming pipeline composed of stages connected by bounded queues.
+
+    Each stage is handled by its own workers, so I/O bound and CPU bound stages overlap with each other. A normal
+    stage maps a single item to a new item (or None to drop the item). A batched stage receives a list of up to
+    `batch_size` items, which is dispatched when full or after `batch_timeout` seconds, and returns the list of
+    items passed to the next stage. Items which raise an exception in a stage are logged and dropped.
+    """
+
+    def __init__(self, queue_size: int = 64, on_item_done: Callable[[int], None] | None = None):
+        self._queue_size = queue_size
+        self._stages: list[_Stage] = []
+        self._on_item_done = on_item_done
+
+    def add_stage(self, name: str, func, workers: int = 1):
+        self._stages.append(_Stage(name, func, max(workers, 1), None, 0))
+        return self
+
+    def add_batch_stage(self, name: str, func, batch_size: int, batch_timeout: float = 1.0, workers: int = 1):
+        self._stages.append(_Stage(name, func, max(workers, 1), max(batch_size, 1), batch_timeout))
+        return self
+
+    def _done(self, count: int):
+        if self._on_item_done is not None and count > 0:
+            self._on_item_done(count)
+
+    async def run(self, source: AsyncIterable | Iterable):
+        if not self._stages:
+            raise ValueError("The pipeline has no stage.")
+        queues = [asyncio.Queue(self._queue_size) for _ in self._stages]
+        tasks = [asyncio.create_task(self._feed(source, queues[0], self._stages[0].workers))]
+        for i, stage in enumerate(self._stages):
+            out_queue = queues[i + 1] if i + 1 < len(queues) else None
+            next_workers = self._stages[i + 1].workers if i + 1 < len(self._stages) else 0
+            tasks.append(asyncio.create_task(self._run_stage(stage, queues[i], out_queue, next_workers)))
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    @staticmethod
+    async def _feed(source, queue: asyncio.Queue, workers: int):
+        if isinstance(source, AsyncIterable):
+            async for item in source:
+                await queue.put(item)
+        else:
+            for item in source:
+                await queue.put(item)
+        for _ in range(workers):
+            await queue.put(_SENTINEL)
+
+    async def _run_stage(self, stage: _Stage, in_queue: asyncio.Queue, out_queue: asyncio.Queue | None,
+                         next_workers: int):
+        worker = self._batch_worker if stage.batch_size is not None else self._worker
+        await asyncio.gather(*[worker(stage, in_queue, out_queue) for _ in range(stage.workers)])
+        if out_queue is not None:
+            for _ in range(next_workers):
+                await out_queue.put(_SENTINEL)
+
+    async def _emit(self, items: list, out_queue: asyncio.Queue | None):
+        if out_queue is None:
+            self._done(len(items))
+            return
+        for item in items:
+            await out_queue.put(item)
+
+    async def _worker(self, stage: _Stage, in_queue: asyncio.Queue, out_queue: asyncio.Queue | None):
+        while (item := await in_queue.get()) is not _SENTINEL:
+            try:
+                result = await stage.func(item)
+            except Exception:
+                logger.exception("Error occurred in pipeline stage {}.", stage.name)
+                result = None
+            if result is None:
+                self._done(1)
+            else:
+                await self._emit([result], out_queue)
+
+    async def _batch_worker(self, stage: _Stage, in_queue: asyncio.Queue, out_queue: asyncio.Queue | None):
+        finished = False
+        while not finished:
+            batch = []
+            item = await in_queue.get()
+            if item is _SENTINEL:
+                break
+            batch.append(item)
+            deadline = asyncio.get_running_loop().time() + stage.batch_timeout
+            while len(batch) < stage.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                try:
+                    item = await asyncio.wait_for(in_queue.get(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    break
+                if item is _SENTINEL:
+                    finished = True
+                    break
+                batch.append(item)
+            try:
+                results = list(await stage.func(batch))
+            except Exception:
+                logger.exception("Error occurred in pipeline stage {}. {} items dropped.", stage.name, len(batch))
+                results = []
+            self._done(len(batch) - len(results))
+            await self._emit(results, out_queue)
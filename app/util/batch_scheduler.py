@@ -0,0 +1,151 @@
+import asyncio
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Callable, Generic, Sequence, TypeVar
+
+from loguru import logger
+
+InputT = TypeVar('InputT')
+OutputT = TypeVar('OutputT')
+
+
+@dataclass
+class BatchSchedulerStats:
+    queue_depth: int = 0
+    processed_batches: int = 0
+    processed_items: int = 0
+    max_batch_size: int = 0
+
+    @property
+    def average_batch_size(self) -> float:
+        if self.processed_batches == 0:
+            return 0.0
+        return self.processed_items / self.processed_batches
+
+
+class BatchScheduler(Generic[InputT, OutputT]):
+    """
+    Coalesce concurrent requests into batches and run them with a single call of `batch_fn`.
+
+    A batch is dispatched when either `max_batch_size` items are collected, or `max_wait_ms` milliseconds elapsed since
+    the first item of the batch arrived. `batch_fn` is executed in `executor` (the default executor of the event loop
+    if None), so the event loop is never blocked by the batched computation. If a batch fails, its items are retried one
+    by one, so the error only reaches the callers whose inputs caused it.
+    """
+
+    def __init__(self,
+                 name: str,
+                 batch_fn: Callable[[list[InputT]], Sequence[OutputT]],
+                 max_batch_size: int = 16,
+                 max_wait_ms: float = 5,
+                 executor: Executor | None = None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be a positive integer.")
+        self.name = name
+        self._batch_fn = batch_fn
+        self._max_batch_size = max_batch_size
+        self._max_wait = max(max_wait_ms, 0) / 1000
+        self._executor = executor
+        self._queue: asyncio.Queue[tuple[InputT, asyncio.Future]] | None = None
+        self._worker_task: asyncio.Task | None = None
+        self._stats = BatchSchedulerStats()
+
+    @property
+    def stats(self) -> BatchSchedulerStats:
+        self._stats.queue_depth = self._queue.qsize() if self._queue is not None else 0
+        return self._stats
+
+    async def submit(self, item: InputT) -> OutputT:
+        """
+        Submit an item to the scheduler and wait for its result.
+        :param item: The input item.
+        :return: The corresponding result computed by `batch_fn`.
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def stop(self):
+        if self._worker_task is None:
+            return
+        self._worker_task.cancel()
+        try:
+            await self._worker_task
+        except asyncio.CancelledError:
+            pass
+        self._worker_task = None
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"Batch scheduler {self.name} has been stopped."))
+
+    def _ensure_worker(self):
+        if self._worker_task is None or self._worker_task.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue()
+            self._worker_task = asyncio.create_task(self._worker())
+
+    async def _collect_batch(self) -> list[tuple[InputT, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Callers which are already gone (e.g. client disconnected) don't need to be computed
+        return [t for t in batch if not t[1].cancelled()]
+
+    async def _run_batch(self, items: list[InputT]) -> Sequence[OutputT]:
+        results = await asyncio.get_running_loop().run_in_executor(self._executor, self._batch_fn, items)
+        if len(results) != len(items):
+            raise RuntimeError(f"Batch function of {self.name} returned {len(results)} results "
+                               f"for {len(items)} inputs.")
+        self._stats.processed_batches += 1
+        self._stats.processed_items += len(items)
+        self._stats.max_batch_size = max(self._stats.max_batch_size, len(items))
+        return results
+
+    async def _run_one_by_one(self, batch: list[tuple[InputT, asyncio.Future]]):
+        """
+        Process the items of a failed batch separately, so a single bad input doesn't fail the others.
+        """
+        for item, future in batch:
+            if future.done():
+                continue
+            try:
+                result = (await self._run_batch([item]))[0]
+            except Exception as ex:
+                logger.exception("Error occurred while processing an item in {}.", self.name)
+                if not future.done():
+                    future.set_exception(ex)
+                continue
+            if not future.done():
+                future.set_result(result)
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect_batch()
+            if not batch:
+                continue
+            if len(batch) == 1:
+                await self._run_one_by_one(batch)
+                continue
+            try:
+                results = await self._run_batch([t[0] for t in batch])
+            except Exception as ex:
+                logger.warning("Error occurred while processing a batch of {} in {}, retrying the items one by one: "
+                               "{!r}", len(batch), self.name, ex)
+                await self._run_one_by_one(batch)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
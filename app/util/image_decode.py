@@ -0,0 +1,37 @@
+import math
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO
+
+from PIL import Image
+
+# CLIP resizes the shorter side of images to 224px, and thumbnails are at most 256*256
+MIN_INFER_SIZE = 256
+
+
+def decode_image(source: bytes | str | Path | BinaryIO, min_size: int | None = None) \
+        -> tuple[Image.Image, tuple[int, int]]:
+    """
+    Decode an image, at a reduced resolution if its shorter side is at least twice as large as `min_size`.
+    JPEG images are decoded at a reduced scale directly (draft mode), so the full resolution image is never decoded.
+    Other single frame images are decoded fully and then reduced by an integer factor, which is still much cheaper
+    than resizing the full resolution image in later steps. Animated images are never reduced.
+    :param source: The content of the image, or the path to / file object of the image.
+    :param min_size: Min length of the shorter side of the decoded image. None to decode at the full resolution.
+    :return: The decoded image, and the original size of the image.
+    """
+    img = Image.open(BytesIO(source) if isinstance(source, bytes) else source)
+    original_size = img.size
+    factor = min(original_size) // min_size if min_size else 1
+    if factor >= 2:
+        if img.format == 'JPEG':
+            scale = min_size / min(original_size)
+            # The largest scale reduction is chosen which keeps the image at least as large as the requested size
+            img.draft(img.mode, (math.ceil(original_size[0] * scale), math.ceil(original_size[1] * scale)))
+        elif getattr(img, 'n_frames', 1) == 1:
+            img.load()
+            reduced_img = img.reduce(factor)
+            img.close()
+            img = reduced_img
+    img.load()
+    return img, original_size
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+from dataclasses import dataclass
+from enum import Enum
+from time import time
+from uuid import UUID
+
+
+class IndexFileState(str, Enum):
+    HASHED = "hashed"
+    INDEXED = "indexed"
+    DUPLICATE = "duplicate"
+    FAILED = "failed"
+
+    @property
+    def finished(self) -> bool:
+        return self in (IndexFileState.INDEXED, IndexFileState.DUPLICATE)
+
+
+@dataclass
+class ManifestRecord:
+    path: str
+    size: int
+    mtime_ns: int
+    image_id: UUID | None
+    state: IndexFileState
+
+
+class IndexManifest:
+    """
+    A local SQLite manifest recording the indexing state of local files.
+    A file is identified by its path, size and modification time, so an unchanged file can be recognized by `stat`
+    alone, without reading and hashing its content again.
+    """
+
+    def __init__(self, db_path: str | os.PathLike):
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS files ("
+                           "path TEXT PRIMARY KEY, "
+                           "size INTEGER NOT NULL, "
+                           "mtime_ns INTEGER NOT NULL, "
+                           "image_id TEXT, "
+                           "state TEXT NOT NULL, "
+                           "updated_at REAL NOT NULL)")
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def lookup(self, path: str, size: int, mtime_ns: int) -> ManifestRecord | None:
+        """
+        Get the record of a file. Returns None if the file is not recorded or has been modified since recorded.
+        """
+        row = self._conn.execute("SELECT size, mtime_ns, image_id, state FROM files WHERE path = ?",
+                                 (path,)).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return None
+        return ManifestRecord(path, size, mtime_ns, UUID(row[2]) if row[2] else None, IndexFileState(row[3]))
+
+    def update(self, records: list[ManifestRecord]):
+        if not records:
+            return
+        now = time()
+        self._conn.executemany("INSERT OR REPLACE INTO files (path, size, mtime_ns, image_id, state, updated_at) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               [(t.path, t.size, t.mtime_ns, str(t.image_id) if t.image_id else None, t.state.value,
+                                 now) for t in records])
+        self._conn.commit()
+
+    def count(self, state: IndexFileState | None = None) -> int:
+        if state is None:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        return self._conn.execute("SELECT COUNT(*) FROM files WHERE state = ?", (state.value,)).fetchone()[0]
@@ -1,4 +1,7 @@
 from pathlib import Path
+from typing import AsyncIterator
+
+import aiofiles
 
 VALID_IMAGE_EXTENSIONS = {'.jpg', '.png', '.jpeg', '.jfif', '.webp', '.gif'}
 
@@ -10,3 +13,9 @@ def glob_local_files(path: Path, pattern: str = "*", valid_extensions: set[str]
     for file in path.glob(pattern):
         if file.suffix.lower() in valid_extensions:
             yield file
+
+
+async def iter_local_file(path: str | Path, chunk_size: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, 'rb') as file:
+        while chunk := await file.read(chunk_size):
+            yield chunk
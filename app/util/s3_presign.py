@@ -0,0 +1,82 @@
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from urllib.parse import quote, urlparse
+
+
+def _hmac_sha256(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+def _uri_encode(s: str, safe: str = '') -> str:
+    # AWS SigV4 requires all the characters except the unreserved ones (A-Z, a-z, 0-9, '-', '.', '_', '~') encoded
+    return quote(s, safe=safe + '-._~')
+
+
+class S3Presigner:
+    """
+    Generate presigned GET URLs of S3 objects locally with AWS Signature Version 4 (query string authentication).
+    The signing key, credential scope and query string are shared by all the objects signed in a batch, so only a
+    SHA256 digest and an HMAC are computed for each object.
+    """
+
+    def __init__(self, base_url: str, region: str, access_key_id: str, secret_access_key: str,
+                 session_token: str | None = None):
+        """
+        :param base_url: The URL objects are located under, e.g. `http://127.0.0.1:9000/bucket` for path-style
+         requests, or `https://bucket.s3.amazonaws.com` for virtual-hosted-style requests.
+        :param region: The region of the bucket.
+        :param access_key_id: Access key ID of the credential.
+        :param secret_access_key: Secret access key of the credential.
+        :param session_token: Session token of the credential, if using temporary credentials.
+        """
+        parsed_url = urlparse(base_url)
+        self._base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+        self._host = parsed_url.netloc
+        self._base_path = parsed_url.path.rstrip('/')
+        self._region = region
+        self._access_key_id = access_key_id
+        self._secret_access_key = secret_access_key
+        self._session_token = session_token
+
+    def _signing_key(self, date: str) -> bytes:
+        key = _hmac_sha256(f"AWS4{self._secret_access_key}".encode('utf-8'), date)
+        key = _hmac_sha256(key, self._region)
+        key = _hmac_sha256(key, 's3')
+        return _hmac_sha256(key, 'aws4_request')
+
+    def presign_get(self, keys: list[str], expire_second: int, now: datetime | None = None) -> list[str]:
+        """
+        Presign GET requests of a batch of objects.
+        :param keys: The object keys relative to the base URL.
+        :param expire_second: Valid time of the presigned URLs.
+        :param now: The signing time. Defaults to the current time.
+        :return: The presigned URLs, in the same order as keys.
+        """
+        now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        date = now.strftime('%Y%m%d')
+        scope = f"{date}/{self._region}/s3/aws4_request"
+        params = {
+            'X-Amz-Algorithm': 'AWS4-HMAC-SHA256',
+            'X-Amz-Credential': f"{self._access_key_id}/{scope}",
+            'X-Amz-Date': amz_date,
+            'X-Amz-Expires': str(expire_second),
+            'X-Amz-SignedHeaders': 'host',
+        }
+        if self._session_token:
+            params['X-Amz-Security-Token'] = self._session_token
+        query = '&'.join(f"{_uri_encode(k)}={_uri_encode(v)}" for k, v in sorted(params.items()))
+        # Everything of the canonical request and the string to sign except the path is shared by the batch
+        request_suffix = f"\n{query}\nhost:{self._host}\n\nhost\nUNSIGNED-PAYLOAD"
+        sign_prefix = f"AWS4-HMAC-SHA256\n{amz_date}\n{scope}\n"
+        signing_key = self._signing_key(date)
+
+        urls = []
+        for key in keys:
+            path = _uri_encode(f"{self._base_path}/{key.lstrip('/')}", safe='/')
+            request_digest = hashlib.sha256(f"GET\n{path}{request_suffix}".encode('utf-8')).hexdigest()
+            signature = hmac.new(signing_key, (sign_prefix + request_digest).encode('utf-8'),
+                                 hashlib.sha256).hexdigest()
+            urls.append(f"{self._base_url}{path}?{query}&X-Amz-Signature={signature}")
+        return urls
@@ -0,0 +1,24 @@
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+THUMBNAIL_SIZE = (256, 256)
+
+
+def generate_thumbnail(img: Image.Image) -> bytes:
+    """
+    Generate a WebP thumbnail of at most 256*256 for the image. Note that the image is resized in place.
+    """
+    img.thumbnail(THUMBNAIL_SIZE, resample=Image.Resampling.LANCZOS)
+    img_byte_arr = BytesIO()
+    img.save(img_byte_arr, 'WebP', save_all=True)
+    return img_byte_arr.getvalue()
+
+
+def generate_thumbnail_from_file(path: str | Path) -> bytes:
+    """
+    Generate a thumbnail for the image file. This is a top-level function, so it can be run in a process pool.
+    """
+    with Image.open(path) as img:
+        return generate_thumbnail(img)
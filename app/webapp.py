@@ -6,6 +6,7 @@ from typing import Annotated
 from fastapi import FastAPI, Request, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.params import Depends
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 import app
@@ -13,6 +14,7 @@ import app.Controllers.admin as admin_controller
 import app.Controllers.images as images_controller
 import app.Controllers.search as search_controller
 from app.Services.authentication import permissive_access_token_verify, permissive_admin_token_verify
+from app.Services.inference_service import InferenceOverloadedError
 from app.Services.provider import ServiceProvider
 from app.config import config
 from .Models.api_response.base import WelcomeApiResponse, WelcomeApiAuthenticationResponse, \
@@ -54,6 +56,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(InferenceOverloadedError)
+async def inference_overloaded_handler(_: Request, __: InferenceOverloadedError):
+    # Shed the load instead of queueing indefinitely, so that the latency of other endpoints stays flat
+    return JSONResponse(status_code=503,
+                        content={"detail": "The server is busy processing other search requests. Try again later."},
+                        headers={"Retry-After": "1"})
+
+
 root_router = APIRouter()
 
 root_router.include_router(search_controller.search_router, prefix="/search")
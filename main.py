@@ -75,11 +75,37 @@ def init_database():
     Initialize qdrant database using connection settings in configuration.
     Note. The server will automatically initialize the database if it's not initialized. So you don't need to run this
     command unless you want to explicitly initialize the database.
+    The payload indexes used by filters are created as well, including the missing ones of an existing database.
     """
     from scripts import qdrant_create_collection
     asyncio.run(qdrant_create_collection.main())
 
 
+@parser.command('update-collection-config')
+def update_collection_config():
+    """
+    Apply the quantization, on-disk and HNSW settings in configuration to the existing qdrant collection.
+    New collections are created with these settings automatically, so this command is only required after changing
+    them for an existing collection. Qdrant will rebuild the indexes in background, which may take a while for large
+    collections.
+    """
+    from scripts import qdrant_update_collection
+    asyncio.run(qdrant_update_collection.main())
+
+
+@parser.command('migrate-database')
+def migrate_database(
+        from_version: Annotated[int, typer.Argument(help="The version of the database to migrate from.")]
+):
+    """
+    Migrate the existing qdrant database from an older version of the data format.
+    Version 3 stores a random key in each item for random picking. Items indexed before it are not returned by random
+    picking until migrated.
+    """
+    from scripts import db_migrations
+    asyncio.run(db_migrations.migrate(from_version))
+
+
 @parser.command("local-index")
 def local_index(
         target_dir: Annotated[
@@ -92,7 +118,14 @@ def local_index(
                 help="Whether to generate thumbnail for images. Possible values:\n"
                      "- `if_necessary`:(Recommended) Only generate thumbnail if the image is larger than 500KB.\n"
                      "- `always`: Always generate thumbnail.\n"
-                     "- `never`: Never generate thumbnail.")] = UploadImageThumbnailMode.IF_NECESSARY
+                     "- `never`: Never generate thumbnail.")] = UploadImageThumbnailMode.IF_NECESSARY,
+        manifest: Annotated[Optional[Path], typer.Option(
+            dir_okay=False,
+            help="The manifest file recording the indexing progress, which makes an interrupted indexing "
+                 "resumable. Set to empty string to disable the manifest.")] = Path('./local_index_manifest.db'),
+        resume: Annotated[bool, typer.Option(
+            help="Skip the files recorded as processed in the manifest. Use `--no-resume` to process all the files "
+                 "again.")] = True
 ):
     """
     Index all the images in the specified directory.
@@ -101,15 +134,17 @@ def local_index(
     from scripts import local_indexing
     if categories is None:
         categories = []
-    asyncio.run(local_indexing.main(target_dir, categories, starred, thumbnail_mode))
+    asyncio.run(local_indexing.main(target_dir, categories, starred, thumbnail_mode,
+                                    manifest_path=manifest if manifest and manifest.name else None, resume=resume))
 
 
-@parser.command('local-generate-thumbnails', deprecated=True)
+@parser.command('local-generate-thumbnails')
 def generate_local_thumbnails():
     """
     Generate thumbnail for all local images in static folder, this won't affect non-local images.
     This is generally not required since the server will automatically generate thumbnails for new images by default.
-    This option will be refactored in the future.
+    Images smaller than 500KB and images which already have a thumbnail are skipped.
+    The concurrency can be tuned with the indexing settings in configuration.
     """
     from scripts import local_create_thumbnail
     asyncio.run(local_create_thumbnail.main())
@@ -0,0 +1,86 @@
+"""
+Compare the torch and ONNX Runtime inference backends of TransformersService.
+Each backend runs in a separate process, so the peak memory usage can be measured independently.
+
+Usage: python -m scripts.benchmarks.inference_backends [--rounds 10] [--batch-size 8]
+"""
+import resource
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+import typer
+from PIL import Image
+
+from app.config import config, InferenceBackend
+
+ASSETS_PATH = Path(__file__).parent.parent.parent / 'tests' / 'assets' / 'test_images'
+TEXTS = ['1girl', 'a cat sitting on the sofa', 'the quick brown fox jumps over the lazy dog', '我可以吞下玻璃而不伤身体']
+
+
+def _measure(func, rounds: int) -> list[float]:
+    func()  # Warm up
+    result = []
+    for _ in range(rounds):
+        start = perf_counter()
+        func()
+        result.append((perf_counter() - start) * 1000)
+    return result
+
+
+def _run_backend(backend: InferenceBackend, rounds: int, batch_size: int) -> dict:
+    # pylint: disable=import-outside-toplevel
+    from app.Services.transformers_service import TransformersService
+    config.model.backend = backend
+    start = perf_counter()
+    service = TransformersService()
+    load_time = perf_counter() - start
+
+    images = [Image.open(t).convert('RGB') for t in sorted(ASSETS_PATH.glob('*.*')) if t.suffix != '.py']
+    batch = (images * batch_size)[:batch_size]
+    timings = {
+        'image (1)': _measure(lambda: service.get_image_vector(images[0]), rounds),
+        f'image ({batch_size})': _measure(lambda: service.get_image_vector_batch(batch), rounds),
+        'text (1)': _measure(lambda: service.get_text_vector(TEXTS[1]), rounds),
+        f'text ({len(TEXTS)})': _measure(lambda: service.get_text_vector_batch(TEXTS), rounds),
+    }
+    vectors = {'image': service.get_image_vector_batch(images), 'text': service.get_text_vector_batch(TEXTS)}
+    if config.ocr_search.enable:
+        timings[f'bert ({len(TEXTS)})'] = _measure(lambda: service.get_bert_vector_batch(TEXTS), rounds)
+        vectors['bert'] = service.get_bert_vector_batch(TEXTS)
+    return {'load_time': load_time, 'timings': timings, 'vectors': vectors,
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=-1) / np.linalg.norm(a, axis=-1) / np.linalg.norm(b, axis=-1)
+
+
+def main(rounds: int = 10, batch_size: int = 8):
+    results = {}
+    for backend in InferenceBackend:
+        # Spawn a fresh process for each backend, so models loaded by one backend don't affect the other
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            results[backend] = executor.submit(_run_backend, backend, rounds, batch_size).result()
+
+    torch_result, onnx_result = results[InferenceBackend.TORCH], results[InferenceBackend.ONNX]
+    print(f"CLIP: {config.model.clip}, BERT: {config.model.bert}, rounds: {rounds}")
+    print(f"{'':<16}{'torch':>22}{'onnx':>22}{'speedup':>10}")
+    print(f"{'load time (s)':<16}{torch_result['load_time']:>22.2f}{onnx_result['load_time']:>22.2f}")
+    print(f"{'peak RSS (MiB)':<16}{torch_result['max_rss_mb']:>22.0f}{onnx_result['max_rss_mb']:>22.0f}")
+    for name, torch_timings in torch_result['timings'].items():
+        onnx_timings = onnx_result['timings'][name]
+        torch_median, onnx_median = statistics.median(torch_timings), statistics.median(onnx_timings)
+        print(f"{name + ' (ms)':<16}"
+              f"{f'{torch_median:.1f} (p95 {np.percentile(torch_timings, 95):.1f})':>22}"
+              f"{f'{onnx_median:.1f} (p95 {np.percentile(onnx_timings, 95):.1f})':>22}"
+              f"{torch_median / onnx_median:>9.2f}x")
+    for name, vectors in torch_result['vectors'].items():
+        print(f"min cosine similarity of {name} vectors: {_cosine(vectors, onnx_result['vectors'][name]).min():.6f}")
+
+
+if __name__ == '__main__':
+    typer.run(main)
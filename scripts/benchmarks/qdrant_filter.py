@@ -0,0 +1,114 @@
+"""
+Measure the latency of filtered searches with and without the payload indexes created by VectorDbContext.
+A temporary collection with random vectors and payloads is created in the configured Qdrant server, and dropped after
+the benchmark.
+
+Usage: python -m scripts.benchmarks.qdrant_filter [--points 50000] [--queries 50]
+"""
+import statistics
+from time import perf_counter, sleep
+
+import numpy as np
+import typer
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from app.Models.query_params import FilterParams
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config, QdrantMode
+
+VECTOR_SIZE = 768
+CATEGORIES = [f'category_{i}' for i in range(20)]
+WORDS = ['neko', 'image', 'gallery', 'hello', 'world', 'cat', 'girl', 'sky', 'sea', 'flower', '猫', '天空', '花']
+RARE_WORD = 'ciallo'
+
+
+def _create_client() -> QdrantClient:
+    return QdrantClient(host=config.qdrant.host, port=config.qdrant.port, grpc_port=config.qdrant.grpc_port,
+                        api_key=config.qdrant.api_key, prefer_grpc=config.qdrant.prefer_grpc, timeout=600)
+
+
+def _random_payload(rng: np.random.Generator) -> dict:
+    width, height = (int(t) for t in rng.integers(200, 4000, 2))
+    words = list(rng.choice(WORDS, rng.integers(0, 8)))
+    if rng.random() < 0.01:
+        words.append(RARE_WORD)
+    return {'width': width, 'height': height, 'aspect_ratio': width / height, 'starred': bool(rng.random() < 0.05),
+            'categories': list(rng.choice(CATEGORIES, rng.integers(0, 3), replace=False)),
+            'ocr_text_lower': ' '.join(words) or None}
+
+
+def _filter_cases() -> dict[str, FilterParams]:
+    cases = {
+        'min_width': FilterParams(min_width=3800),
+        'aspect_ratio': FilterParams(preferred_ratio=1.0, ratio_tolerance=0.01),
+        'starred': FilterParams(starred=True),
+        'categories': FilterParams(categories='category_1'),
+        'categories_negative': FilterParams(categories_negative=','.join(CATEGORIES[1:])),
+        'ocr_text': FilterParams(),
+    }
+    cases['ocr_text'].ocr_text = RARE_WORD
+    return cases
+
+
+def _create_collection(client: QdrantClient, name: str, points: int, rng: np.random.Generator):
+    client.delete_collection(name)
+    client.create_collection(name, vectors_config=models.VectorParams(size=VECTOR_SIZE,
+                                                                      distance=models.Distance.COSINE))
+    for i in range(0, points, 1000):
+        count = min(1000, points - i)
+        client.upsert(name, points=models.Batch(ids=list(range(i, i + count)),
+                                                vectors=rng.standard_normal((count, VECTOR_SIZE)).tolist(),
+                                                payloads=[_random_payload(rng) for _ in range(count)]), wait=True)
+
+
+def _wait_for_green(client: QdrantClient, name: str):
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        sleep(1)
+
+
+def _measure(client: QdrantClient, name: str, queries: np.ndarray, query_filter: models.Filter,
+             top_k: int) -> tuple[float, float, set]:
+    latencies, result_ids = [], set()
+    for query in queries:
+        start = perf_counter()
+        result = client.query_points(name, query=query.tolist(), query_filter=query_filter, limit=top_k).points
+        latencies.append((perf_counter() - start) * 1000)
+        result_ids.update(t.id for t in result)
+    return statistics.median(latencies), float(np.percentile(latencies, 95)), result_ids
+
+
+def main(points: int = 50000, queries: int = 50, top_k: int = 20):
+    if config.qdrant.mode != QdrantMode.SERVER:
+        print("Payload indexes only take effect with Qdrant server. Please use the server mode.")
+        raise typer.Exit(1)
+    client = _create_client()
+    rng = np.random.default_rng(0)
+    name = f"{config.qdrant.coll}_benchmark_filter"
+    query_vectors = rng.standard_normal((queries, VECTOR_SIZE))
+    filters = {case: VectorDbContext._get_filters_by_filter_param(params)  # pylint: disable=protected-access
+               for case, params in _filter_cases().items()}
+    _create_collection(client, name, points, rng)
+    try:
+        _wait_for_green(client, name)
+        results = {case: _measure(client, name, query_vectors, query_filter, top_k)
+                   for case, query_filter in filters.items()}
+        for field, schema in VectorDbContext.get_payload_indexes().items():
+            client.create_payload_index(name, field, field_schema=schema, wait=True)
+        _wait_for_green(client, name)
+        indexed_results = {case: _measure(client, name, query_vectors, query_filter, top_k)
+                           for case, query_filter in filters.items()}
+    finally:
+        client.delete_collection(name)
+
+    print(f"{points} points, {queries} queries, top {top_k}")
+    print(f"{'filter':<22}{'p50 (ms)':>10}{'p95 (ms)':>10}{'indexed p50':>13}{'indexed p95':>13}{'speedup':>10}"
+          f"{'same results':>14}")
+    for case, (p50, p95, ids) in results.items():
+        indexed_p50, indexed_p95, indexed_ids = indexed_results[case]
+        print(f"{case:<22}{p50:>10.2f}{p95:>10.2f}{indexed_p50:>13.2f}{indexed_p95:>13.2f}"
+              f"{p50 / indexed_p50:>9.2f}x{str(ids == indexed_ids):>14}")
+
+
+if __name__ == '__main__':
+    typer.run(main)
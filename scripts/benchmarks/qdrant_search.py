@@ -0,0 +1,117 @@
+"""
+Measure the recall and latency of vector search with different quantization and search settings of Qdrant.
+Temporary collections are created in the configured Qdrant server, one for each quantization method, and dropped after
+the benchmark. The ground truth is computed by exact (brute force) search on the original vectors.
+
+Usage: python -m scripts.benchmarks.qdrant_search [--points 20000] [--queries 200] [--from-collection]
+"""
+import statistics
+from time import perf_counter, sleep
+
+import numpy as np
+import typer
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config, QdrantMode, QdrantQuantization
+
+VECTOR_SIZE = 768
+HNSW_EF_VALUES = [32, 64, 128, 256]
+OVERSAMPLING_VALUES = [1.0, 2.0, 4.0]
+
+
+def _create_client() -> QdrantClient:
+    return QdrantClient(host=config.qdrant.host, port=config.qdrant.port, grpc_port=config.qdrant.grpc_port,
+                        api_key=config.qdrant.api_key, prefer_grpc=config.qdrant.prefer_grpc, timeout=600)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def _synthetic_vectors(count: int, rng: np.random.Generator) -> np.ndarray:
+    # Clustered vectors are closer to real embeddings than uniformly distributed ones
+    centers = rng.standard_normal((max(count // 500, 1), VECTOR_SIZE))
+    return _normalize(centers[rng.integers(0, len(centers), count)] + rng.standard_normal((count, VECTOR_SIZE)) * 0.6)
+
+
+def _collection_vectors(client: QdrantClient, count: int) -> np.ndarray:
+    vectors, offset = [], None
+    while len(vectors) < count:
+        points, offset = client.scroll(config.qdrant.coll, limit=min(1000, count - len(vectors)), offset=offset,
+                                       with_payload=False, with_vectors=[VectorDbContext.IMG_VECTOR])
+        vectors += [t.vector[VectorDbContext.IMG_VECTOR] for t in points if t.vector]
+        if offset is None:
+            break
+    return _normalize(np.array(vectors, dtype=np.float32))
+
+
+def _create_collection(client: QdrantClient, name: str, quantization: QdrantQuantization, vectors: np.ndarray):
+    client.delete_collection(name)
+    client.create_collection(
+        name,
+        vectors_config=models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE,
+                                           on_disk=config.qdrant.on_disk,
+                                           quantization_config=VectorDbContext.get_quantization_config(quantization)),
+        hnsw_config=models.HnswConfigDiff(m=config.qdrant.hnsw_m, ef_construct=config.qdrant.hnsw_ef_construct))
+    for i in range(0, len(vectors), 1000):
+        client.upsert(name, points=models.Batch(ids=list(range(i, min(i + 1000, len(vectors)))),
+                                                vectors=vectors[i:i + 1000].tolist()), wait=True)
+    # Wait for the HNSW index and the quantized vectors to be built
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        sleep(1)
+
+
+def _measure(client: QdrantClient, name: str, queries: np.ndarray, ground_truth: np.ndarray, top_k: int,
+             params: models.SearchParams) -> tuple[float, float, float]:
+    recalls, latencies = [], []
+    for query, expected in zip(queries, ground_truth):
+        start = perf_counter()
+        result = client.query_points(name, query=query.tolist(), limit=top_k, search_params=params).points
+        latencies.append((perf_counter() - start) * 1000)
+        recalls.append(len({t.id for t in result} & set(expected.tolist())) / top_k)
+    return statistics.mean(recalls), statistics.median(latencies), float(np.percentile(latencies, 95))
+
+
+def main(points: int = 20000, queries: int = 200, top_k: int = 10,
+         from_collection: bool = typer.Option(False, help="Use the image vectors in the configured collection "
+                                                          "instead of synthetic vectors.")):
+    if config.qdrant.mode != QdrantMode.SERVER:
+        print("Quantization and HNSW settings only take effect with Qdrant server. Please use the server mode.")
+        raise typer.Exit(1)
+    client = _create_client()
+    rng = np.random.default_rng(0)
+    vectors = _collection_vectors(client, points + queries) if from_collection \
+        else _synthetic_vectors(points + queries, rng)
+    # Queries are held out from the indexed vectors
+    vectors = vectors[rng.permutation(len(vectors))]
+    query_vectors, vectors = vectors[:queries], vectors[queries:]
+    ground_truth = np.argsort(-query_vectors @ vectors.T, axis=-1)[:, :top_k]
+    print(f"{len(vectors)} points, {len(query_vectors)} queries, top {top_k}, on_disk={config.qdrant.on_disk}, "
+          f"hnsw_m={config.qdrant.hnsw_m}, hnsw_ef_construct={config.qdrant.hnsw_ef_construct}")
+    print(f"{'quantization':<14}{'hnsw_ef':>8}{'oversampling':>14}{'rescore':>9}"
+          f"{'recall':>9}{'p50 (ms)':>10}{'p95 (ms)':>10}")
+
+    for quantization in QdrantQuantization:
+        name = f"{config.qdrant.coll}_benchmark_{quantization.value}"
+        _create_collection(client, name, quantization, vectors)
+        try:
+            for hnsw_ef in HNSW_EF_VALUES:
+                variants = [None] if quantization == QdrantQuantization.NONE else \
+                    [(oversampling, rescore) for oversampling in OVERSAMPLING_VALUES for rescore in (True, False)]
+                for variant in variants:
+                    params = models.SearchParams(
+                        hnsw_ef=hnsw_ef,
+                        quantization=models.QuantizationSearchParams(oversampling=variant[0], rescore=variant[1])
+                        if variant else None)
+                    recall, p50, p95 = _measure(client, name, query_vectors, ground_truth, top_k, params)
+                    oversampling, rescore = variant if variant else ('-', '-')
+                    print(f"{quantization.value:<14}{hnsw_ef:>8}{oversampling:>14}{str(rescore):>9}"
+                          f"{recall:>9.4f}{p50:>10.2f}{p95:>10.2f}")
+        finally:
+            client.delete_collection(name)
+
+
+if __name__ == '__main__':
+    typer.run(main)
@@ -0,0 +1,64 @@
+"""
+Measure the accuracy loss of dynamic int8 quantization, as the cosine similarity between the embeddings of the
+quantized models and the full precision models over the test assets. The configured inference backend is used.
+
+Usage: python -m scripts.benchmarks.quantization_drift [--min-cosine 0.99]
+"""
+import gc
+from pathlib import Path
+
+import numpy as np
+import typer
+from PIL import Image
+
+from app.config import config
+
+ASSETS_PATH = Path(__file__).parent.parent.parent / 'tests' / 'assets' / 'test_images'
+TEXTS = ['1girl', 'girl, solo', 'a cat sitting on the sofa', 'computer graphics', 'hello', 'hi',
+         'the quick brown fox jumps over the lazy dog', '我可以吞下玻璃而不伤身体']
+
+
+def _compute_vectors(quantize: bool, images: list[Image.Image]) -> dict[str, np.ndarray]:
+    # pylint: disable=import-outside-toplevel
+    from app.Services.transformers_service import TransformersService
+    config.model.quantize = quantize
+    service = TransformersService()
+    vectors = {'image': service.get_image_vector_batch(images), 'text': service.get_text_vector_batch(TEXTS)}
+    if config.ocr_search.enable:
+        vectors['bert'] = service.get_bert_vector_batch(TEXTS)
+    return vectors
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=-1) / np.linalg.norm(a, axis=-1) / np.linalg.norm(b, axis=-1)
+
+
+def main(min_cosine: float = 0.99):
+    paths = sorted(t for t in ASSETS_PATH.glob('*.*') if t.suffix != '.py')
+    images = [Image.open(t).convert('RGB') for t in paths]
+    expected = _compute_vectors(False, images)
+    gc.collect()
+    actual = _compute_vectors(True, images)
+
+    print(f"Backend: {config.model.backend.value}, CLIP: {config.model.clip}, BERT: {config.model.bert}")
+    passed = True
+    for name, expected_vectors in expected.items():
+        cosine = _cosine(expected_vectors, actual[name])
+        labels = [t.name for t in paths] if name == 'image' else TEXTS
+        print(f"{name} embeddings: min cosine {cosine.min():.6f}, mean cosine {cosine.mean():.6f}, "
+              f"worst: {labels[int(cosine.argmin())]}")
+        passed &= bool(cosine.min() >= min_cosine)
+    # Search results are what matters in the end, so check the ranking of images for each text as well
+    expected_rank = np.argsort(-expected['text'] @ expected['image'].T, axis=-1)
+    actual_rank = np.argsort(-actual['text'] @ actual['image'].T, axis=-1)
+    print(f"text to image top-1 agreement: {(expected_rank[:, 0] == actual_rank[:, 0]).mean():.2%}, "
+          f"full ranking agreement: {(expected_rank == actual_rank).all(axis=-1).mean():.2%}")
+
+    if not passed:
+        print(f"FAILED: cosine similarity drops below {min_cosine}")
+        raise typer.Exit(1)
+    print("PASSED")
+
+
+if __name__ == '__main__':
+    typer.run(main)
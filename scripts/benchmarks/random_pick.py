@@ -0,0 +1,106 @@
+"""
+Compare random picking by the random key range index with random picking by searching a random vector, in latency and
+uniformity. A temporary collection with random vectors is created in the configured Qdrant server, and dropped after the
+benchmark.
+
+Usage: python -m scripts.benchmarks.random_pick [--points 50000] [--picks 1000]
+"""
+import asyncio
+import statistics
+from time import perf_counter, sleep
+from uuid import UUID
+
+import numpy as np
+import typer
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from app.Models.query_params import FilterParams
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config, QdrantMode
+
+VECTOR_SIZE = 768
+
+
+def _create_client() -> QdrantClient:
+    return QdrantClient(host=config.qdrant.host, port=config.qdrant.port, grpc_port=config.qdrant.grpc_port,
+                        api_key=config.qdrant.api_key, prefer_grpc=config.qdrant.prefer_grpc, timeout=600)
+
+
+def _create_collection(client: QdrantClient, name: str, points: int, rng: np.random.Generator):
+    # Clustered vectors are closer to real embeddings than uniformly distributed ones
+    centers = rng.standard_normal((max(points // 500, 1), VECTOR_SIZE))
+    client.delete_collection(name)
+    client.create_collection(name, vectors_config={
+        VectorDbContext.IMG_VECTOR: models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE)})
+    for i in range(0, points, 1000):
+        count = min(1000, points - i)
+        client.upsert(name, points=models.Batch(
+            ids=[str(UUID(int=t)) for t in range(i, i + count)],
+            vectors={VectorDbContext.IMG_VECTOR: (centers[rng.integers(0, len(centers), count)] +
+                                               rng.standard_normal((count, VECTOR_SIZE)) * 0.6).tolist()},
+            payloads=[{'url': f'/{i + j}.jpg', 'index_date': '2024-01-01T00:00:00', 'starred': bool(rng.random() < 0.1),
+                       'random_key': float(rng.random())} for j in range(count)]), wait=True)
+    for field, schema in VectorDbContext.get_payload_indexes().items():
+        client.create_payload_index(name, field, field_schema=schema, wait=True)
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        sleep(1)
+
+
+def _summary(latencies: list[float], picked: list, matched: int) -> str:
+    counts = np.unique(picked, return_counts=True)[1]
+    return (f"{statistics.median(latencies):>10.2f}{float(np.percentile(latencies, 95)):>10.2f}"
+            f"{len(counts) / min(len(picked), matched):>10.2%}{counts.max():>10}")
+
+
+def _measure_vector(client: QdrantClient, name: str, picks: int, count: int, query_filter: models.Filter | None,
+                    rng: np.random.Generator) -> tuple[list[float], list]:
+    latencies, picked = [], []
+    for _ in range(picks // count):
+        # The previous implementation, searching a uniformly random vector
+        start = perf_counter()
+        result = client.query_points(name, query=rng.uniform(-1, 1, VECTOR_SIZE).tolist(),
+                                     using=VectorDbContext.IMG_VECTOR, query_filter=query_filter, limit=count).points
+        latencies.append((perf_counter() - start) * 1000)
+        picked += [t.id for t in result]
+    return latencies, picked
+
+
+async def _measure_random_key(name: str, picks: int, count: int,
+                              filter_param: FilterParams | None) -> tuple[list[float], list]:
+    context = VectorDbContext()
+    context.collection_name = name
+    latencies, picked = [], []
+    for _ in range(picks // count):
+        start = perf_counter()
+        result = await context.random_pick(count, filter_param=filter_param)
+        latencies.append((perf_counter() - start) * 1000)
+        picked += [t.img.id for t in result]
+    return latencies, picked
+
+
+def main(points: int = 50000, picks: int = 1000, count: int = 1):
+    if config.qdrant.mode != QdrantMode.SERVER:
+        print("The benchmark needs the payload indexes of Qdrant server. Please use the server mode.")
+        raise typer.Exit(1)
+    client = _create_client()
+    rng = np.random.default_rng(0)
+    name = f"{config.qdrant.coll}_benchmark_random"
+    _create_collection(client, name, points, rng)
+    try:
+        cases = {'no filter': None, 'starred': FilterParams(starred=True)}
+        print(f"{points} points, {picks} picks, {count} per request")
+        print(f"{'method':<12}{'filter':<12}{'p50 (ms)':>10}{'p95 (ms)':>10}{'distinct':>10}{'max hits':>10}")
+        for case, filter_param in cases.items():
+            query_filter = VectorDbContext._get_filters_by_filter_param(filter_param)  # pylint: disable=protected-access
+            matched = client.count(name, count_filter=query_filter, exact=True).count
+            latencies, picked = _measure_vector(client, name, picks, count, query_filter, rng)
+            print(f"{'vector':<12}{case:<12}{_summary(latencies, picked, matched)}")
+            latencies, picked = asyncio.run(_measure_random_key(name, picks, count, filter_param))
+            print(f"{'random key':<12}{case:<12}{_summary(latencies, picked, matched)}")
+    finally:
+        client.delete_collection(name)
+
+
+if __name__ == '__main__':
+    typer.run(main)
@@ -0,0 +1,94 @@
+"""
+Measure the time to turn a page of points returned by Qdrant into the response, including parsing the response of
+Qdrant, materializing the results and serializing them, with the previous construction of MappedImage, the current one
+and the current one with payload projection. No Qdrant server or model is needed.
+
+Usage: python -m scripts.benchmarks.result_materialization [--count 100] [--repeat 200]
+"""
+import statistics
+from datetime import datetime
+from time import perf_counter
+from uuid import uuid4, UUID
+
+import numpy as np
+import typer
+from pydantic import TypeAdapter
+from qdrant_client.http import models
+
+from app.Models.api_response.search_api_response import SearchApiResponse
+from app.Models.mapped_image import MappedImage
+from app.Models.search_result import SearchResult
+from app.Services.vector_db_context import VectorDbContext
+
+PROJECTED_FIELDS = {'url', 'thumbnail_url', 'width', 'height'}
+
+
+def _random_points(count: int, rng: np.random.Generator) -> list[models.ScoredPoint]:
+    points = []
+    for i in range(count):
+        width, height = (int(t) for t in rng.integers(200, 4000, 2))
+        image = MappedImage(id=uuid4(), url=f'/static/{i}.jpg', thumbnail_url=f'/static/thumbnails/{i}.webp',
+                            index_date=datetime.now(), width=width, height=height, aspect_ratio=width / height,
+                            ocr_text=' '.join(['lorem ipsum dolor sit amet'] * int(rng.integers(0, 20))) or None,
+                            categories=['category'], starred=bool(rng.random() < 0.1), local=True,
+                            local_thumbnail=True, format='jpg', comments='comments ' * 10)
+        points.append(models.ScoredPoint(id=str(image.id), version=0, score=float(rng.random()),
+                                         payload=image.payload))
+    return points
+
+
+def _previous(points: list[models.ScoredPoint]) -> list[SearchResult]:
+    # The previous MappedImage.from_payload, converting the ID and the datetime string in Python
+    results = []
+    for point in points:
+        payload = dict(point.payload)
+        index_date = datetime.fromisoformat(payload.pop('index_date'))
+        results.append(SearchResult(img=MappedImage(id=UUID(str(point.id)), index_date=index_date, **payload,
+                                                    image_vector=None, text_contain_vector=None),
+                                    score=point.score))
+    return results
+
+
+def _current(points: list[models.ScoredPoint], fields: set[str] | None = None) -> list[SearchResult]:
+    return [SearchResult(img=MappedImage.from_payload(t.id, t.payload, fields=fields), score=t.score)
+            for t in points]
+
+
+def _project(points: list[models.ScoredPoint]) -> list[models.ScoredPoint]:
+    # Simulate the payload include list sent to Qdrant
+    include = VectorDbContext._get_payload_selector(PROJECTED_FIELDS)  # pylint: disable=protected-access
+    return [t.model_copy(update={'payload': {k: v for k, v in t.payload.items() if k in include}}) for t in points]
+
+
+def _measure(points: list[models.ScoredPoint], materialize, repeat: int) -> tuple[float, int, int]:
+    points_adapter = TypeAdapter(list[models.ScoredPoint])
+    points_json = points_adapter.dump_json(points)
+    adapter = TypeAdapter(SearchApiResponse)
+    latencies, size = [], 0
+    for _ in range(repeat):
+        start = perf_counter()
+        response = SearchApiResponse(result=materialize(points_adapter.validate_json(points_json)), message="",
+                                     query_id=uuid4())
+        # The same as the serialization of FastAPI with response_model_exclude_unset
+        size = len(adapter.dump_json(adapter.validate_python(response), exclude_unset=True))
+        latencies.append((perf_counter() - start) * 1000)
+    return statistics.median(latencies), len(points_json), size
+
+
+def main(count: int = 100, repeat: int = 200):
+    points = _random_points(count, np.random.default_rng(0))
+    projected_points = _project(points)
+    results = {
+        'previous': _measure(points, _previous, repeat),
+        'current': _measure(points, _current, repeat),
+        'current + projection': _measure(projected_points, lambda t: _current(t, PROJECTED_FIELDS), repeat),
+    }
+    baseline = results['previous'][0]
+    print(f"{count} results per page, {repeat} repeats, projected fields: {', '.join(sorted(PROJECTED_FIELDS))}")
+    print(f"{'method':<22}{'p50 (ms)':>10}{'speedup':>10}{'qdrant bytes':>14}{'response bytes':>16}")
+    for method, (p50, qdrant_size, size) in results.items():
+        print(f"{method:<22}{p50:>10.3f}{baseline / p50:>9.2f}x{qdrant_size:>14}{size:>16}")
+
+
+if __name__ == '__main__':
+    typer.run(main)
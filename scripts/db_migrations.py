@@ -2,7 +2,7 @@ from loguru import logger
 
 from app.Services.provider import ServiceProvider
 
-CURRENT_VERSION = 2
+CURRENT_VERSION = 3
 
 services: ServiceProvider | None = None
 
@@ -31,6 +31,13 @@ async def migrate_v1_v2():
             break
 
 
+async def migrate_v2_v3():
+    logger.info("Migrating from v2 to v3...")
+    # Also done in background on startup, running it here just waits for it to complete
+    count = await services.db_context.backfill_random_keys()
+    logger.success("Assigned random keys to {} points", count)
+
+
 async def migrate(from_version: int):
     global services
     services = ServiceProvider()
@@ -38,7 +45,10 @@ async def migrate(from_version: int):
     match from_version:
         case 1:
             await migrate_v1_v2()
+            await migrate_v2_v3()
         case 2:
+            await migrate_v2_v3()
+        case 3:
             logger.info("Already up to date.")
         case _:
             raise ValueError(f"Unknown version {from_version}")
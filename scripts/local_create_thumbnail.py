@@ -1,57 +1,161 @@
-import io
+import asyncio
+import os
+import sys
+import tempfile
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+from pathlib import PurePath
 
-from PIL import Image
 from loguru import logger
+from rich.progress import Progress
 
+from app.Models.mapped_image import MappedImage
 from app.Services.provider import ServiceProvider
+from app.Services.vector_db_context import PointNotFoundError
+from app.config import config
+from app.util.async_pipeline import AsyncPipeline
+from app.util.thumbnail import generate_thumbnail_from_file
 
+MIN_IMAGE_SIZE = 1024 * 500
 
-async def main():
-    services = ServiceProvider()
-    await services.onload()
-    # Here path maybe either local path or pure path
-    count = 0
-    async for item in services.storage_service.active_storage.list_files("", '*.*', batch_max_files=1):
-        item = item[0]
-        count += 1
-        logger.info("[{}] Processing {}", str(count), str(item))
-        size = await services.storage_service.active_storage.size(item)
-        if size < 1024 * 500:
-            logger.warning("File size too small: {}. Skip...", size)
-            continue
+services: ServiceProvider | None = None
+
+
+@dataclass
+class ThumbnailItem:
+    path: PurePath
+    image_id: uuid.UUID
+    mapped_image: MappedImage | None = None
+    local_file: str | None = None  # The original is downloaded into a temporary file to be decoded in process pool
+    thumbnail_bytes: bytes | None = None
+
+    @property
+    def thumbnail_path(self) -> str:
+        return f'thumbnails/{self.image_id}.webp'
+
+
+class ThumbnailPipeline:
+    """
+    Pipeline for generating thumbnails of the local images:
+    retrieve payloads -> fetch original -> resize (in process pool) -> upload thumbnail -> batched payload update
+    """
+
+    def __init__(self, executor: ProcessPoolExecutor, temp_dir: str):
+        self._executor = executor
+        self._temp_dir = temp_dir
+
+    @staticmethod
+    async def retrieve(items: list[ThumbnailItem]) -> list[ThumbnailItem]:
+        ids = [str(t.image_id) for t in items]
         try:
-            if await services.storage_service.active_storage.is_exist(f'thumbnails/{item.stem}.webp'):
-                logger.warning("Thumbnail for {} already exists. Skip...", item.stem)
+            points = await services.db_context.retrieve_by_ids(ids)
+        except PointNotFoundError:
+            points = await services.db_context.retrieve_by_ids(await services.db_context.validate_ids(ids))
+        points = {t.id: t for t in points}
+        result = []
+        for item in items:
+            if item.image_id not in points:
+                logger.warning("Image {} not found in database. Skip...", item.image_id)
                 continue
-            image_id = uuid.UUID(item.stem)
-        except ValueError:
-            logger.warning("Invalid file name: {}. Skip...", item.stem)
-            continue
-        try:
-            imgdata = await services.db_context.retrieve_by_id(str(image_id))
-        except Exception as e:
-            logger.error("Error when retrieving image {}: {}", image_id, e)
-            continue
+            item.mapped_image = points[item.image_id]
+            result.append(item)
+        return result
+
+    async def fetch(self, item: ThumbnailItem) -> ThumbnailItem | None:
+        storage = services.storage_service.active_storage
+        size = await storage.size(item.path)
+        if size < MIN_IMAGE_SIZE:
+            logger.warning("File size too small: {}. Skip...", size)
+            return None
+        # Stream the original into a temporary file, so it's never fully loaded into memory
+        with tempfile.NamedTemporaryFile(dir=self._temp_dir, delete=False) as file:
+            item.local_file = file.name
+            async for chunk in storage.fetch_stream(item.path):
+                await asyncio.to_thread(file.write, chunk)
+        return item
+
+    async def resize(self, item: ThumbnailItem) -> ThumbnailItem | None:
         try:
-            img_byte = await services.storage_service.active_storage.fetch(item)
-            img = Image.open(io.BytesIO(img_byte))
-        except Exception as e:
-            logger.error("Error when opening image {}: {}", item, e)
-            continue
-
-        # generate thumbnail max size 256*256
-        img.thumbnail((256, 256))
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, 'WebP', save_all=True)
-        await services.storage_service.active_storage.upload(img_byte_arr.getvalue(),
-                                                             f'thumbnails/{str(image_id)}.webp')
-        logger.success("Thumbnail for {} generated!", image_id)
-
-        # update payload
-        imgdata.thumbnail_url = await services.storage_service.active_storage.url(f'thumbnails/{str(image_id)}.webp')
-        imgdata.local_thumbnail = True
-        await services.db_context.update_payload(imgdata)
-        logger.success("Payload for {} updated!", image_id)
-
-    logger.success("OK. Updated {} items.", count)
+            item.thumbnail_bytes = await asyncio.get_running_loop().run_in_executor(
+                self._executor, generate_thumbnail_from_file, item.local_file)
+        except OSError as e:
+            logger.error("Error when opening image {}: {}", item.path, e)
+            return None
+        finally:
+            os.remove(item.local_file)
+            item.local_file = None
+        return item
+
+    @staticmethod
+    async def upload(item: ThumbnailItem) -> ThumbnailItem:
+        storage = services.storage_service.active_storage
+        await storage.upload(item.thumbnail_bytes, item.thumbnail_path)
+        item.thumbnail_bytes = None
+        item.mapped_image.thumbnail_url = await storage.url(item.thumbnail_path)
+        item.mapped_image.local_thumbnail = True
+        logger.success("Thumbnail for {} generated!", item.image_id)
+        return item
+
+    @staticmethod
+    async def update(items: list[ThumbnailItem]) -> list[ThumbnailItem]:
+        await services.db_context.update_payloads([t.mapped_image for t in items])
+        logger.success("Payload for {} images updated!", len(items))
+        return items
+
+    def build(self, on_item_done) -> AsyncPipeline:
+        settings = config.indexing
+        return (AsyncPipeline(settings.pipeline_queue_size, on_item_done)
+                .add_batch_stage("retrieve", self.retrieve, batch_size=settings.upsert_batch_size)
+                .add_stage("fetch", self.fetch, workers=settings.io_workers)
+                .add_stage("resize", self.resize, workers=settings.preprocess_workers)
+                .add_stage("upload", self.upload, workers=settings.io_workers)
+                .add_batch_stage("update", self.update, batch_size=settings.upsert_batch_size))
+
+
+async def list_thumbnail_ids() -> set[str]:
+    # List the thumbnails once, instead of checking the existence of each thumbnail
+    return {t.stem async for batch in services.storage_service.active_storage.list_files(
+        "thumbnails", "**/*.webp", valid_extensions={'.webp'}) for t in batch}
+
+
+@logger.catch()
+async def main():
+    global services
+    services = ServiceProvider()
+    await services.onload()
+    existing_ids = await list_thumbnail_ids()
+    logger.info("Found {} existing thumbnails.", len(existing_ids))
+    with Progress() as progress:
+        # A workaround for the loguru logger to work with rich progressbar
+        logger.remove()
+        logger.add(sys.stderr, colorize=True)
+        task = progress.add_task("Generating thumbnails...", total=None)
+        discovered = skipped = 0
+
+        async def discover():
+            nonlocal discovered, skipped
+            async for batch in services.storage_service.active_storage.list_files("", '*.*', batch_max_files=1000):
+                for item in batch:
+                    discovered += 1
+                    progress.update(task, total=discovered)
+                    try:
+                        image_id = uuid.UUID(item.stem)
+                    except ValueError:
+                        logger.warning("Invalid file name: {}. Skip...", item.stem)
+                        image_id = None
+                    if image_id is None or str(image_id) in existing_ids:
+                        skipped += 1
+                        progress.advance(task)
+                        continue
+                    yield ThumbnailItem(PurePath(item.name), image_id)
+
+        # Spawn the processes instead of forking the process with models loaded
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                ProcessPoolExecutor(max_workers=config.indexing.preprocess_workers,
+                                    mp_context=get_context('spawn')) as executor:
+            pipeline = ThumbnailPipeline(executor, temp_dir).build(lambda count: progress.advance(task, count))
+            await pipeline.run(discover())
+
+    logger.success("OK. {} files processed, {} files skipped.", discovered - skipped, skipped)
@@ -1,53 +1,199 @@
+import asyncio
+import os
 import sys
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
+from typing import AsyncGenerator, Iterator
+from uuid import UUID
 
 import PIL
+from PIL import Image
 from loguru import logger
 from rich.progress import Progress
 
 from app.Models.api_models.admin_query_params import UploadImageThumbnailMode
-from app.Models.errors import PointDuplicateError
 from app.Models.mapped_image import MappedImage
 from app.Services.provider import ServiceProvider
+from app.config import config
+from app.util.async_pipeline import AsyncPipeline
+from app.util.generate_uuid import generate_uuid
+from app.util.image_decode import decode_image
+from app.util.index_manifest import IndexManifest, IndexFileState, ManifestRecord
 from app.util.local_file_utility import glob_local_files
 
 services: ServiceProvider | None = None
 
 
-async def index_task(file_path: Path, categories: list[str], starred: bool, thumbnail_mode: UploadImageThumbnailMode):
-    try:
-        img_id = await services.upload_service.assign_image_id(file_path)
-        mapped_image = MappedImage(id=img_id,
-                                   local=True,
-                                   categories=categories,
-                                   starred=starred,
-                                   format=file_path.suffix[1:],  # remove the dot
-                                   index_date=datetime.now())
-        await services.upload_service.sync_upload_image(mapped_image, file_path.read_bytes(), skip_ocr=False,
-                                                        thumbnail_mode=thumbnail_mode)
-    except PointDuplicateError as ex:
-        logger.warning("Image {} already exists in the database", file_path)
-    except PIL.UnidentifiedImageError as e:
-        logger.error("Error when processing image {}: {}", file_path, e)
+@dataclass
+class IndexItem:
+    path: Path
+    size: int
+    mtime_ns: int
+    known_id: UUID | None = None  # The image ID recorded in manifest, so the file needn't be hashed again
+    img_bytes: bytes | None = None
+    mapped_image: MappedImage | None = None
+    image: Image.Image | None = None
+    rgb_image: Image.Image | None = None
+
+    def release(self):
+        if self.image is not None:
+            self.image.close()
+        self.image = self.rgb_image = self.img_bytes = None
+
+    def record(self, state: IndexFileState) -> ManifestRecord:
+        return ManifestRecord(str(self.path), self.size, self.mtime_ns,
+                              self.mapped_image.id if self.mapped_image else self.known_id, state)
+
+
+class IndexingPipeline:
+    """
+    Streaming pipeline for indexing local files:
+    file discovery -> hashing -> dedupe -> decode -> embed -> OCR -> storage/thumbnail -> batched upsert
+    Stages are connected by bounded queues, so memory usage is bounded regardless of the number of files.
+    The progress is checkpointed into the manifest (if provided), so an interrupted indexing can be resumed.
+    """
+
+    def __init__(self, categories: list[str], starred: bool, thumbnail_mode: UploadImageThumbnailMode,
+                 manifest: IndexManifest | None = None):
+        self._categories = categories
+        self._starred = starred
+        self._thumbnail_mode = thumbnail_mode
+        self._manifest = manifest
+        self._in_flight_ids = set()
+
+    def _checkpoint(self, items: list[IndexItem], state: IndexFileState):
+        if self._manifest is not None:
+            self._manifest.update([t.record(state) for t in items])
+
+    async def hash_file(self, item: IndexItem) -> IndexItem:
+        def read_and_hash():
+            img_bytes = item.path.read_bytes()
+            return img_bytes, item.known_id or generate_uuid(img_bytes)
+
+        item.img_bytes, img_id = await asyncio.to_thread(read_and_hash)
+        item.mapped_image = MappedImage(id=img_id,
+                                        local=True,
+                                        categories=self._categories,
+                                        starred=self._starred,
+                                        format=item.path.suffix[1:],  # remove the dot
+                                        index_date=datetime.now())
+        return item
+
+    async def dedupe(self, items: list[IndexItem]) -> list[IndexItem]:
+        existing_ids = set(await services.db_context.validate_ids([str(t.mapped_image.id) for t in items]))
+        result, duplicates = [], []
+        for item in items:
+            img_id = item.mapped_image.id
+            if str(img_id) in existing_ids or img_id in self._in_flight_ids:
+                logger.warning("Image {} already exists in the database", item.path)
+                duplicates.append(item)
+                continue
+            self._in_flight_ids.add(img_id)
+            result.append(item)
+        self._checkpoint(duplicates, IndexFileState.DUPLICATE)
+        self._checkpoint(result, IndexFileState.HASHED)
+        return result
+
+    async def decode(self, item: IndexItem) -> IndexItem | None:
+        def open_image():
+            image, original_size = decode_image(item.img_bytes, services.index_service.decode_size())
+            return image, services.index_service.load_image(image, item.mapped_image, original_size)
+
+        try:
+            item.image, item.rgb_image = await asyncio.to_thread(open_image)
+        except (PIL.UnidentifiedImageError, OSError) as e:
+            logger.error("Error when processing image {}: {}", item.path, e)
+            self._checkpoint([item], IndexFileState.FAILED)
+            return None
+        return item
+
+    @staticmethod
+    async def embed(items: list[IndexItem]) -> list[IndexItem]:
+        await asyncio.to_thread(services.index_service.embed_image_batch,
+                                [t.rgb_image for t in items], [t.mapped_image for t in items])
+        return items
+
+    @staticmethod
+    async def ocr(items: list[IndexItem]) -> list[IndexItem]:
+        await asyncio.to_thread(services.index_service.ocr_image_batch,
+                                [t.rgb_image for t in items], [t.mapped_image for t in items])
+        for item in items:
+            item.rgb_image = None
+        return items
+
+    async def store(self, item: IndexItem) -> IndexItem:
+        await services.upload_service.store_image(item.mapped_image, item.image, item.img_bytes,
+                                                  self._thumbnail_mode)
+        item.release()
+        return item
+
+    async def upsert(self, items: list[IndexItem]) -> list[IndexItem]:
+        await services.db_context.insert_items([t.mapped_image for t in items])
+        self._checkpoint(items, IndexFileState.INDEXED)
+        logger.success("{} images indexed.", len(items))
+        return items
+
+    def build(self, on_item_done) -> AsyncPipeline:
+        settings = config.indexing
+        return (AsyncPipeline(settings.pipeline_queue_size, on_item_done)
+                .add_stage("hash", self.hash_file, workers=settings.io_workers)
+                .add_batch_stage("dedupe", self.dedupe, batch_size=settings.batch_size)
+                .add_stage("decode", self.decode, workers=settings.preprocess_workers)
+                .add_batch_stage("embed", self.embed, batch_size=settings.batch_size)
+                .add_batch_stage("ocr", self.ocr, batch_size=settings.batch_size, workers=settings.ocr_workers)
+                .add_stage("store", self.store, workers=settings.io_workers)
+                .add_batch_stage("upsert", self.upsert, batch_size=settings.upsert_batch_size))
+
+
+async def iterate_in_thread(iterator: Iterator, chunk_size=256) -> AsyncGenerator:
+    while chunk := await asyncio.to_thread(list, islice(iterator, chunk_size)):
+        for item in chunk:
+            yield item
+
+
+def stat_local_files(root: Path) -> Iterator[tuple[Path, os.stat_result]]:
+    for file_path in glob_local_files(root, '**/*'):
+        yield file_path, file_path.stat()
 
 
 @logger.catch()
 async def main(root_directory: list[Path], categories: list[str], starred: bool,
-               thumbnail_mode: UploadImageThumbnailMode):
+               thumbnail_mode: UploadImageThumbnailMode, manifest_path: Path | None = None, resume: bool = True):
     global services
     services = ServiceProvider()
     await services.onload()
-    files = []
-    for root in root_directory:
-        files.extend(list(glob_local_files(root, '**/*')))
+    manifest = IndexManifest(manifest_path) if manifest_path is not None else None
     with Progress() as progress:
         # A workaround for the loguru logger to work with rich progressbar
         logger.remove()
         logger.add(sys.stderr, colorize=True)
-        for idx, item in enumerate(progress.track(files, description="Indexing...")):
-            logger.info("[{} / {}] Indexing {}", idx + 1, len(files), str(item))
+        task = progress.add_task("Indexing...", total=None)
+        discovered = skipped = 0
+
+        async def discover():
+            nonlocal discovered, skipped
+            for root in root_directory:
+                async for file_path, stat in iterate_in_thread(stat_local_files(root)):
+                    discovered += 1
+                    progress.update(task, total=discovered)
+                    record = manifest.lookup(str(file_path), stat.st_size, stat.st_mtime_ns) \
+                        if manifest is not None and resume else None
+                    if record is not None and record.state.finished:
+                        skipped += 1
+                        progress.advance(task)
+                        continue
+                    yield IndexItem(file_path, stat.st_size, stat.st_mtime_ns,
+                                    known_id=record.image_id if record is not None else None)
 
-            await index_task(item, categories, starred, thumbnail_mode)
+        pipeline = IndexingPipeline(categories, starred, thumbnail_mode, manifest).build(
+            lambda count: progress.advance(task, count))
+        try:
+            await pipeline.run(discover())
+        finally:
+            if manifest is not None:
+                manifest.close()
 
-    logger.success("Indexing completed!")
+    logger.success("Indexing completed! {} files processed, {} files skipped since they have been processed before.",
+                   discovered - skipped, skipped)
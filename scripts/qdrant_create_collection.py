@@ -4,3 +4,4 @@ from app.Services.vector_db_context import VectorDbContext
 async def main():
     context = VectorDbContext()
     await context.initialize_collection()
+    await context.ensure_payload_indexes()
@@ -0,0 +1,19 @@
+import rich
+from loguru import logger
+
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config, QdrantMode
+
+
+async def main():
+    context = VectorDbContext()
+    if not await context.check_collection():
+        logger.error("Collection {} not found. Please initialize the database first.", context.collection_name)
+        return
+    if config.qdrant.mode != QdrantMode.SERVER:
+        logger.warning("Quantization, on-disk and HNSW settings only take effect with Qdrant server.")
+    await context.update_collection_config()
+    info = await context.get_collection_info()
+    rich.print(info.config.params.vectors)
+    logger.info("Collection status: {}. Qdrant is now re-indexing in background if the settings are changed.",
+                info.status.value)
@@ -113,10 +113,69 @@ def test_search_filters(test_client, img_ids):
     assert resp.json()['result'][0]['img']['id'] == img_ids['bsn'][0]
 
 
+def test_search_recall(test_client, img_ids):
+    resp = test_client.get('/search/text/hatsune+miku', params={'count': 3})
+    assert resp.status_code == 200
+    query_id = resp.json()['query_id']
+    first_page = [t['img']['id'] for t in resp.json()['result']]
+
+    resp = test_client.get(f'/search/recall/{query_id}', params={'count': 3})
+    assert resp.status_code == 200
+    assert resp.json()['query_id'] == query_id
+    assert [t['img']['id'] for t in resp.json()['result']] == first_page
+
+    resp = test_client.get(f'/search/recall/{query_id}', params={'count': 100, 'skip': 3})
+    assert resp.status_code == 200
+    rest_pages = [t['img']['id'] for t in resp.json()['result']]
+    assert sorted(first_page + rest_pages) == sorted(itertools.chain(*img_ids.values()))
+
+    resp = test_client.get(f'/search/recall/{uuid.uuid4()}')
+    assert resp.status_code == 404
+
+
+def test_search_random(test_client, img_ids):
+    resp = test_client.get('/search/random', params={'count': 100, 'seed': 42})
+    assert resp.status_code == 200
+    picked = [t['img']['id'] for t in resp.json()['result']]
+    assert sorted(picked) == sorted(itertools.chain(*img_ids.values()))
+
+    resp = test_client.get('/search/random', params={'count': 3, 'skip': 2, 'seed': 42})
+    assert resp.status_code == 200
+    assert [t['img']['id'] for t in resp.json()['result']] == picked[2:5]
+
+    resp = test_client.get('/search/random', params={'starred': True})
+    assert resp.status_code == 200
+    assert all(t['img']['starred'] for t in resp.json()['result'])
+
+
+def test_search_projection(test_client, img_ids):
+    resp = test_client.get('/search/random', params={'count': 100, 'fields': 'url,starred'})
+    assert resp.status_code == 200
+    assert len(resp.json()['result']) == len(list(itertools.chain(*img_ids.values())))
+    for item in resp.json()['result']:
+        assert item['img'].keys() == {'id', 'url', 'starred'}
+
+    resp = test_client.get('/search/text/hatsune+miku', params={'fields': 'categories'})
+    assert resp.status_code == 200
+    assert resp.json()['result'][0]['img'].keys() == {'id', 'categories'}
+
+    resp = test_client.get('/images/', params={'fields': 'index_date'})
+    assert resp.status_code == 200
+    assert all(t.keys() == {'id', 'index_date'} for t in resp.json()['images'])
+
+    resp = test_client.get('/search/random', params={'fields': 'image_vector'})
+    assert resp.status_code == 400
+
+
 def test_images_query_by_id(test_client, img_ids):
     resp = test_client.get(f"/images/id/{img_ids['bsn'][0]}")
     assert resp.status_code == 200
     assert resp.json()['img']['id'] == img_ids['bsn'][0]
+    assert {'url', 'index_date', 'ocr_text', 'categories', 'comments'} <= resp.json()['img'].keys()
+
+    resp = test_client.get(f"/images/id/{img_ids['bsn'][0]}", params={'fields': 'width, height'})
+    assert resp.status_code == 200
+    assert resp.json()['img'].keys() == {'id', 'width', 'height'}
 
 
 def test_images_query_not_exist(test_client, img_ids):
@@ -1,4 +1,5 @@
 import io
+import json
 import random
 
 import pytest
@@ -222,3 +223,52 @@ async def test_delete(test_client, ensure_local_dir_empty, wait_for_background_t
 
     resp = test_client.delete(f'/admin/delete/{image_id}')
     assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_upload_batch(test_client, ensure_local_dir_empty, wait_for_background_task):
+    with open(test_file_path, 'rb') as f:
+        img_bytes = f.read()
+    with open(test_file_2_path, 'rb') as f:
+        img_2_bytes = f.read()
+    with open(assets_path / 'test_images' / 'cg_1.png', 'rb') as f:
+        png_bytes = f.read()
+    files = [('image_files', ('bsn_0.jpg', img_bytes, 'image/jpeg')),
+             ('image_files', ('bsn_1.jpg', img_2_bytes, 'image/jpeg')),
+             ('image_files', ('bsn_0_copy.jpg', img_bytes, 'image/jpeg')),
+             ('image_files', ('bad_image.jpg', b'not an image', 'image/jpeg')),
+             ('image_files', ('bad_image.tga', b'not an image', 'image/tga')),
+             ('image_files', ('truncated.png', png_bytes[:len(png_bytes) // 2], 'image/png'))]
+    metadata = [{'local': True}, {'local': False, 'url': TEST_FAKE_URL, 'categories': ['batch']},
+                {'local': True}, {'local': True}, {'local': True}, {'local': True}]
+
+    # Mismatched metadata
+    resp = test_client.post('/admin/upload_batch', files=files, data={'metadata': json.dumps(metadata[:1])})
+    assert resp.status_code == 422
+    resp = test_client.post('/admin/upload_batch', files=files[:1], data={'metadata': json.dumps([{}])})
+    assert resp.status_code == 422
+
+    resp = test_client.post('/admin/upload_batch', files=files, data={'metadata': json.dumps(metadata)})
+    assert resp.status_code == 200
+    results = resp.json()['results']
+    assert [t['status'] for t in results] == ['queued', 'queued', 'duplicate', 'invalid_image', 'unsupported_format',
+                                              'invalid_image']
+    image_id, image_2_id = results[0]['image_id'], results[1]['image_id']
+    assert results[2]['image_id'] == image_id
+    assert results[3]['image_id'] is None
+
+    await wait_for_background_task(2)
+
+    resp = test_client.post('/admin/upload_batch', files=files[:2], data={'metadata': json.dumps(metadata[:2])})
+    assert resp.status_code == 200
+    assert [t['status'] for t in resp.json()['results']] == ['duplicate', 'duplicate']
+
+    query = test_client.get(f'/images/id/{image_2_id}')
+    assert query.status_code == 200
+    assert query.json()['img']['url'] == TEST_FAKE_URL
+    assert query.json()['img']['categories'] == ['batch']
+
+    # cleanup
+    for t in (image_id, image_2_id):
+        resp = test_client.delete(f'/admin/delete/{t}')
+        assert resp.status_code == 200
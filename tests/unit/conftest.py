@@ -0,0 +1,82 @@
+from fnmatch import fnmatch
+from pathlib import PurePosixPath
+
+import pytest
+import torch
+from transformers import CLIPConfig, CLIPModel, BertConfig, BertModel
+
+from app.Services.storage import BaseStorage
+from app.config import config
+
+
+class MemoryStorage(BaseStorage):
+    """
+    Storage keeping the files in a dict, to test the default implementations of BaseStorage.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.files: dict[str, bytes] = {}
+        self.file_metadata = None
+
+    async def is_exist(self, remote_file):
+        return str(remote_file) in self.files
+
+    async def size(self, remote_file):
+        return len(self.files[str(remote_file)])
+
+    async def url(self, remote_file):
+        return f"memory://{remote_file}"
+
+    async def presign_url(self, remote_file, expire_second=3600):
+        return f"memory://{remote_file}?expires={expire_second}"
+
+    async def fetch(self, remote_file):
+        return self.files[str(remote_file)]
+
+    async def upload(self, local_file, remote_file):
+        self.files[str(remote_file)] = local_file
+
+    async def copy(self, old_remote_file, new_remote_file):
+        self.files[str(new_remote_file)] = self.files[str(old_remote_file)]
+
+    async def move(self, old_remote_file, new_remote_file):
+        self.files[str(new_remote_file)] = self.files.pop(str(old_remote_file))
+
+    async def delete(self, remote_file):
+        del self.files[str(remote_file)]
+
+    async def list_files(self, path, pattern="*", batch_max_files=None, valid_extensions=None):
+        matched = [PurePosixPath(t) for t in self.files
+                   if t.startswith(f"{path}/") and fnmatch(t[len(str(path)) + 1:], pattern)
+                   and (valid_extensions is None or PurePosixPath(t).suffix in valid_extensions)]
+        batch_size = batch_max_files or max(len(matched), 1)
+        for i in range(0, len(matched), batch_size):
+            yield matched[i:i + batch_size]
+
+    async def update_metadata(self, local_file_metadata, remote_file_metadata):
+        self.file_metadata = (local_file_metadata, remote_file_metadata)
+
+
+@pytest.fixture
+def s3_config(monkeypatch):
+    monkeypatch.setattr(config.storage.s3, 'bucket', 'test-bucket')
+    monkeypatch.setattr(config.storage.s3, 'region', 'us-east-1')
+    monkeypatch.setattr(config.storage.s3, 'endpoint_url', 'http://127.0.0.1:9000')
+    monkeypatch.setattr(config.storage.s3, 'access_key_id', 'test-key')
+    monkeypatch.setattr(config.storage.s3, 'secret_access_key', 'test-secret')
+    monkeypatch.setattr(config.storage.s3, 'presign_cache_margin', 300)
+    return config.storage.s3
+
+
+@pytest.fixture(scope='session')
+def tiny_models_dir(tmp_path_factory):
+    # Tiny randomly initialized models, so the model loading can be tested without downloading models
+    path = tmp_path_factory.mktemp('models')
+    torch.manual_seed(0)
+    layers = {'hidden_size': 32, 'intermediate_size': 37, 'num_hidden_layers': 2, 'num_attention_heads': 4}
+    CLIPModel(CLIPConfig(text_config={**layers, 'vocab_size': 1000},
+                         vision_config={**layers, 'image_size': 64, 'patch_size': 16},
+                         projection_dim=16)).save_pretrained(path / 'clip')
+    BertModel(BertConfig(**layers, vocab_size=1000)).save_pretrained(path / 'bert')
+    return path
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from app.util.async_pipeline import AsyncPipeline
+
+
+class TestAsyncPipeline:
+    @pytest.mark.asyncio
+    async def test_stages(self):
+        done = []
+        batches = []
+        results = []
+
+        async def double(item):
+            await asyncio.sleep(0)
+            return item * 2
+
+        async def drop_odd_source(item):
+            return item if item % 4 == 0 else None
+
+        async def collect(items):
+            batches.append(len(items))
+            results.extend(items)
+            return items
+
+        async def source():
+            for i in range(20):
+                yield i
+
+        pipeline = (AsyncPipeline(queue_size=2, on_item_done=done.append)
+                    .add_stage("double", double, workers=3)
+                    .add_stage("filter", drop_odd_source, workers=2)
+                    .add_batch_stage("collect", collect, batch_size=4, batch_timeout=0.05))
+        await pipeline.run(source())
+
+        assert sorted(results) == [i * 2 for i in range(20) if i % 2 == 0]
+        assert max(batches) <= 4
+        assert sum(done) == 20
+
+    @pytest.mark.asyncio
+    async def test_errors_are_isolated(self):
+        done = []
+        results = []
+
+        async def fail_on_three(item):
+            if item == 3:
+                raise ValueError("bad item")
+            return item
+
+        async def fail_on_big_batch(items):
+            if 8 in items:
+                raise ValueError("bad batch")
+            results.extend(items)
+            return items
+
+        pipeline = (AsyncPipeline(on_item_done=done.append)
+                    .add_stage("fail", fail_on_three, workers=2)
+                    .add_batch_stage("batch", fail_on_big_batch, batch_size=5, batch_timeout=1))
+        await pipeline.run(range(10))
+
+        assert 3 not in results
+        assert 8 not in results
+        assert sum(done) == 10
+
+    @pytest.mark.asyncio
+    async def test_empty_pipeline(self):
+        with pytest.raises(ValueError):
+            await AsyncPipeline().run([])
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.util.batch_scheduler import BatchScheduler
+
+
+class TestBatchScheduler:
+    @staticmethod
+    def _make_scheduler(max_batch_size=4, max_wait_ms=50):
+        calls = []
+
+        def batch_fn(items):
+            calls.append(list(items))
+            return [t * 2 for t in items]
+
+        return BatchScheduler('test', batch_fn, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms), calls
+
+    @pytest.mark.asyncio
+    async def test_coalesce_requests(self):
+        scheduler, calls = self._make_scheduler()
+        results = await asyncio.gather(*[scheduler.submit(i) for i in range(10)])
+        await scheduler.stop()
+
+        assert results == [i * 2 for i in range(10)]
+        assert [len(t) for t in calls] == [4, 4, 2]
+        assert scheduler.stats.processed_batches == 3
+        assert scheduler.stats.processed_items == 10
+        assert scheduler.stats.max_batch_size == 4
+
+    @pytest.mark.asyncio
+    async def test_single_request_not_blocked(self):
+        scheduler, calls = self._make_scheduler(max_wait_ms=0)
+        assert await scheduler.submit(21) == 42
+        await scheduler.stop()
+        assert calls == [[21]]
+
+    @pytest.mark.asyncio
+    async def test_exception_propagation(self):
+        def batch_fn(items):
+            raise ValueError(f"bad batch of {len(items)}")
+
+        scheduler = BatchScheduler('test', batch_fn, max_batch_size=4, max_wait_ms=10)
+        results = await asyncio.gather(scheduler.submit(1), scheduler.submit(2), return_exceptions=True)
+        assert all(isinstance(t, ValueError) for t in results)
+        # The scheduler should keep working after a failed batch
+        scheduler._batch_fn = lambda items: items  # pylint: disable=protected-access
+        assert await scheduler.submit(3) == 3
+        await scheduler.stop()
+
+    @pytest.mark.asyncio
+    async def test_bad_item_isolated(self):
+        calls = []
+
+        def batch_fn(items):
+            calls.append(list(items))
+            if 'bad' in items:
+                raise ValueError("bad input")
+            return [t.upper() for t in items]
+
+        scheduler = BatchScheduler('test', batch_fn, max_batch_size=4, max_wait_ms=50)
+        results = await asyncio.gather(*[scheduler.submit(t) for t in ['a', 'bad', 'c']], return_exceptions=True)
+        await scheduler.stop()
+
+        assert results[0] == 'A' and results[2] == 'C'
+        assert isinstance(results[1], ValueError)
+        assert calls == [['a', 'bad', 'c'], ['a'], ['bad'], ['c']]
+
+    def test_invalid_batch_size(self):
+        with pytest.raises(ValueError):
+            BatchScheduler('test', lambda items: items, max_batch_size=0)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from transformers import CLIPImageProcessor
+
+from app.util.clip_preprocess import ClipImagePreprocessor
+from ..assets import assets_path
+
+
+class TestClipImagePreprocessor:
+    def setup_class(self):
+        # The default configuration is the same as the OpenAI CLIP models
+        self.image_processor = CLIPImageProcessor()
+        self.preprocessor = ClipImagePreprocessor(self.image_processor)
+
+    def test_parity(self):
+        rng = np.random.default_rng(0)
+        images = [Image.open(t).convert('RGB') for t in sorted((assets_path / 'test_images').glob('*.*'))
+                  if t.suffix != '.py']
+        # Landscape, portrait, odd size, exact size and upscaled images
+        images += [Image.fromarray((rng.random((h, w, 3)) * 255).astype(np.uint8))
+                   for w, h in [(640, 480), (480, 641), (223, 500), (224, 224), (100, 50)]]
+
+        expected = self.image_processor(images=images, return_tensors='pt')['pixel_values']
+        actual = self.preprocessor(images)
+        assert actual.shape == expected.shape == (len(images), 3, 224, 224)
+        assert actual.dtype == torch.float32
+        assert torch.allclose(actual, expected, atol=1e-5)
+
+    def test_center_crop_padding(self):
+        image_processor = CLIPImageProcessor(size={'shortest_edge': 224}, crop_size={'height': 256, 'width': 256})
+        image = Image.fromarray(np.full((300, 224, 3), 200, dtype=np.uint8))
+
+        expected = image_processor(images=[image], return_tensors='pt')['pixel_values']
+        assert torch.allclose(ClipImagePreprocessor(image_processor)([image]), expected, atol=1e-5)
+
+    def test_unsupported_config(self):
+        with pytest.raises(ValueError):
+            ClipImagePreprocessor(CLIPImageProcessor(size={'height': 224, 'width': 224}))
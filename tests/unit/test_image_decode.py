@@ -0,0 +1,44 @@
+from io import BytesIO
+
+from PIL import Image
+
+from app.util.image_decode import decode_image
+
+
+def encode(img: Image.Image, img_format: str, **kwargs) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, img_format, **kwargs)
+    return buffer.getvalue()
+
+
+class TestDecodeImage:
+    def test_jpeg_draft(self):
+        data = encode(Image.new('RGB', (4000, 3000), (200, 100, 50)), 'JPEG')
+
+        img, original_size = decode_image(data, 256)
+        assert original_size == (4000, 3000)
+        # Decoded at 1/8 scale, which is the smallest scale keeping the shorter side at least 256px
+        assert img.size == (500, 375)
+        assert img.getpixel((10, 10)) == decode_image(data)[0].getpixel((10, 10))
+        assert decode_image(data, 1024)[0].size == (2000, 1500)
+
+    def test_reduce_other_formats(self, tmp_path):
+        path = tmp_path / 'a.png'
+        Image.new('RGB', (1000, 600), (0, 255, 0)).save(path)
+
+        img, original_size = decode_image(path, 256)
+        assert original_size == (1000, 600)
+        assert img.size == (500, 300)
+
+    def test_keep_small_and_animated_images(self):
+        img, original_size = decode_image(encode(Image.new('RGB', (400, 300)), 'JPEG'), 256)
+        assert img.size == original_size == (400, 300)
+
+        frames = [Image.new('RGB', (1000, 1000), (i * 50, 0, 0)) for i in range(3)]
+        data = encode(frames[0], 'GIF', save_all=True, append_images=frames[1:])
+        img, original_size = decode_image(data, 256)
+        assert img.size == original_size == (1000, 1000)
+        assert img.n_frames == 3
+
+        img, _ = decode_image(encode(Image.new('RGB', (4000, 3000)), 'JPEG'))
+        assert img.size == (4000, 3000)
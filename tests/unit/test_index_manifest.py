@@ -0,0 +1,33 @@
+from uuid import uuid4
+
+from app.util.index_manifest import IndexManifest, IndexFileState, ManifestRecord
+
+
+class TestIndexManifest:
+    def test_lookup_matches_stat(self, tmp_path):
+        image_id = uuid4()
+        with IndexManifest(tmp_path / 'manifest.db') as manifest:
+            manifest.update([ManifestRecord('/a.jpg', 100, 12345, image_id, IndexFileState.INDEXED)])
+
+            record = manifest.lookup('/a.jpg', 100, 12345)
+            assert record.image_id == image_id
+            assert record.state.finished
+            # Modified files should be processed again
+            assert manifest.lookup('/a.jpg', 101, 12345) is None
+            assert manifest.lookup('/a.jpg', 100, 54321) is None
+            assert manifest.lookup('/b.jpg', 100, 12345) is None
+
+    def test_persist_and_overwrite(self, tmp_path):
+        path = tmp_path / 'manifest.db'
+        with IndexManifest(path) as manifest:
+            manifest.update([ManifestRecord('/a.jpg', 1, 1, uuid4(), IndexFileState.HASHED),
+                             ManifestRecord('/b.jpg', 1, 1, None, IndexFileState.FAILED)])
+            manifest.update([ManifestRecord('/a.jpg', 1, 1, uuid4(), IndexFileState.INDEXED)])
+
+        with IndexManifest(path) as manifest:
+            assert manifest.count() == 2
+            assert manifest.count(IndexFileState.INDEXED) == 1
+            assert manifest.count(IndexFileState.HASHED) == 0
+            record = manifest.lookup('/b.jpg', 1, 1)
+            assert record.image_id is None
+            assert not record.state.finished
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from app.Services.cache import CacheService
+from app.Services.inference_service import InferenceService, InferenceOverloadedError
+from app.config import config
+
+
+class FakeTransformersService:
+    def __init__(self):
+        self.release = threading.Event()
+        self.batches = []
+
+    def get_text_vector_batch(self, texts):
+        self.release.wait(5)
+        self.batches.append(list(texts))
+        return np.array([[len(t)] for t in texts], dtype=np.float32)
+
+    def get_text_vector(self, text):
+        return self.get_text_vector_batch([text])[0]
+
+    get_image_vector_batch = get_bert_vector_batch = get_text_vector_batch
+    get_image_vector = get_bert_vector = get_text_vector
+
+
+class TestInferenceService:
+    @pytest.fixture
+    def inference_config(self, monkeypatch):
+        monkeypatch.setattr(config.inference, 'max_pending_requests', 2)
+        monkeypatch.setattr(config.inference, 'max_batch_size', 8)
+        monkeypatch.setattr(config.inference, 'max_wait_ms', 20)
+        return config.inference
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize('batching', [True, False])
+    async def test_overload_rejected(self, inference_config, monkeypatch, batching):
+        monkeypatch.setattr(inference_config, 'batching_enable', batching)
+        transformers_service = FakeTransformersService()
+        service = InferenceService(transformers_service)
+
+        # Background requests are counted separately, so they never cause the search requests to be rejected
+        background_task = asyncio.create_task(service.get_bert_vector('dddd', background=True))
+        tasks = [asyncio.create_task(service.get_text_vector(t)) for t in ('a', 'bb')]
+        await asyncio.sleep(0)
+        assert service.pending_requests == 2
+        assert service.background_pending_requests == 1
+        with pytest.raises(InferenceOverloadedError):
+            await service.get_text_vector('ccc')
+        assert service.rejected_requests == 1
+        # Background requests should never be rejected
+        another_background_task = asyncio.create_task(service.get_image_vector('eeeee', background=True))
+        await asyncio.sleep(0)
+        assert service.background_pending_requests == 2
+
+        transformers_service.release.set()
+        results = await asyncio.gather(*tasks)
+        assert [t[0] for t in results] == [1, 2]
+        assert (await background_task)[0] == 4
+        assert (await another_background_task)[0] == 5
+        assert service.pending_requests == 0
+        assert service.background_pending_requests == 0
+        if batching:
+            assert sorted(transformers_service.batches) == [['a', 'bb'], ['dddd'], ['eeeee']]
+        await service.on_exit()
+
+    @pytest.mark.asyncio
+    async def test_text_cache(self, inference_config):
+        transformers_service = FakeTransformersService()
+        transformers_service.release.set()
+        cache_service = CacheService()
+        service = InferenceService(transformers_service, cache_service)
+
+        assert (await service.get_text_vector('Hatsune  Miku'))[0] == 13
+        assert (await service.get_text_vector(' hatsune miku'))[0] == 13
+        await service.get_bert_vector('hatsune miku')
+        assert service.text_cache_hits == 1
+        assert service.text_cache_misses == 2
+        assert len(transformers_service.batches) == 2
+        await service.on_exit()
@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+from app.Services.cache.local import LocalCache
+
+
+class TestLocalCache:
+    @pytest.mark.asyncio
+    async def test_get_set(self):
+        cache = LocalCache(max_size=10)
+        assert await cache.get_by_id('a') is None
+        await cache.set_by_id('a', 1)
+        assert await cache.get_by_id('a') == 1
+        await cache.delete_by_id('a')
+        assert await cache.get_by_id('a') is None
+
+    def test_lru_eviction(self):
+        cache = LocalCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1  # 'b' becomes the least recently used one
+        cache.set('c', 3)
+        assert len(cache) == 2
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_ttl(self):
+        cache = LocalCache(max_size=10, default_ttl=0.05)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=60)
+        time.sleep(0.1)
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+        assert len(cache) == 1
+
+    def test_invalid_size(self):
+        with pytest.raises(ValueError):
+            LocalCache(max_size=0)
@@ -0,0 +1,42 @@
+from datetime import datetime
+from uuid import uuid4
+
+import numpy as np
+
+from app.Models.mapped_image import MappedImage
+
+
+def _stored_image() -> MappedImage:
+    return MappedImage(id=uuid4(), url='/static/test.png', index_date=datetime.now(), width=1920, height=1080,
+                       aspect_ratio=1920 / 1080, ocr_text='Hello World', categories=['test'], format='png',
+                       local=True)
+
+
+class TestMappedImage:
+    def test_from_payload(self):
+        image = _stored_image()
+        payload = image.payload
+        vector = np.ones(768, dtype=np.float32)
+        actual = MappedImage.from_payload(str(image.id), payload, image_vector=vector)
+        assert actual.model_dump() == image.model_dump()
+        assert actual.payload == payload
+        assert actual.image_vector is vector
+        assert actual.model_dump_json(exclude_unset=True) == image.model_dump_json()
+
+    def test_from_payload_projection(self):
+        image = _stored_image()
+        payload = {k: v for k, v in image.payload.items() if k in ('index_date', 'url', 'width')}
+        actual = MappedImage.from_payload(str(image.id), payload, fields={'width'})
+        assert actual.model_dump(exclude_unset=True) == {'id': image.id, 'width': 1920}
+        # The fields not projected are still available for internal use
+        assert actual.url == image.url
+
+    def test_legacy_payload(self):
+        # Payloads stored by older versions may lack the fields added later
+        payload = {'url': '/static/test.png', 'index_date': datetime.now().isoformat()}
+        image = MappedImage.from_payload(str(uuid4()), payload)
+        assert 'comments' in image.model_dump(exclude_unset=True)
+        assert not image.starred
+        # The random key is backfilled by the database context, rather than generated differently on every read
+        assert image.random_key is None
+        assert 'random_key' not in image.payload
@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pytest
+import torch
+from transformers import CLIPModel, BertModel
+
+from app.Services.onnx_models import load_clip_onnx, load_bert_onnx, model_cache_dir, EXPORT_METADATA_FILE, \
+    ONNX_OPSET_VERSION
+
+pytest.importorskip('onnxruntime')
+
+
+def text_inputs(batch: int, length: int):
+    rng = np.random.default_rng(0)
+    attention_mask = np.ones((batch, length), dtype=np.int64)
+    attention_mask[0, length // 2:] = 0
+    return {'input_ids': rng.integers(0, 1000, (batch, length)), 'attention_mask': attention_mask,
+            'token_type_ids': np.zeros((batch, length), dtype=np.int64)}
+
+
+class TestOnnxModels:
+    def test_model_dir(self):
+        assert model_cache_dir('openai/clip-vit-large-patch14', 'cache').name == 'openai--clip-vit-large-patch14'
+        assert model_cache_dir('/opt/models/clip/', 'cache').name == 'opt--models--clip'
+
+    def test_clip_parity(self, tiny_models_dir, tmp_path):
+        image_model, text_model = load_clip_onnx(str(tiny_models_dir / 'clip'), tmp_path)
+        model = CLIPModel.from_pretrained(tiny_models_dir / 'clip').eval()
+
+        # Batch size and sequence length differ from the ones used in exporting
+        pixel_values = np.random.default_rng(0).standard_normal((3, 3, 64, 64), dtype=np.float32)
+        with torch.no_grad():
+            expected = model.get_image_features(pixel_values=torch.from_numpy(pixel_values)).numpy()
+        assert np.allclose(image_model(pixel_values=pixel_values), expected, atol=1e-4)
+
+        inputs = text_inputs(3, 11)
+        with torch.no_grad():
+            expected = model.get_text_features(input_ids=torch.from_numpy(inputs['input_ids']),
+                                               attention_mask=torch.from_numpy(inputs['attention_mask'])).numpy()
+        # Unused token_type_ids is ignored
+        assert np.allclose(text_model(**inputs), expected, atol=1e-4)
+
+    def test_bert_parity_and_cache(self, tiny_models_dir, tmp_path):
+        bert_model = load_bert_onnx(str(tiny_models_dir / 'bert'), tmp_path)
+        model = BertModel.from_pretrained(tiny_models_dir / 'bert').eval()
+
+        inputs = text_inputs(2, 7)
+        with torch.no_grad():
+            hidden = model(**{k: torch.from_numpy(v) for k, v in inputs.items()}).last_hidden_state.numpy()
+        mask = inputs['attention_mask'][..., None]
+        expected = (hidden * mask).sum(axis=1) / mask.sum(axis=1)
+        assert np.allclose(bert_model(**inputs), expected, atol=1e-4)
+
+        # The exported graph is reused on the next load
+        exported = model_cache_dir(str(tiny_models_dir / 'bert'), tmp_path) / 'bert.onnx'
+        mtime = exported.stat().st_mtime_ns
+        load_bert_onnx(str(tiny_models_dir / 'bert'), tmp_path)
+        assert exported.stat().st_mtime_ns == mtime
+
+    def test_quantize(self, tiny_models_dir, tmp_path):
+        bert_model = load_bert_onnx(str(tiny_models_dir / 'bert'), tmp_path)
+        quantized_model = load_bert_onnx(str(tiny_models_dir / 'bert'), tmp_path, quantize=True)
+        assert (model_cache_dir(str(tiny_models_dir / 'bert'), tmp_path) / 'bert.int8.onnx').exists()
+
+        inputs = text_inputs(2, 7)
+        expected, actual = bert_model(**inputs), quantized_model(**inputs)
+        assert not np.array_equal(actual, expected)
+        cosine = (actual * expected).sum(axis=-1) / np.linalg.norm(actual, axis=-1) / np.linalg.norm(expected, axis=-1)
+        assert cosine.min() > 0.99
+
+    def test_outdated_export(self, tiny_models_dir, tmp_path):
+        model_name = str(tiny_models_dir / 'bert')
+        load_bert_onnx(model_name, tmp_path, quantize=True)
+        model_dir = model_cache_dir(model_name, tmp_path)
+        metadata_path = model_dir / EXPORT_METADATA_FILE
+        metadata = json.loads(metadata_path.read_text(encoding='utf-8'))
+        assert metadata['opset'] == str(ONNX_OPSET_VERSION)
+
+        # Exported with another torch version
+        metadata_path.write_text(json.dumps({**metadata, 'torch': '0.0.0'}), encoding='utf-8')
+        for name in ('bert.onnx', 'bert.int8.onnx'):
+            (model_dir / name).write_bytes(b'stale')
+        load_bert_onnx(model_name, tmp_path, quantize=True)
+
+        assert json.loads(metadata_path.read_text(encoding='utf-8')) == metadata
+        for name in ('bert.onnx', 'bert.int8.onnx'):
+            assert (model_dir / name).read_bytes() != b'stale'
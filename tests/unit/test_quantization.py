@@ -0,0 +1,56 @@
+import warnings
+
+import pytest
+import torch
+from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+from transformers import BertModel
+
+from app.Services.quantization import load_quantized_model
+
+
+def pooled_output(model: BertModel) -> torch.Tensor:
+    torch.manual_seed(1)
+    with torch.no_grad():
+        return model(input_ids=torch.randint(0, 1000, (3, 9))).last_hidden_state.mean(dim=1)
+
+
+class TestLoadQuantizedModel:
+    def test_quantize(self, tiny_models_dir):
+        model = load_quantized_model(BertModel, str(tiny_models_dir / 'bert'), None)
+        assert isinstance(model.encoder.layer[0].attention.self.query, DynamicQuantizedLinear)
+
+        expected = pooled_output(BertModel.from_pretrained(tiny_models_dir / 'bert').eval())
+        actual = pooled_output(model)
+        assert not torch.equal(actual, expected)
+        assert torch.cosine_similarity(actual, expected).min() > 0.99
+
+    def test_cache(self, tiny_models_dir, tmp_path, monkeypatch):
+        model = load_quantized_model(BertModel, str(tiny_models_dir / 'bert'), tmp_path)
+        assert len(list(tmp_path.rglob('BertModel.int8.pt'))) == 1
+
+        def from_pretrained(*_args, **_kwargs):
+            pytest.fail("The cached quantized model should be used")
+
+        with monkeypatch.context() as m, warnings.catch_warnings():
+            m.setattr(BertModel, 'from_pretrained', from_pretrained)
+            warnings.simplefilter('error')
+            cached_model = load_quantized_model(BertModel, str(tiny_models_dir / 'bert'), tmp_path)
+        assert torch.equal(pooled_output(cached_model), pooled_output(model))
+
+        # The cache of another model revision is ignored
+        cache_path = next(tmp_path.rglob('BertModel.int8.pt'))
+        cached = torch.load(cache_path, weights_only=True)
+        cached['key']['revision'] = 'another-revision'
+        torch.save(cached, cache_path)
+        loaded = []
+        original_from_pretrained = BertModel.from_pretrained
+        with monkeypatch.context() as m:
+            m.setattr(BertModel, 'from_pretrained',
+                      lambda *args, **kwargs: loaded.append(args) or original_from_pretrained(*args, **kwargs))
+            load_quantized_model(BertModel, str(tiny_models_dir / 'bert'), tmp_path)
+        assert loaded
+
+        # A broken cache file is ignored and replaced
+        cache_path.write_bytes(b'broken')
+        load_quantized_model(BertModel, str(tiny_models_dir / 'bert'), tmp_path)
+        assert cache_path.stat().st_size > 1000
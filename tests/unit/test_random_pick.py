@@ -0,0 +1,60 @@
+from datetime import datetime
+from uuid import uuid4
+
+import numpy as np
+import pytest
+import pytest_asyncio
+
+from app.Models.mapped_image import MappedImage
+from app.Models.query_params import FilterParams
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config, QdrantMode
+
+
+@pytest_asyncio.fixture
+async def db_context(monkeypatch):
+    monkeypatch.setattr(config.qdrant, 'mode', QdrantMode.MEMORY)
+    context = VectorDbContext()
+    await context.initialize_collection()
+    rng = np.random.default_rng(0)
+    await context.insert_items([MappedImage(id=uuid4(), url=f'/{i}.jpg', index_date=datetime.now(),
+                                            starred=i % 2 == 0,
+                                            image_vector=rng.standard_normal(768, dtype=np.float32))
+                                for i in range(50)])
+    return context
+
+
+class TestRandomPick:
+    @pytest.mark.asyncio
+    async def test_seed(self, db_context):
+        results = await db_context.random_pick(10, seed=42)
+        assert len(results) == 10
+        assert [t.img.id for t in results] == [t.img.id for t in await db_context.random_pick(10, seed=42)]
+        assert [t.img.id for t in results] != [t.img.id for t in await db_context.random_pick(10, seed=43)]
+
+    @pytest.mark.asyncio
+    async def test_paging_covers_all(self, db_context):
+        picked = []
+        for skip in range(0, 50, 20):
+            picked += [t.img.id for t in await db_context.random_pick(20, skip, seed=1)]
+        # Wrapping around the key space returns every item exactly once
+        assert len(picked) == 50
+        assert len(set(picked)) == 50
+        assert not await db_context.random_pick(20, 50, seed=1)
+
+    @pytest.mark.asyncio
+    async def test_filter(self, db_context):
+        filter_param = FilterParams(starred=True)
+        results = await db_context.random_pick(50, filter_param=filter_param, seed=0)
+        assert len(results) == 25
+        assert all(t.img.starred for t in results)
+
+    @pytest.mark.asyncio
+    async def test_backfill(self, db_context):
+        points, _ = await db_context._client.scroll(db_context.collection_name, limit=20)  # pylint: disable=protected-access
+        await db_context._client.delete_payload(db_context.collection_name, keys=['random_key'],  # pylint: disable=protected-access
+                                                points=[t.id for t in points])
+        assert len(await db_context.random_pick(50, seed=0)) == 30
+        assert await db_context.backfill_random_keys(batch_size=8) == 20
+        assert len(await db_context.random_pick(50, seed=0)) == 50
+        assert await db_context.backfill_random_keys() == 0
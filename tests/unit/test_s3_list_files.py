@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.Services.storage import S3Storage
+
+KEYS = ['abc.png', 'abd.png', 'abc.txt', 'sub/abc.png', 'thumbnails/abc.webp']
+
+
+class ListingOperator:
+    """
+    Operator listing the keys with prefix, the same as S3 does. `list` doesn't descend into sub-directories.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def _iter(self, prefix: str, recursive: bool):
+        dirs = set()
+        for key in KEYS:
+            if not key.startswith(prefix):
+                continue
+            if not recursive and '/' in key[len(prefix):]:
+                dirs.add(key[:key.index('/', len(prefix)) + 1])
+                continue
+            yield SimpleNamespace(path=key)
+        for t in sorted(dirs):
+            yield SimpleNamespace(path=t)
+
+    async def list(self, path: str):
+        self.calls.append(('list', path))
+        return self._iter(path, False)
+
+    async def scan(self, path: str):
+        self.calls.append(('scan', path))
+        return self._iter(path, True)
+
+
+class TestS3ListFiles:
+    @pytest.fixture
+    def storage(self, s3_config):  # pylint: disable=unused-argument
+        storage = S3Storage()
+        storage.op = ListingOperator()
+        return storage
+
+    @staticmethod
+    async def list_files(storage: S3Storage, path: str, pattern: str) -> list[str]:
+        return [str(t) async for batch in storage.list_files(path, pattern) for t in batch]
+
+    @pytest.mark.asyncio
+    async def test_prefix_pushdown(self, storage):
+        assert await self.list_files(storage, '', 'abc.*') == ['abc.png']
+        assert await self.list_files(storage, '', 'ab?.png') == ['abc.png', 'abd.png']
+        assert await self.list_files(storage, '', 'thumbnails/*') == ['thumbnails/abc.webp']
+        assert storage.op.calls == [('list', 'abc.'), ('list', 'ab'), ('list', 'thumbnails/')]
+
+    @pytest.mark.asyncio
+    async def test_recursive_pattern(self, storage):
+        assert await self.list_files(storage, '', '**/abc.png') == ['abc.png', 'sub/abc.png']
+        assert await self.list_files(storage, '', '*/abc.png') == ['sub/abc.png']
+        assert await self.list_files(storage, '.', '*.*') == ['abc.png', 'abd.png']
+        assert storage.op.calls == [('scan', ''), ('scan', ''), ('list', '')]
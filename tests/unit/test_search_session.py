@@ -0,0 +1,106 @@
+import uuid
+
+import pytest
+
+from app.Models.db_queries import DbQuery, DbQueryBasis, DbQueryCriteriaId
+from app.Models.mapped_image import MappedImage
+from app.Models.search_result import SearchResult
+from app.Services.cache import CacheService
+from app.Services.search_session_service import SearchSessionService
+from app.config import config, CacheMode
+
+
+class FakeDbContext:
+    def __init__(self, total: int):
+        self.ranked_ids = [(f'id_{i}', 1 - i / total) for i in range(total)]
+        self.id_queries = []
+        self.offset_queries = []
+        self.deleted = set()
+
+    async def query_search_ids(self, query, top_k, filter_param):  # pylint: disable=unused-argument
+        self.id_queries.append(top_k)
+        return self.ranked_ids[:top_k]
+
+    async def query_search(self, query, top_k, skip, filter_param, fields):  # pylint: disable=unused-argument
+        self.offset_queries.append((top_k, skip))
+        return [SearchResult.model_construct(img=MappedImage.model_construct(id=image_id), score=score)
+                for image_id, score in self.ranked_ids[skip:skip + top_k]]
+
+    async def retrieve_search_results(self, ranked_ids, fields):  # pylint: disable=unused-argument
+        return [SearchResult.model_construct(img=MappedImage.model_construct(id=image_id), score=score)
+                for image_id, score in ranked_ids if image_id not in self.deleted]
+
+
+@pytest.fixture
+def session_config(monkeypatch):
+    monkeypatch.setattr(config.cache, 'method', CacheMode.LOCAL)
+    monkeypatch.setattr(config.search, 'session_enable', True)
+    monkeypatch.setattr(config.search, 'session_window', 10)
+    monkeypatch.setattr(config.search, 'session_max_size', 50)
+    return config.search
+
+
+def page_ids(results: list[SearchResult]) -> list[str]:
+    return [t.img.id for t in results]
+
+
+class TestSearchSessionService:
+    query = DbQuery(criteria={'vision': DbQueryBasis(positive=[DbQueryCriteriaId(id='a')])})
+
+    @pytest.mark.asyncio
+    async def test_paging(self, session_config):  # pylint: disable=unused-argument
+        db_context = FakeDbContext(100)
+        service = SearchSessionService(db_context, CacheService())
+        query_id = uuid.uuid4()
+
+        assert page_ids(await service.search(query_id, self.query, None, 0, 5)) == [f'id_{i}' for i in range(5)]
+        # The first page is searched with a single query
+        assert db_context.offset_queries == [(5, 0)]
+        assert not db_context.id_queries
+        assert page_ids(await service.recall(query_id, 0, 5)) == [f'id_{i}' for i in range(5)]
+        assert not db_context.id_queries
+        assert page_ids(await service.recall(query_id, 5, 5)) == [f'id_{i}' for i in range(5, 10)]
+        assert db_context.id_queries == [10]
+        # Served from the session
+        assert page_ids(await service.recall(query_id, 5, 5)) == [f'id_{i}' for i in range(5, 10)]
+        assert db_context.id_queries == [10]
+        # The window grows when the page goes beyond it
+        assert page_ids(await service.recall(query_id, 10, 5)) == [f'id_{i}' for i in range(10, 15)]
+        assert db_context.id_queries == [10, 20]
+        # Too deep for the session
+        assert page_ids(await service.recall(query_id, 50, 5)) == [f'id_{i}' for i in range(50, 55)]
+        assert db_context.offset_queries == [(5, 0), (5, 50)]
+
+        assert await service.recall(uuid.uuid4(), 0, 5) is None
+
+    @pytest.mark.asyncio
+    async def test_exhausted_and_deleted(self, session_config):  # pylint: disable=unused-argument
+        db_context = FakeDbContext(7)
+        service = SearchSessionService(db_context, CacheService())
+        query_id = uuid.uuid4()
+
+        assert len(await service.search(query_id, self.query, None, 0, 5)) == 5
+        db_context.deleted.add('id_6')
+        assert page_ids(await service.recall(query_id, 5, 5)) == ['id_5']
+        assert page_ids(await service.recall(query_id, 10, 5)) == []
+        assert db_context.id_queries == [10]
+
+    def test_disabled(self, session_config, monkeypatch):  # pylint: disable=unused-argument
+        monkeypatch.setattr(config.search, 'session_enable', False)
+        assert not SearchSessionService(FakeDbContext(1), CacheService()).enabled
+
+    @pytest.mark.asyncio
+    async def test_dedicated_store(self, session_config, monkeypatch):  # pylint: disable=unused-argument
+        monkeypatch.setattr(config.search, 'session_max_count', 2)
+        cache_service = CacheService()
+        service = SearchSessionService(FakeDbContext(10), cache_service)
+        query_ids = [uuid.uuid4() for _ in range(3)]
+        for query_id in query_ids:
+            await service.search(query_id, self.query, None, 0, 5)
+        # The sessions are bounded on their own, without writing into the cache service
+        assert len(cache_service.active_cache) == 0
+        assert await service.recall(query_ids[0], 0, 5) is None
+        assert len(await service.recall(query_ids[2], 0, 5)) == 5
+
+        monkeypatch.setattr(config.cache, 'method', CacheMode.DISABLED)
+        assert SearchSessionService(FakeDbContext(1), CacheService()).enabled
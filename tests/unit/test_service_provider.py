@@ -0,0 +1,31 @@
+import pytest
+
+from app.Services.lifespan_service import LifespanService
+from app.Services.provider import ServiceProvider
+
+
+class FakeService(LifespanService):
+    def __init__(self, name: str, exited: list[str]):
+        self.name = name
+        self.exited = exited
+
+    async def on_exit(self):
+        self.exited.append(self.name)
+
+
+class TestServiceProvider:
+    @pytest.mark.asyncio
+    async def test_exit_order(self):
+        exited = []
+        provider = ServiceProvider.__new__(ServiceProvider)
+        for service_names in ServiceProvider.EXIT_ORDER:
+            for name in service_names:
+                setattr(provider, name, FakeService(name, exited))
+        provider.extra_service = FakeService('extra_service', exited)
+
+        await provider.onexit()
+        groups = [*ServiceProvider.EXIT_ORDER, ('extra_service',)]
+        group_index = {name: i for i, group in enumerate(groups) for name in group}
+        assert sorted(exited) == sorted(group_index)
+        # A service is never stopped before the services depending on it
+        assert [group_index[t] for t in exited] == sorted(group_index[t] for t in exited)
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.Services.cache import CacheService
+from app.Services.storage import S3Storage
+from .conftest import MemoryStorage
+
+
+class SlowPresignStorage(MemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.running = 0
+        self.max_running = 0
+
+    async def presign_url(self, remote_file, expire_second: int = 3600) -> str:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return f"signed/{remote_file}?expires={expire_second}"
+
+
+class TestPresignUrls:
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency(self):
+        storage = SlowPresignStorage()
+        files = [f"{i}.png" for i in range(20)]
+        urls = await storage.presign_urls(files, expire_second=60, max_concurrency=4)
+
+        assert urls == [f"signed/{i}.png?expires=60" for i in range(20)]
+        assert storage.max_running == 4
+
+
+class TestS3PresignCache:
+    @staticmethod
+    def _count_presign(storage: S3Storage) -> list[str]:
+        calls = []
+        op = storage.op
+
+        class CountingOperator:
+            @staticmethod
+            async def presign_read(path, expire_second):
+                calls.append(path)
+                return await op.presign_read(path, expire_second)
+
+        storage.op = CountingOperator()
+        return calls
+
+    @pytest.mark.asyncio
+    async def test_reuse_presigned_url(self, s3_config):
+        storage = S3Storage()
+        calls = self._count_presign(storage)
+
+        url = await storage.presign_url('thumbnails/a.webp')
+        assert url.startswith('http://127.0.0.1:9000/test-bucket/')
+        assert 'X-Amz-Signature=' in url
+        assert await storage.presign_url('thumbnails/a.webp') == url
+        assert await storage.presign_urls(['thumbnails/a.webp', 'b.png']) == [url, await storage.presign_url('b.png')]
+        # Different expiry should not share the cached URL
+        await storage.presign_url('thumbnails/a.webp', expire_second=7200)
+        # URL expiring within the safety margin should never be cached
+        await storage.presign_url('thumbnails/a.webp', expire_second=60)
+        await storage.presign_url('thumbnails/a.webp', expire_second=60)
+        assert calls == ['thumbnails/a.webp', 'b.png', 'thumbnails/a.webp', 'thumbnails/a.webp', 'thumbnails/a.webp']
+
+    @pytest.mark.asyncio
+    async def test_cache_disabled(self, s3_config, monkeypatch):
+        monkeypatch.setattr(s3_config, 'presign_cache_size', 0)
+        storage = S3Storage()
+        calls = self._count_presign(storage)
+        await storage.presign_url('a.png')
+        await storage.presign_url('a.png')
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_shared_cache(self, s3_config, monkeypatch):
+        monkeypatch.setattr(s3_config, 'presign_cache_shared', True)
+        cache_service = CacheService()
+        storage = S3Storage(cache_service)
+        await storage.presign_url('a.png')
+        assert len(cache_service.active_cache) == 1
+
+    @pytest.mark.asyncio
+    async def test_local_presign(self, s3_config, monkeypatch):
+        monkeypatch.setattr(s3_config, 'local_presign', True)
+        monkeypatch.setattr(s3_config, 'user_endpoint_url', 'https://cdn.example.com/')
+        storage = S3Storage()
+        calls = self._count_presign(storage)
+
+        urls = await storage.presign_urls(['thumbnails/a.webp', 'b.png'])
+        assert not calls
+        assert urls[0].startswith('https://cdn.example.com/test-bucket/static/thumbnails/a.webp?X-Amz-Algorithm=')
+        assert urls[1].startswith('https://cdn.example.com/test-bucket/static/b.png?X-Amz-Algorithm=')
+        assert await storage.presign_url('b.png') == urls[1]
+
+    @pytest.mark.asyncio
+    async def test_local_presign_without_region(self, s3_config, monkeypatch):
+        monkeypatch.setattr(s3_config, 'local_presign', True)
+        monkeypatch.setattr(s3_config, 'region', None)
+        monkeypatch.setenv('AWS_REGION', 'us-west-2')
+        storage = S3Storage()
+        calls = self._count_presign(storage)
+        url = await storage.presign_url('a.png')
+        assert calls == ['a.png']
+        assert '%2Fus-west-2%2Fs3%2F' in url
@@ -0,0 +1,116 @@
+# pylint: disable=import-error,no-name-in-module
+import pytest
+from opendal import AsyncOperator
+
+from app.Services.storage import LocalStorage, S3Storage
+from app.Services.storage.exception import RemoteFileNotFoundError
+from app.Services.storage.s3_compatible_storage import S3_UPLOAD_PART_SIZE
+from app.config import config
+from .conftest import MemoryStorage
+
+
+async def iter_chunks(chunks: list[bytes], fail: bool = False):
+    for chunk in chunks:
+        yield chunk
+    if fail:
+        raise RuntimeError("Stream interrupted")
+
+
+async def collect(stream) -> list[bytes]:
+    return [t async for t in stream]
+
+
+class TestDefaultStream:
+    @pytest.mark.asyncio
+    async def test_roundtrip(self):
+        storage = MemoryStorage()
+        await storage.upload_stream(iter_chunks([b'a' * 10, b'b' * 15]), 'a.bin')
+
+        assert await storage.fetch('a.bin') == b'a' * 10 + b'b' * 15
+        assert await collect(storage.fetch_stream('a.bin', chunk_size=10)) == [b'a' * 10, b'b' * 10, b'b' * 5]
+
+
+class TestLocalStorageStream:
+    @pytest.fixture
+    def storage(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(config.storage.local, 'path', str(tmp_path))
+        return LocalStorage()
+
+    @pytest.mark.asyncio
+    async def test_roundtrip(self, storage):
+        await storage.upload_stream(iter_chunks([b'a' * 10, b'b' * 10, b'c' * 5]), 'a.bin')
+
+        assert await storage.fetch('a.bin') == b'a' * 10 + b'b' * 10 + b'c' * 5
+        assert await collect(storage.fetch_stream('a.bin', chunk_size=10)) == [b'a' * 10, b'b' * 10, b'c' * 5]
+
+    @pytest.mark.asyncio
+    async def test_interrupted_upload(self, storage, tmp_path):
+        with pytest.raises(RuntimeError):
+            await storage.upload_stream(iter_chunks([b'content'], fail=True), 'a.bin')
+        assert not list(tmp_path.iterdir())
+
+    @pytest.mark.asyncio
+    async def test_fetch_not_found(self, storage):
+        with pytest.raises(RemoteFileNotFoundError):
+            await collect(storage.fetch_stream('missing.bin'))
+
+
+class TestS3StorageStream:
+    @pytest.fixture
+    def storage(self, tmp_path, s3_config):  # pylint: disable=unused-argument
+        storage = S3Storage()
+        # Use a filesystem backed operator, and record the size of each part written
+        op = AsyncOperator('fs', root=str(tmp_path))
+        storage.parts = []
+
+        class RecordingOperator:
+            def __getattr__(self, item):
+                return getattr(op, item)
+
+            @staticmethod
+            async def open(path, mode):
+                file = await op.open(path, mode)
+                if mode != 'wb':
+                    return file
+
+                class RecordingFile:
+                    @staticmethod
+                    async def write(bs):
+                        storage.parts.append(len(bs))
+                        return await file.write(bs)
+
+                    @staticmethod
+                    async def close():
+                        await file.close()
+
+                return RecordingFile()
+
+        storage.op = RecordingOperator()
+        return storage
+
+    @pytest.mark.asyncio
+    async def test_parts_coalesced(self, storage):
+        chunk = b'x' * (S3_UPLOAD_PART_SIZE // 4 + 1)
+        await storage.upload_stream(iter_chunks([chunk] * 6), 'a.bin')
+
+        # Small chunks should be coalesced, so every part except the last one is large enough for S3
+        assert storage.parts[:-1] == [len(chunk) * 4]
+        assert sum(storage.parts) == len(chunk) * 6
+        assert await storage.size('a.bin') == len(chunk) * 6
+        fetched = await collect(storage.fetch_stream('a.bin', chunk_size=S3_UPLOAD_PART_SIZE))
+        assert b''.join(fetched) == chunk * 6
+        assert len(fetched) > 1
+
+    @pytest.mark.asyncio
+    async def test_upload_local_file(self, storage, tmp_path):
+        local_file = tmp_path / 'local.bin'
+        local_file.write_bytes(b'y' * (S3_UPLOAD_PART_SIZE + 1))
+        await storage.upload(local_file, 'b.bin')
+
+        assert storage.parts == [S3_UPLOAD_PART_SIZE, 1]
+        assert b''.join(await collect(storage.fetch_stream('b.bin'))) == b'y' * (S3_UPLOAD_PART_SIZE + 1)
+
+    @pytest.mark.asyncio
+    async def test_fetch_not_found(self, storage):
+        with pytest.raises(RemoteFileNotFoundError):
+            await collect(storage.fetch_stream('missing.bin'))
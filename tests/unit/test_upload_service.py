@@ -0,0 +1,103 @@
+import asyncio
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+
+from app.Models.api_models.admin_query_params import UploadImageThumbnailMode
+from app.Models.mapped_image import MappedImage
+from app.Services.upload_service import UploadService
+from app.Services.upload_spool import UploadSpoolEntry
+from app.config import config
+
+
+class FakeDbContext:
+    def __init__(self):
+        self.fail = True
+        self.inserted = []
+
+    async def insert_items(self, items, wait=True):  # pylint: disable=unused-argument
+        if self.fail:
+            raise ConnectionError("Database is down")
+        self.inserted += items
+
+
+@pytest_asyncio.fixture
+async def upload_service(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'admin_index_spool_dir', str(tmp_path))
+    monkeypatch.setattr(config.indexing, 'upsert_flush_interval', 3600)
+    service = UploadService(None, FakeDbContext(), None)
+    yield service
+    for task in [*service._upload_worker_tasks, service._flush_task]:  # pylint: disable=protected-access
+        task.cancel()
+    await asyncio.gather(*service._upload_worker_tasks, service._flush_task,  # pylint: disable=protected-access
+                         return_exceptions=True)
+
+
+class TestUploadService:
+    @pytest.mark.asyncio
+    async def test_failed_upsert_kept(self, upload_service):
+        # pylint: disable=protected-access
+        image = MappedImage(id=uuid4(), local=True, format='png', index_date=datetime.now())
+        await upload_service._spool.put(UploadSpoolEntry(mapped_image=image, skip_ocr=True,
+                                                         thumbnail_mode=UploadImageThumbnailMode.NEVER), b'content')
+        upload_service.uploading_ids.add(image.id)
+        upload_service._upsert_buffer.append(image)
+
+        assert not await upload_service.flush_upserts()
+        assert image.id in upload_service.uploading_ids
+        assert [t.mapped_image.id for t in upload_service._spool.load_pending()] == [image.id]
+        # Not retried until the backoff expires
+        upload_service._db_context.fail = False
+        assert not await upload_service.flush_upserts()
+        assert not upload_service._db_context.inserted
+
+        assert await upload_service.flush_upserts(force=True)
+        assert upload_service._db_context.inserted == [image]
+        assert image.id not in upload_service.uploading_ids
+        assert not upload_service._spool.load_pending()
+
+    def test_spooled_queue_depth(self, upload_service):
+        assert upload_service._queue.maxsize == config.admin_index_spool_queue_max_length  # pylint: disable=protected-access
+
+    @pytest.mark.asyncio
+    async def test_cancelled_upsert_kept(self, upload_service):
+        # pylint: disable=protected-access
+        image = MappedImage(id=uuid4(), local=True, format='png', index_date=datetime.now())
+        inserting = asyncio.Event()
+
+        async def insert_items(items, wait=True):  # pylint: disable=unused-argument
+            inserting.set()
+            await asyncio.Event().wait()
+
+        upload_service._db_context.insert_items = insert_items
+        upload_service._upsert_buffer.append(image)
+        task = asyncio.create_task(upload_service.flush_upserts(force=True))
+        await inserting.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert upload_service._upsert_buffer == [image]
+
+    @pytest.mark.asyncio
+    async def test_spool_error_after_insert(self, upload_service, monkeypatch):
+        # pylint: disable=protected-access
+        async def upload_task(*_):
+            pass
+
+        async def remove(_):
+            raise OSError("Disk is read-only")
+
+        upload_service._db_context.fail = False
+        monkeypatch.setattr(upload_service, '_upload_task', upload_task)
+        image = MappedImage(id=uuid4(), local=True, format='png', index_date=datetime.now())
+        await upload_service.queue_upload_image(image, b'content', True, UploadImageThumbnailMode.NEVER)
+        monkeypatch.setattr(upload_service._spool, 'remove', remove)
+        await upload_service._queue.join()
+
+        assert upload_service._db_context.inserted == [image]
+        assert image.id not in upload_service.uploading_ids
+        assert sum(t.processed for t in upload_service.get_worker_stats()) == 1
+        assert sum(t.failed for t in upload_service.get_worker_stats()) == 0
+        assert not any(t.done() for t in upload_service._upload_worker_tasks)
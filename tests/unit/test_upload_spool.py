@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from app.Models.api_models.admin_query_params import UploadImageThumbnailMode
+from app.Models.mapped_image import MappedImage
+from app.Services.upload_spool import UploadSpool, UploadSpoolEntry
+
+
+def make_entry(index_date: datetime) -> UploadSpoolEntry:
+    return UploadSpoolEntry(mapped_image=MappedImage(id=uuid4(), local=True, format='png', categories=['test'],
+                                                     index_date=index_date),
+                            skip_ocr=True,
+                            thumbnail_mode=UploadImageThumbnailMode.ALWAYS)
+
+
+class TestUploadSpool:
+    @pytest.mark.asyncio
+    async def test_put_and_replay(self, tmp_path):
+        spool = UploadSpool(tmp_path)
+        now = datetime.now()
+        entry_late, entry_early = make_entry(now), make_entry(now - timedelta(seconds=1))
+        await spool.put(entry_late, b'late')
+        await spool.put(entry_early, b'early')
+
+        # Simulate a restart
+        pending = UploadSpool(tmp_path).load_pending()
+        assert [t.mapped_image.id for t in pending] == [entry_early.mapped_image.id, entry_late.mapped_image.id]
+        assert pending[0].mapped_image.categories == ['test']
+        assert pending[0].thumbnail_mode == UploadImageThumbnailMode.ALWAYS
+        assert spool.content_path(entry_late.mapped_image.id).read_bytes() == b'late'
+
+        await spool.remove([entry_late.mapped_image.id])
+        assert [t.mapped_image.id for t in spool.load_pending()] == [entry_early.mapped_image.id]
+
+    @pytest.mark.asyncio
+    async def test_incomplete_entries_removed(self, tmp_path):
+        spool = UploadSpool(tmp_path)
+        entry = make_entry(datetime.now())
+        await spool.put(entry, b'content')
+        (tmp_path / f"{uuid4()}.bin").write_bytes(b'orphan content')
+        (tmp_path / "broken.json").write_text("{", encoding='utf-8')
+
+        assert [t.mapped_image.id for t in spool.load_pending()] == [entry.mapped_image.id]
+        assert sorted(t.name for t in tmp_path.iterdir()) == sorted([f"{entry.mapped_image.id}.bin",
+                                                                     f"{entry.mapped_image.id}.json"])
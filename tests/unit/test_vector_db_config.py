@@ -0,0 +1,100 @@
+import pytest
+from qdrant_client.http import models
+
+from app.Services.vector_db_context import VectorDbContext
+from app.config import config, QdrantMode, QdrantQuantization
+
+
+@pytest.fixture
+def qdrant_config(monkeypatch):
+    monkeypatch.setattr(config.qdrant, 'mode', QdrantMode.MEMORY)
+    monkeypatch.setattr(config.qdrant, 'quantization', QdrantQuantization.SCALAR)
+    monkeypatch.setattr(config.qdrant, 'on_disk', True)
+    monkeypatch.setattr(config.qdrant, 'hnsw_m', 32)
+    monkeypatch.setattr(config.qdrant, 'search_oversampling', 2.0)
+    return config.qdrant
+
+
+class TestVectorDbConfig:
+    def test_quantization_config(self):
+        assert VectorDbContext.get_quantization_config(QdrantQuantization.NONE) is None
+        assert VectorDbContext.get_quantization_config(QdrantQuantization.SCALAR).scalar.type == models.ScalarType.INT8
+        assert isinstance(VectorDbContext.get_quantization_config(QdrantQuantization.BINARY), models.BinaryQuantization)
+
+    def test_search_params(self, qdrant_config, monkeypatch):
+        params = VectorDbContext._get_search_params()  # pylint: disable=protected-access
+        assert params.hnsw_ef is None
+        assert params.quantization.oversampling == 2.0
+        assert params.quantization.rescore is None
+
+        monkeypatch.setattr(qdrant_config, 'search_oversampling', None)
+        assert VectorDbContext._get_search_params() is None  # pylint: disable=protected-access
+
+    @pytest.mark.asyncio
+    async def test_initialize_collection(self, qdrant_config):
+        context = VectorDbContext()
+        await context.initialize_collection()
+        vectors = (await context.get_collection_info()).config.params.vectors
+        for name in (VectorDbContext.IMG_VECTOR, VectorDbContext.TEXT_VECTOR):
+            assert vectors[name].on_disk
+            assert vectors[name].hnsw_config.m == 32
+            assert isinstance(vectors[name].quantization_config, models.ScalarQuantization)
+        await context.update_collection_config()
+
+
+class FakePayloadIndexClient:
+    def __init__(self, payload_schema: dict[str, models.PayloadIndexInfo]):
+        self.payload_schema = payload_schema
+        self.created = {}
+        self.deleted = []
+
+    async def get_collection(self, collection_name):  # pylint: disable=unused-argument
+        return models.CollectionInfo.model_construct(payload_schema=self.payload_schema)
+
+    async def create_payload_index(self, collection_name, field_name, field_schema, wait):  # pylint: disable=unused-argument
+        self.created[field_name] = field_schema
+
+    async def delete_payload_index(self, collection_name, field_name, wait):  # pylint: disable=unused-argument
+        self.deleted.append(field_name)
+
+
+class TestPayloadIndexes:
+    @pytest.fixture
+    def context(self, monkeypatch):
+        monkeypatch.setattr(config.qdrant, 'mode', QdrantMode.MEMORY)
+        context = VectorDbContext()
+        monkeypatch.setattr(config.qdrant, 'mode', QdrantMode.SERVER)
+        monkeypatch.setattr(config.qdrant, 'ocr_text_index_tokenizer', 'multilingual')
+        return context
+
+    @pytest.mark.asyncio
+    async def test_create_missing(self, context):
+        context._client = client = FakePayloadIndexClient({  # pylint: disable=protected-access
+            'starred': models.PayloadIndexInfo(data_type=models.PayloadSchemaType.BOOL, points=10)})
+        await context.ensure_payload_indexes()
+        assert set(client.created) == {'width', 'height', 'aspect_ratio', 'categories', 'random_key',
+                                      'ocr_text_lower'}
+        assert client.created['ocr_text_lower'].tokenizer == models.TokenizerType.MULTILINGUAL
+        assert not client.deleted
+
+    @pytest.mark.asyncio
+    async def test_recreate_outdated(self, context, monkeypatch):
+        schema = {field: models.PayloadIndexInfo(data_type=getattr(index, 'type', index), points=10,
+                                                 params=index if isinstance(index, models.TextIndexParams) else None)
+                  for field, index in VectorDbContext.get_payload_indexes().items()}
+        # Qdrant returns the params with default values filled in
+        schema['ocr_text_lower'].params = schema['ocr_text_lower'].params.model_copy(update={'min_token_len': 2})
+        context._client = client = FakePayloadIndexClient(schema)  # pylint: disable=protected-access
+        await context.ensure_payload_indexes()
+        assert not client.created and not client.deleted
+
+        schema['width'] = models.PayloadIndexInfo(data_type=models.PayloadSchemaType.KEYWORD, points=10)
+        monkeypatch.setattr(config.qdrant, 'ocr_text_index_tokenizer', 'word')
+        await context.ensure_payload_indexes()
+        assert client.deleted == ['width', 'ocr_text_lower']
+        assert client.created['width'] == models.PayloadSchemaType.INTEGER
+        assert client.created['ocr_text_lower'].tokenizer == models.TokenizerType.WORD
+
+    def test_disable_text_index(self, monkeypatch):
+        monkeypatch.setattr(config.qdrant, 'ocr_text_index_tokenizer', '')
+        assert 'ocr_text_lower' not in VectorDbContext.get_payload_indexes()